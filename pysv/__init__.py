@@ -1,5 +1,5 @@
 from .function import sv, is_run_function_set, set_run_function, make_call, import_
-from .types import DataType, Reference
+from .types import DataType, Reference, Batch, Async, Table, Runtime, Bits, Logic, Struct
 from .codegen import generate_cxx_binding, generate_sv_binding
 from .compile import compile_lib
 from .frame import add_exclude_module_name, clear_exclude_module_name
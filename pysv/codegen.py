@@ -1,15 +1,19 @@
 from typing import Union, List
-from .function import Function, DPIFunctionCall, sv, DPIImportFunction
-from .types import DataType
+from .function import (Function, DPIFunctionCall, sv, DPIImportFunction, DPIVariantFunction, DPIBatchFunction,
+                       DPIAsyncFunction, DPICacheFunction)
+from .types import DataType, Batch, Table, Runtime, BitVector, Struct
 from .model import check_class_ctor, get_dpi_functions, inject_destructor, check_class_method
 from .util import (should_add_class, should_add_sys_path, make_dirs, make_unique_func_defs, should_import, is_conda,
-                   is_class)
+                   is_class, check_shm_machine)
+import itertools
+import math
+import operator
 import os
+import struct
 import sys
 
 __INDENTATION = "  "
 __GLOBAL_STRING_VAR_NAME = "string_result_value"
-__PY_OBJ_MAP_NAME = "py_obj_map"
 __SYS_PATH_NAME = "SYS_PATH"
 __SYS_PATH_FUNC_NAME = "check_sys_path"
 __CHECK_INTERPRETER = "check_interpreter"
@@ -18,7 +22,24 @@ __IMPORT_MODULE = "import_module"
 __GET_LOCAL_OBJECT = "get_local_object"
 __PYSV_OBJECT_BASE = "PySVObject"
 __PYSV_DESTROY = "destroy"
-__LOAD_CLASS_DEFS = "load_class_defs"
+__ADD_CLASS_NAMESPACE = "add_class_namespace"
+__ADD_CLASS_DEF = "add_class_def"
+__GET_FUNCTION_DEF = "get_function_def"
+__CALL_FUNCTION = "call_function"
+__CALL_CLASS_FUNC = "call_class_func"
+__DESTROY_OBJECT = "destroy_object"
+__NUM_FUNCTION_DEFS = "NUM_FUNCTION_DEFS"
+__RELEASE_GIL = "RELEASE_GIL"
+__GET_ASYNC_EXECUTOR = "get_async_executor"
+__GET_REMOTE_CLIENT = "get_remote_client"
+__STATS_TIMER = "stats_timer"
+__TRACE_SCOPE = "trace_scope"
+__CALL_RECORD = "call_record"
+__CACHE_KEY = "cache_key"
+__CACHE_VALUE = "cache_value"
+__TABLE_VALUE = "table_value"
+__TRACE_ARG_TYPES = {DataType.Bit, DataType.Byte, DataType.ShortInt, DataType.Int, DataType.LongInt, DataType.UByte,
+                     DataType.UShortInt, DataType.UInt, DataType.ULongInt, DataType.Float, DataType.Double}
 __DEFAULT_ATTRIBUTE = '__attribute__((visibility("default"))) '
 
 
@@ -50,11 +71,53 @@ def __should_include_buffer_impl(func_defs):
     for func_def in func_defs:
         func_def = __get_func_def(func_def)
         for input_type in func_def.arg_types.values():
-            if input_type == DataType.IntArray:
+            if input_type.is_array():
                 return True
     return False
 
 
+def __should_include_vector_impl(func_defs):
+    func_defs = __get_func_defs(func_defs)
+    for func_def in func_defs:
+        func_def = __get_func_def(func_def)
+        for arg_type in func_def.arg_types.values():
+            if __is_vector(arg_type) and not __is_struct(arg_type):
+                return True
+    return False
+
+
+def __get_struct_types(func_defs):
+    # structs in the order they are used, which is also the order of the SV typedefs
+    func_defs = __get_func_defs(func_defs)
+    result = []
+    for func_def in func_defs:
+        func_def = __get_func_def(func_def)
+        for arg_type in func_def.arg_types.values():
+            if __is_array(arg_type):
+                arg_type = arg_type.element_type
+            if __is_struct(arg_type) and arg_type not in result:
+                for struct in result:
+                    assert struct.name != arg_type.name, "Struct {0} has different definitions".format(struct.name)
+                result.append(arg_type)
+    return result
+
+
+def __should_include_batch_impl(func_defs):
+    func_defs = __get_func_defs(func_defs)
+    for func_def in func_defs:
+        if __is_batch(func_def):
+            return True
+    return False
+
+
+def __should_include_async_executor(func_defs):
+    func_defs = __get_func_defs(func_defs)
+    for func_def in func_defs:
+        if __is_async(func_def):
+            return True
+    return False
+
+
 def __should_generate_func_import(func_defs):
     func_defs = __get_func_defs(func_defs)
     for func_def in func_defs:
@@ -77,11 +140,65 @@ def __get_conda_path():
 
 
 def __is_array(t: DataType):
-    return t == DataType.IntArray
+    return t.is_array()
+
+
+def __is_fixed_array(t: DataType):
+    return __is_array(t) and getattr(t, "shape", None) is not None
+
+
+def __is_vector(t: Union[DataType, BitVector]):
+    return isinstance(t, BitVector)
+
+
+def __is_struct(t: Union[DataType, BitVector]):
+    return isinstance(t, Struct)
+
+
+def __is_batch(func_def: Union[Function, DPIFunctionCall]):
+    return isinstance(func_def, DPIBatchFunction)
+
+
+def __is_async(func_def: Union[Function, DPIFunctionCall]):
+    return isinstance(func_def, DPIAsyncFunction)
+
+
+def __is_cache(func_def: Union[Function, DPIFunctionCall]):
+    return isinstance(func_def, DPICacheFunction)
+
+
+def __is_cached(func_def: Union[Function, DPIFunctionCall]):
+    # scalar function with a cache in front of it
+    func_def = __get_func_def(func_def)
+    return not isinstance(func_def, DPIVariantFunction) and getattr(func_def, "cache_size", 0) > 0
+
+
+def __is_tabulated(func_def: Union[Function, DPIFunctionCall]):
+    func_def = __get_func_def(func_def)
+    return not isinstance(func_def, DPIVariantFunction) and getattr(func_def, "table_config", None) is not None
+
+
+def __is_const(func_def: Union[Function, DPIFunctionCall]):
+    return getattr(__get_func_def(func_def), "is_const", False)
 
 
-def __get_dpi_data_type(t: DataType):
-    if t == DataType.Bit:
+def __get_array_dim(func_def: Function, t: DataType):
+    if __is_batch(func_def):
+        # every argument of a batched function is a one dimensional array
+        return 1
+    return t.dim if __is_array(t) else 0
+
+
+def __get_dpi_data_type(t: Union[DataType, BitVector]):
+    if __is_struct(t):
+        # declared as a typedef in the package
+        return t.name
+    elif __is_vector(t):
+        return "{0} [{1}:0]".format("logic" if t.four_state else "bit", t.width - 1)
+    elif t.is_array():
+        # open arrays are declared with the element type
+        return __get_dpi_data_type(t.element_type)
+    elif t == DataType.Bit:
         return "bit"
     elif t == DataType.Byte:
         return "byte"
@@ -110,9 +227,6 @@ def __get_dpi_data_type(t: DataType):
     # only for return type
     elif t == DataType.Void:
         return "void"
-    # the only array type supported
-    elif t == DataType.IntArray:
-        return "int"
     raise ValueError("Unknown type")
 
 
@@ -137,14 +251,15 @@ def generate_dpi_signature(func_def: Union[Function, DPIFunctionCall],
                 arg_type_str = __PYSV_OBJECT_BASE
         else:
             arg_type_str = __get_dpi_data_type(arg_type)
-        args.append("input {0} {1}{2}".format(arg_type_str, arg_name,
-                                              "[]" * arg_type.dim if __is_array(arg_type) else ""))
+        args.append("input {0} {1}{2}".format(arg_type_str, arg_name, "[]" * __get_array_dim(func_def, arg_type)))
     # notice that we generate output at the end
     for arg_name in func_def.output_names:
         # we only allow primitive data types for return reference type
         arg_type = func_def.arg_types[arg_name]
         arg_type_str = __get_dpi_data_type(arg_type)
-        args.append("output {0} {1}{2}".format(arg_type_str, arg_name, "[]" if __is_array(arg_type) else ""))
+        direction = "inout" if arg_name in func_def.inout_names else "output"
+        args.append("{0} {1} {2}{3}".format(direction, arg_type_str, arg_name,
+                                            "[]" * __get_array_dim(func_def, arg_type)))
 
     # additional signature for ref ctor
     if is_class and len(ref_ctor_name) > 0 and func_def.is_init:
@@ -195,18 +310,66 @@ def generate_dpi_signature(func_def: Union[Function, DPIFunctionCall],
     return result
 
 
-def generate_dpi_definitions(func_defs, pretty_print=True):
-    if pysv_finalize not in func_defs:
-        func_defs = func_defs + [pysv_finalize]
-    new_defs = __get_func_defs(func_defs)
+def generate_dpi_definitions(func_defs, pretty_print=True, trace=False):
+    func_defs = __add_runtime_functions(func_defs, trace)
+    new_defs = __get_func_defs(func_defs, include_const=True)
     result = ""
     for func in new_defs:
-        result += "{0}\n".format(generate_dpi_signature(func, pretty_print))
+        if __is_const(func):
+            result += generate_sv_const_function(func)
+        else:
+            result += "{0}\n".format(generate_dpi_signature(func, pretty_print))
     return result
 
 
-def get_arg_name(name):
-    return "__" + name
+def __get_sv_literal(value, data_type: DataType):
+    if data_type == DataType.Bit:
+        return "1'b1" if value else "1'b0"
+    elif data_type == DataType.String:
+        result = ""
+        for c in str(value).encode("utf-8"):
+            if c in __SV_STRING_ESCAPES:
+                result += __SV_STRING_ESCAPES[c]
+            elif 0x20 <= c < 0x7F:
+                result += chr(c)
+            else:
+                result += "\\{0:03o}".format(c)
+        return '"{0}"'.format(result)
+    elif data_type in {DataType.Float, DataType.Double}:
+        value = float(value)
+        if data_type == DataType.Float:
+            value = struct.unpack("<f", struct.pack("<f", value))[0]
+        if not math.isfinite(value):
+            raise ValueError("{0} cannot be written as a SystemVerilog literal".format(value))
+        return repr(value)
+    # same as the C++ conversion, integers are truncated to the lower bits
+    width = __INTEGER_WIDTHS[data_type]
+    value = operator.index(value) & ((1 << width) - 1)
+    signed = data_type in {DataType.Byte, DataType.ShortInt, DataType.Int, DataType.LongInt}
+    if signed and value >> (width - 1):
+        value -= 1 << width
+    if -(1 << 31) <= value < (1 << 31):
+        # fits into an unsized literal
+        return str(value)
+    elif signed:
+        return "{0}{1}'sd{2}".format("-" if value < 0 else "", width, abs(value))
+    return "{0}'d{1}".format(width, value)
+
+
+__SV_STRING_ESCAPES = {ord('"'): '\\"', ord("\\"): "\\\\", ord("\n"): "\\n", ord("\t"): "\\t"}
+
+
+def generate_sv_const_function(func_def: Union[Function, DPIFunctionCall]):
+    func_def = __get_func_def(func_def)
+    try:
+        value = func_def.func()
+    except Exception as ex:
+        raise ValueError("Unable to evaluate constant {0}: {1}".format(func_def.base_name, ex)) from ex
+    # the value is returned by a plain function, so the call sites stay the same and no DPI call is made
+    result = "function {0} {1}();\n".format(__get_dpi_data_type(func_def.return_type), func_def.func_name)
+    result += __INDENTATION + "return {0};\n".format(__get_sv_literal(value, func_def.return_type))
+    result += "endfunction\n"
+    return result
 
 
 def __is_class_method(func_def: Union[Function, DPIFunctionCall]):
@@ -228,7 +391,7 @@ def __get_func_def(func_def: Union[Function, DPIFunctionCall]) -> Function:
     return func_def
 
 
-def __get_func_defs(func_defs):
+def __get_func_defs(func_defs, include_const=False):
     new_defs: List[DPIFunctionCall] = []
     for func in func_defs:
         if is_class(func):
@@ -236,7 +399,12 @@ def __get_func_defs(func_defs):
             for f in funcs:
                 new_defs.append(f)
         else:
+            # constant functions only exist in the SystemVerilog package
+            if __is_const(func) and not include_const:
+                continue
             new_defs.append(func)
+            # batched and async variants are generated right after the function
+            new_defs += __get_func_def(func).variants
     return new_defs
 
 
@@ -282,33 +450,27 @@ def __get_forwarded_types(func_defs):
 
 def get_python_src(func_def: Union[Function, DPIFunctionCall]):
     func_def = __get_func_def(func_def)
-    result = ""
-    # 1. output the actual function body
-    result += func_def.get_func_src() + "\n"
+    # functions and classes are only defined once and then called directly from the runtime
+    # notice that for constructors, the entire class definition is returned
+    return func_def.get_func_src() + "\n"
 
-    # 2 add result call to set the result into locals
-    # notice that we prefix __ to each arg using get_arg_name
-    args = []
-    for idx, n in enumerate(func_def.arg_names):
-        if func_def.is_init and idx == 0:
-            # skip self in the python codegen
-            continue
-        args.append(get_arg_name(n))
-    arg_str = ", ".join(args)
+
+def __get_python_name(func_def: Function):
     if func_def.is_init:
         # use the class name to instantiate the object
-        func_name = func_def.parent_class.__name__
+        return func_def.parent_class.__name__
     else:
-        func_name = func_def.base_name
-    result += "__result = {0}({1})\n".format(func_name, arg_str)
+        return func_def.base_name
 
-    return result
+
+def __get_vector_c_type(data_type: BitVector):
+    return "svLogicVecVal" if data_type.four_state else "svBitVecVal"
 
 
-def get_c_type_str(data_type: DataType):  # pragma: no cover
+def get_c_type_str(data_type: Union[DataType, BitVector]):  # pragma: no cover
     if data_type == DataType.Bit:
         return "bool"
-    elif data_type == DataType.Bit:
+    elif data_type == DataType.Byte:
         return "int8_t"
     elif data_type == DataType.ShortInt:
         return "int16_t"
@@ -334,13 +496,56 @@ def get_c_type_str(data_type: DataType):  # pragma: no cover
         return "double"
     elif data_type == DataType.Void:
         return "void"
-    elif data_type == DataType.IntArray:
+    elif __is_vector(data_type):
+        # packed vectors are passed by reference
+        return "const {0}*".format(__get_vector_c_type(data_type))
+    elif data_type.is_array():
         # dpi open aray type
         return "svOpenArrayHandle"
     else:
         raise ValueError(data_type)
 
 
+def __get_converter_name(data_type: Union[DataType, BitVector]):
+    # width-aware converters defined in type_conversion.cc and vector_impl.cc
+    if __is_vector(data_type):
+        return "logic" if data_type.four_state else "bits"
+    elif data_type == DataType.Bit:
+        return "bit"
+    elif data_type == DataType.Byte:
+        return "int8"
+    elif data_type == DataType.ShortInt:
+        return "int16"
+    elif data_type == DataType.Int:
+        return "int32"
+    elif data_type == DataType.LongInt:
+        return "int64"
+    elif data_type == DataType.UByte:
+        return "uint8"
+    elif data_type == DataType.UShortInt:
+        return "uint16"
+    elif data_type == DataType.UInt:
+        return "uint32"
+    elif data_type == DataType.ULongInt:
+        return "uint64"
+    elif data_type == DataType.String:
+        return "string"
+    elif data_type == DataType.Float:
+        return "float"
+    elif data_type == DataType.Double:
+        return "double"
+    else:
+        raise ValueError(data_type)
+
+
+def get_to_py_converter(data_type: DataType):
+    return "to_py_" + __get_converter_name(data_type)
+
+
+def get_from_py_converter(data_type: DataType):
+    return "from_py_" + __get_converter_name(data_type)
+
+
 def get_c_function_signature(func_def: Union[Function, DPIFunctionCall], pretty_print=True, include_attribute=True,
                              is_class=False, is_function_class_wrapper=False, class_name="",
                              split_return_type: bool = False):
@@ -395,14 +600,22 @@ def get_c_function_signature(func_def: Union[Function, DPIFunctionCall], pretty_
             else:
                 cls_name = __PYSV_OBJECT_BASE
             t_str = cls_name + "*"
+        elif __is_batch(func_def):
+            t_str = get_c_type_str(DataType.IntArray)
         else:
             t_str = get_c_type_str(t)
         args.append("{0} {1}".format(t_str, name))
     # generate output args
     for name in func_def.output_names:
         t = func_def.arg_types[name]
-        t_str = get_c_type_str(t)
-        args.append("{0} *{1}".format(t_str, name))
+        if __is_batch(func_def) or __is_array(t):
+            # output arrays are passed in as handles
+            args.append("{0} {1}".format(get_c_type_str(DataType.IntArray), name))
+        elif __is_vector(t):
+            args.append("{0} *{1}".format(__get_vector_c_type(t), name))
+        else:
+            t_str = get_c_type_str(t)
+            args.append("{0} *{1}".format(t_str, name))
     arg_str = padding.join(args)
     result = "{0}{1})".format(result, arg_str)
     if split_return_type:
@@ -416,28 +629,36 @@ def generate_sys_path_check():
     return __INDENTATION + __SYS_PATH_FUNC_NAME + '({0});\n'.format(__PYTHON_LIBRARY)
 
 
-def generate_local_variables(func_def: Union[Function, DPIFunctionCall]):
+def generate_function_args(func_def: Union[Function, DPIFunctionCall]):
     func_def = __get_func_def(func_def)
-    result = __INDENTATION + "auto locals = py::dict();\n"
-    # assigning values
-    for idx, n in enumerate(func_def.arg_names):
-        if func_def.is_init and idx == 0:
-            # class constructor don't need the first self
+    # python objects passed to the function positionally, which includes the output arrays
+    result = []
+    for idx, n in enumerate(func_def.param_names or func_def.arg_names):
+        if (func_def.parent_class is not None) and idx == 0:
+            # self is either the object itself or not needed for class constructor
             continue
-        str_name = get_arg_name(n)
         arg_type = func_def.arg_types[n]
-        if arg_type == DataType.Object and not (idx == 0 and func_def.parent_class is not None):
-            s = __INDENTATION + __GET_LOCAL_OBJECT + '("{0}", {1}, locals);\n'.format(str_name, n)
+        if arg_type == DataType.Object:
+            s = __GET_LOCAL_OBJECT + "({0})".format(n)
+        elif __is_array(arg_type) and __is_struct(arg_type.element_type):
+            struct = arg_type.element_type
+            s = "to_py_struct_array({0}, {1}(), {2})".format(n, __get_struct_dtype_name(struct), struct.itemsize)
+        elif __is_struct(arg_type):
+            s = "to_py_struct({0}, {1}(), {2})".format(n, __get_struct_dtype_name(arg_type), arg_type.itemsize)
+        elif __is_fixed_array(arg_type):
+            s = "{0}_buffer.view({0})".format(n)
         elif __is_array(arg_type):
-            s = __INDENTATION + 'locals["{0}"] = to_buffer({1});\n'.format(str_name, n)
+            s = "to_buffer<{0}>({1})".format(get_c_type_str(arg_type.element_type), n)
+        elif __is_vector(arg_type):
+            s = "{0}({1}, {2})".format(get_to_py_converter(arg_type), n, arg_type.width)
         else:
-            s = __INDENTATION + 'locals["{0}"] = {1};\n'.format(str_name, n)
-        result += s
-    result += '\n'
+            s = "{0}({1})".format(get_to_py_converter(arg_type), n)
+        result.append(s)
     return result
 
 
-def generate_global_variables(func_def: Union[Function, DPIFunctionCall], add_class=False, lib_name: str = ""):
+def generate_global_variables(func_def: Union[Function, DPIFunctionCall], add_class=False, lib_name: str = "",
+                              indentation: str = __INDENTATION):
     func_def = __get_func_def(func_def)
     raw_imports = func_def.imports
     imports = {}
@@ -445,9 +666,10 @@ def generate_global_variables(func_def: Union[Function, DPIFunctionCall], add_cl
     for n, m in raw_imports.items():
         if should_import(n, py_src):
             imports[n] = m
-    result = __INDENTATION + "auto globals = py::dict();\n"
+    result = indentation + "auto globals = py::dict();\n"
     if add_class:
-        result += __INDENTATION + __LOAD_CLASS_DEFS + "(globals);\n"
+        # the namespace is persistent and also needs to see classes defined later on
+        result += indentation + __ADD_CLASS_NAMESPACE + "(globals);\n"
     if len(imports) > 0:
         for n, m in imports.items():
             if isinstance(m, DPIImportFunction):
@@ -456,36 +678,202 @@ def generate_global_variables(func_def: Union[Function, DPIFunctionCall], add_cl
                 func_name = m.func_name
                 m = lib_name + "." + func_name
                 n = func_name
-            result += __INDENTATION + '{0}("{1}", "{2}", globals);\n'.format(__IMPORT_MODULE, m, n)
+            result += indentation + '{0}("{1}", "{2}", globals);\n'.format(__IMPORT_MODULE, m, n)
         result += "\n"
     return result
 
 
-def generate_execute_code(func_def: Union[Function, DPIFunctionCall], pretty_print=True):
+def __use_function_def(func_def: Function):
+    if __is_async(func_def):
+        # only submit calls the python function
+        return func_def.stage == DPIAsyncFunction.SUBMIT
+    if __is_cache(func_def):
+        return False
+    # class methods go through the objects instead
+    return func_def.parent_class is None or func_def.is_init
+
+
+def generate_function_def(func_def: Union[Function, DPIFunctionCall], func_id: int = 0, add_class=False,
+                          lib_name: str = ""):
+    func_def = __get_func_def(func_def)
+    # the python function is only defined once per interpreter and the function object is cached in the runtime
+    result = __INDENTATION + "auto &py_func = {0}({1});\n".format(__GET_FUNCTION_DEF, func_id)
+    result += __INDENTATION + "if (!py_func) {\n"
+    result += generate_global_variables(func_def, add_class=add_class, lib_name=lib_name,
+                                        indentation=__INDENTATION * 2)
+    result += __INDENTATION * 2 + 'py::exec(R"(\n'
+    result += get_python_src(func_def)
+    result += ')", globals);\n'
+    python_name = __get_python_name(func_def)
+    result += __INDENTATION * 2 + 'py_func = globals["{0}"];\n'.format(python_name)
+    if func_def.is_init:
+        # make the class visible to other functions
+        result += __INDENTATION * 2 + '{0}("{1}", py_func);\n'.format(__ADD_CLASS_DEF, python_name)
+    result += __INDENTATION + "}\n"
+    return result
+
+
+def __get_returned_outputs(func_def: Function):
+    # output arrays are filled in place instead of being returned
+    return [name for name in func_def.output_names if not __is_array(func_def.arg_types[name])]
+
+
+def __has_return_value(func_def: Function):
+    return func_def.return_type != DataType.Void or len(__get_returned_outputs(func_def)) > 0
+
+
+def generate_execute_code(func_def: Union[Function, DPIFunctionCall], pretty_print=True, func_id: int = 0,
+                          stats: bool = False):
     func_def = __get_func_def(func_def)
     # depends on whether it's class method or not
     if func_def.parent_class is not None and not func_def.is_init:
-        # grab values from the locals
-        arg_names = [func_def.arg_names[0], '"{0}"'.format(func_def.base_name)]
-        for arg_name in func_def.arg_names[1:]:
-            arg = 'locals["{0}"]'.format(get_arg_name(arg_name))
-            arg_names.append(arg)
-        result = __INDENTATION + 'locals["__result"] = call_class_func('
-        if pretty_print:
-            padding = ",\n" + len(result) * " "
-        else:
-            padding = ", "
-        args = padding.join(arg_names)
-        result += args + ");\n"
+        if func_def.base_name == __PYSV_DESTROY:
+            # destructor only needs to release the object
+            return __INDENTATION + "{0}({1});\n".format(__DESTROY_OBJECT, func_def.arg_names[0])
+        # use the object to call the method
+        arg_names = [str(func_id), func_def.arg_names[0], '"{0}"'.format(func_def.base_name)]
+        func_name = __CALL_CLASS_FUNC
+    else:
+        # call the cached function or class object directly
+        arg_names = ["py_func"]
+        func_name = __CALL_FUNCTION
+    args = generate_function_args(func_def)
+    result = generate_fixed_buffers(func_def)
+    if stats:
+        # convert the arguments first so that the conversion is timed on its own
+        names = func_def.param_names or func_def.arg_names
+        if func_def.parent_class is not None:
+            names = names[1:]
+        for name, arg in zip(names, args):
+            result += __INDENTATION + "auto py_arg_{0} = {1};\n".format(name, arg)
+        args = ["py_arg_" + name for name in names]
+        result += __INDENTATION + "{0}.lap(STATS_ARGS);\n".format(__STATS_TIMER)
+    arg_names += args
+    result += __generate_call(func_name, arg_names, __get_result_prefix(__has_return_value(func_def)), pretty_print)
+    if stats:
+        result += __INDENTATION + "{0}.lap(STATS_PYTHON);\n".format(__STATS_TIMER)
+    return result
+
+
+def generate_fixed_buffers(func_def: Union[Function, DPIFunctionCall]):
+    func_def = __get_func_def(func_def)
+    result = ""
+    # views of arrays with fixed shapes are kept across calls
+    for name in func_def.param_names or func_def.arg_names:
+        arg_type = func_def.arg_types[name]
+        if __is_fixed_array(arg_type):
+            shape = ", ".join([str(s) for s in arg_type.shape])
+            result += __INDENTATION + "static FixedBuffer<{0}, {1}> {2}_buffer;\n".format(
+                get_c_type_str(arg_type.element_type), shape, name)
+    return result
+
+
+def __get_result_prefix(has_result: bool):
+    return "auto py_result = " if has_result else ""
+
+
+def __generate_call(func_name: str, arg_names: List[str], result_prefix: str = "", pretty_print: bool = True,
+                    indentation: str = __INDENTATION):
+    result = indentation + result_prefix + func_name + "("
+
+    if pretty_print:
+        padding = ",\n" + len(result) * " "
     else:
-        result = __INDENTATION + 'py::exec(R"(\n'
-        python_src = get_python_src(func_def)
-        result += python_src
-        result += ')", globals, locals);\n'
+        padding = ", "
+    args = padding.join(arg_names)
+    result += args + ");\n"
+    return result
+
+
+def __generate_unpack_result(num_outputs: int, indentation: str = __INDENTATION):
+    # multiple outputs are returned as a tuple
+    result = indentation + 'auto ref_result = py::tuple(py_result);\n'
+    # generate error checking at runtime
+    result += indentation + 'if (py::len(ref_result) != {0}) {{\n'.format(num_outputs)
+    result += indentation + __INDENTATION + 'throw std::runtime_error("Invalid return tuple size");\n'
+    result += indentation + "}\n"
     return result
 
 
-def generate_return_value(func_def: Union[Function, DPIFunctionCall]):
+def __get_batch_element_type(data_type: DataType):
+    # bit arrays are stored as svBit
+    if data_type == DataType.Bit:
+        return "svBit"
+    return get_c_type_str(data_type)
+
+
+def generate_batch_execute_code(func_def: DPIBatchFunction, pretty_print=True):
+    result = ""
+    names = func_def.arg_names + func_def.output_names
+    for name in names:
+        result += __INDENTATION + "BatchArray<{0}> {1}_batch({1});\n".format(
+            __get_batch_element_type(func_def.arg_types[name]), name)
+    sizes = ", ".join(["{0}_batch.size()".format(name) for name in names])
+    outputs = func_def.output_names
+    result_prefix = __get_result_prefix(len(outputs) > 0)
+    if func_def.mode == Batch.Vector:
+        result += __INDENTATION + "check_batch_size({{{0}}});\n".format(sizes)
+        # the python function is called once with numpy views of the arrays
+        arg_names = ["py_func"] + ["{0}_batch.view(true)".format(name) for name in func_def.arg_names]
+        result += __generate_call(__CALL_FUNCTION, arg_names, result_prefix, pretty_print)
+        if len(outputs) == 1:
+            result += __INDENTATION + "copy_batch_result({0}_batch, py_result);\n".format(outputs[0])
+        elif len(outputs) > 1:
+            result += __generate_unpack_result(len(outputs))
+            for idx, name in enumerate(outputs):
+                result += __INDENTATION + "copy_batch_result({0}_batch, ref_result[{1}]);\n".format(name, idx)
+    else:
+        result += __INDENTATION + "auto batch_size = check_batch_size({{{0}}});\n".format(sizes)
+        # loop through the elements without leaving the DPI call
+        indentation = __INDENTATION * 2
+        result += __INDENTATION + "for (int i = 0; i < batch_size; i++) {\n"
+        arg_names = ["py_func"] + ["{0}({1}_batch[i])".format(get_to_py_converter(func_def.arg_types[name]), name)
+                                   for name in func_def.arg_names]
+        result += __generate_call(__CALL_FUNCTION, arg_names, result_prefix, pretty_print,
+                                  indentation=indentation)
+        if len(outputs) == 1:
+            converter = get_from_py_converter(func_def.arg_types[outputs[0]])
+            result += indentation + "{0}_batch[i] = {1}(py_result);\n".format(outputs[0], converter)
+        elif len(outputs) > 1:
+            result += __generate_unpack_result(len(outputs), indentation=indentation)
+            for idx, name in enumerate(outputs):
+                converter = get_from_py_converter(func_def.arg_types[name])
+                result += indentation + "{0}_batch[i] = {1}(ref_result[{2}]);\n".format(name, converter, idx)
+        result += __INDENTATION + "}\n"
+    return result
+
+
+def generate_async_execute_code(func_def: DPIAsyncFunction, func_id: int, pretty_print=True):
+    config = func_def.config
+    # the executor is created on first use
+    executor = "{0}({1}, {2}, {3}, {4})".format(__GET_ASYNC_EXECUTOR, func_id, config.workers, config.max_in_flight,
+                                                "true" if config.ordered else "false")
+    if func_def.stage == DPIAsyncFunction.SUBMIT:
+        arg_names = ["py_func"] + generate_function_args(func_def)
+        return __generate_call(executor + ".submit", arg_names, "return ", pretty_print)
+    elif func_def.stage == DPIAsyncFunction.POLL:
+        return __INDENTATION + "return {0}.poll({1});\n".format(executor, DPIAsyncFunction.TICKET_NAME)
+    else:
+        result = __INDENTATION + "{0}{1}.wait({2});\n".format(__get_result_prefix(__has_return_value(func_def)),
+                                                              executor, DPIAsyncFunction.TICKET_NAME)
+        result += generate_return_value(func_def)
+        return result
+
+
+def __generate_set_output(name: str, data_type: Union[DataType, BitVector], value: str):
+    if __is_struct(data_type):
+        # numpy packs the fields into the struct
+        return __INDENTATION + "from_py_struct({0}, {1}, {2}(), {3});\n".format(value, name,
+                                                                            __get_struct_dtype_name(data_type),
+                                                                            data_type.itemsize)
+    elif __is_vector(data_type):
+        # vectors are written word by word
+        return __INDENTATION + "{0}({1}, {2}, {3});\n".format(get_from_py_converter(data_type), value, name,
+                                                              data_type.width)
+    return __INDENTATION + "*{0} = {1}({2});\n".format(name, get_from_py_converter(data_type), value)
+
+
+def generate_return_value(func_def: Union[Function, DPIFunctionCall], record: bool = False, cache: bool = False):
     func_def = __get_func_def(func_def)
     result = ""
     # notice that string is different since we need to use a global static
@@ -494,64 +882,353 @@ def generate_return_value(func_def: Union[Function, DPIFunctionCall]):
     if return_type == DataType.Void:
         # we have some complication here
         # if the user is returning a reference, we need to unpack the tuple and set the value properly
-        if len(func_def.output_names) == 1:
-            t_str = get_c_type_str(func_def.arg_types[func_def.output_names[0]])
-            result += __INDENTATION + '*{0} = locals["__result"].cast<{1}>();\n'.format(func_def.output_names[0], t_str)
-        elif len(func_def.output_names) > 1:
-            result += __INDENTATION + 'auto ref_result = locals["__result"].cast<py::list>();\n'
-            # generate error checking at runtime
-            result += __INDENTATION + 'if (py::len(ref_result) != {0}) {{\n'.format(len(func_def.output_names))
-            result += __INDENTATION * 2 + 'throw std::runtime_error("Invalid return tuple size");\n'
-            result += __INDENTATION + "}\n"
+        output_names = __get_returned_outputs(func_def)
+        if len(output_names) == 1:
+            result += __generate_set_output(output_names[0], func_def.arg_types[output_names[0]], "py_result")
+        elif len(output_names) > 1:
+            result += __generate_unpack_result(len(output_names))
             # now generate the value setting part
-            for idx, arg_name in enumerate(func_def.output_names):
-                t_str = get_c_type_str(func_def.arg_types[arg_name])
-                result += __INDENTATION + '*{0} = ref_result[{1}].cast<{2}>();\n'.format(arg_name, idx, t_str)
-        else:
-            # nothing to be done for void return type
-            return ""
+            for idx, arg_name in enumerate(output_names):
+                result += __generate_set_output(arg_name, func_def.arg_types[arg_name],
+                                                "ref_result[{0}]".format(idx))
+        if record:
+            result += generate_record_results(func_def)
     elif return_type == DataType.String:
         # special care for string
-        result += __INDENTATION + '{0} = locals["__result"].cast<std::string>();\n'.format(__GLOBAL_STRING_VAR_NAME)
+        result += __INDENTATION + '{0} = {1}(py_result);\n'.format(__GLOBAL_STRING_VAR_NAME,
+                                                                  get_from_py_converter(return_type))
+        if record:
+            result += generate_record_results(func_def, "{0}.c_str()".format(__GLOBAL_STRING_VAR_NAME))
         result += __INDENTATION + "return {0}.c_str();\n".format(__GLOBAL_STRING_VAR_NAME)
+    elif record or cache:
+        # the converted value is recorded and cached before it is returned
+        if return_type == DataType.Object:
+            value = "create_class_func(py_result)"
+        else:
+            value = "{0}(py_result)".format(get_from_py_converter(return_type))
+        result += __INDENTATION + "auto c_result = {0};\n".format(value)
+        if record:
+            result += generate_record_results(func_def, "c_result")
+        if cache:
+            result += generate_cache_update(func_def, "c_result")
+        result += __INDENTATION + "return c_result;\n"
     elif return_type == DataType.Object:
         # need to call the cxx function
-        if func_def.is_init:
-            class_name = func_def.parent_class.__name__
-        else:
-            class_name = ""
-        result += __INDENTATION + 'return create_class_func(locals, "{0}");\n'.format(class_name)
+        result += __INDENTATION + 'return create_class_func(py_result);\n'
+    else:
+        result += __INDENTATION + 'return {0}(py_result);\n'.format(get_from_py_converter(return_type))
+    return result
+
+
+def __generate_record_value(name: str, data_type: Union[DataType, BitVector], value: str = "",
+                            indentation: str = __INDENTATION):
+    value = value or name
+    if data_type == DataType.Object:
+        s = "write_handle({0})".format(value)
+    elif __is_array(data_type) and __is_struct(data_type.element_type):
+        s = "write_struct_array({0}, {1})".format(value, data_type.element_type.itemsize)
+    elif __is_array(data_type):
+        s = "write_array<{0}>({1})".format(get_c_type_str(data_type.element_type), value)
+    elif __is_vector(data_type):
+        # structs are recorded as their packed bits
+        s = "{0}({1}, {2})".format("write_logic" if data_type.four_state else "write_bits", value, data_type.width)
     else:
-        return_type_str = get_c_type_str(return_type)
-        result += __INDENTATION + 'return locals["__result"].cast<{0}>();\n'.format(return_type_str)
+        s = "write({0})".format(value)
+    return indentation + "{0}.{1};\n".format(__CALL_RECORD, s)
+
+
+def __generate_record_shape(name: str, data_type: DataType):
+    if __is_struct(data_type.element_type):
+        s = "write_struct_array_shape({0}, {1})".format(name, data_type.element_type.itemsize)
+    else:
+        s = "write_array_shape<{0}>({1})".format(get_c_type_str(data_type.element_type), name)
+    return __INDENTATION + "{0}.{1};\n".format(__CALL_RECORD, s)
+
+
+def generate_record_args(func_def: Union[Function, DPIFunctionCall], func_id: int = 0):
+    func_def = __get_func_def(func_def)
+    result = __INDENTATION + "CallRecord {0}({1});\n".format(__CALL_RECORD, func_id)
+    names = func_def.param_names or func_def.arg_names
+    if func_def.parent_class is not None:
+        # the constructor doesn't take the object, and methods are called on the object handle
+        if not func_def.is_init:
+            result += __generate_record_value(names[0], DataType.Object)
+        names = names[1:]
+    for name in names:
+        if name in func_def.output_names and name not in func_def.inout_names:
+            # the content of output arrays is only written by the python code, which the replay allocates
+            result += __generate_record_shape(name, func_def.arg_types[name])
+        else:
+            result += __generate_record_value(name, func_def.arg_types[name])
+    return result
+
+
+def generate_record_results(func_def: Union[Function, DPIFunctionCall], return_value: str = "",
+                            indentation: str = __INDENTATION):
+    func_def = __get_func_def(func_def)
+    result = indentation + "{0}.begin_results();\n".format(__CALL_RECORD)
+    if return_value:
+        result += __generate_record_value(return_value, func_def.return_type, indentation=indentation)
+    for name in func_def.output_names:
+        arg_type = func_def.arg_types[name]
+        # scalar outputs are written through pointers, while the others are passed by reference
+        is_pointer = not (__is_array(arg_type) or __is_vector(arg_type))
+        result += __generate_record_value(name, arg_type, "*" + name if is_pointer else name, indentation)
     return result
 
 
+def __generate_lookup_return(func_def: Union[Function, DPIFunctionCall], value: str, stats: bool = False,
+                             record: bool = False, indentation: str = __INDENTATION):
+    # calls answered without running python still show up in the stats and the record
+    result = ""
+    if stats:
+        result += indentation + "{0}.cached();\n".format(__STATS_TIMER)
+    if record:
+        result += generate_record_results(func_def, value, indentation)
+    return result + indentation + "return {0};\n".format(value)
+
+
+def __get_cache_name(func_def: Union[Function, DPIFunctionCall]):
+    func_def = __get_func_def(func_def)
+    if __is_cache(func_def):
+        func_def = func_def.scalar_def
+    return "{0}_lru".format(func_def.func_name)
+
+
+def generate_cache_definitions(func_defs):
+    result = ""
+    for func_def in func_defs:
+        func_def = __get_func_def(func_def)
+        if not __is_cached(func_def):
+            continue
+        if not result:
+            result += __get_code_snippet("cache_impl.cc")
+        result += "LRUCache<{0}, {1}> {2}({3});\n".format(len(func_def.arg_names), get_c_type_str(func_def.return_type),
+                                                         __get_cache_name(func_def), func_def.cache_size)
+    return result
+
+
+def generate_cache_lookup(func_def: Union[Function, DPIFunctionCall], stats: bool = False, record: bool = False):
+    func_def = __get_func_def(func_def)
+    keys = ", ".join(["pack_cache_key({0})".format(name) for name in func_def.arg_names])
+    result = __INDENTATION + "CacheKey<{0}> {1}{{{{{2}}}}};\n".format(len(func_def.arg_names), __CACHE_KEY, keys)
+    result += __INDENTATION + "{0} {1};\n".format(get_c_type_str(func_def.return_type), __CACHE_VALUE)
+    # a hit returns before the runtime is touched
+    condition = "if ({0}.get({1}, {2}))".format(__get_cache_name(func_def), __CACHE_KEY, __CACHE_VALUE)
+    if not (stats or record):
+        return result + __INDENTATION + "{0} return {1};\n".format(condition, __CACHE_VALUE)
+    result += __INDENTATION + condition + " {\n"
+    result += __generate_lookup_return(func_def, __CACHE_VALUE, stats, record, __INDENTATION * 2)
+    result += __INDENTATION + "}\n"
+    return result
+
+
+def generate_cache_update(func_def: Union[Function, DPIFunctionCall], value: str):
+    return __INDENTATION + "{0}.put({1}, {2});\n".format(__get_cache_name(func_def), __CACHE_KEY, value)
+
+
+def generate_cache_control(func_def: DPICacheFunction):
+    name = __get_cache_name(func_def)
+    if func_def.stage == DPICacheFunction.CLEAR:
+        return __INDENTATION + "{0}.clear();\n".format(name)
+    counter = "hits" if func_def.stage == DPICacheFunction.HITS else "misses"
+    return __INDENTATION + "return static_cast<int64_t>({0}.{1});\n".format(name, counter)
+
+
+def __get_table_name(func_def: Function):
+    return "{0}_table".format(func_def.func_name)
+
+
+def __get_table_domain(data_type: DataType):
+    # entries are indexed by the unsigned value of the argument
+    width = Table.DOMAIN_WIDTHS[data_type]
+    if data_type == DataType.Bit:
+        return [False, True]
+    elif data_type in {DataType.Byte, DataType.ShortInt}:
+        return [v - (1 << width) if v >> (width - 1) else v for v in range(1 << width)]
+    return list(range(1 << width))
+
+
+def __get_c_literal(value, data_type: DataType):
+    # same conversion as the generated code does for the python result
+    if data_type == DataType.Bit:
+        return "true" if value else "false"
+    elif data_type in {DataType.Float, DataType.Double}:
+        value = float(value)
+        if data_type == DataType.Float and math.isfinite(value):
+            try:
+                value = struct.unpack("<f", struct.pack("<f", value))[0]
+            except OverflowError:
+                value = math.copysign(math.inf, value)
+        if math.isnan(value):
+            return "std::numeric_limits<{0}>::quiet_NaN()".format(get_c_type_str(data_type))
+        elif math.isinf(value):
+            return "{0}std::numeric_limits<{1}>::infinity()".format("-" if value < 0 else "",
+                                                                    get_c_type_str(data_type))
+        return repr(value)
+    # integers are truncated to the lower bits
+    width = __INTEGER_WIDTHS[data_type]
+    value = operator.index(value) & ((1 << width) - 1)
+    if data_type in {DataType.Byte, DataType.ShortInt, DataType.Int, DataType.LongInt} and value >> (width - 1):
+        value -= 1 << width
+        if width == 64:
+            # the literal of the most negative value doesn't fit into long long
+            return "({0}ll - 1)".format(value + 1)
+    return str(value) + ("ull" if data_type == DataType.ULongInt else "")
+
+
+__INTEGER_WIDTHS = {DataType.Byte: 8, DataType.ShortInt: 16, DataType.Int: 32, DataType.LongInt: 64, DataType.UByte: 8,
+                    DataType.UShortInt: 16, DataType.UInt: 32, DataType.ULongInt: 64}
+
+
+def __evaluate_table(func_def: Function, reverse: bool = False):
+    domains = [__get_table_domain(func_def.arg_types[name]) for name in func_def.arg_names]
+    args_list = list(itertools.product(*domains))
+    entries = [""] * len(args_list)
+    # the validation runs the other way around, which catches functions that depend on the call order
+    indices = reversed(range(len(args_list))) if reverse else range(len(args_list))
+    for idx in indices:
+        args = args_list[idx]
+        try:
+            entries[idx] = __get_c_literal(func_def.func(*args), func_def.return_type)
+        except Exception as ex:
+            raise ValueError("Unable to tabulate {0}{1}: {2}".format(func_def.base_name, args, ex)) from ex
+    return entries
+
+
+def generate_table_definitions(func_defs):
+    result = ""
+    for func_def in func_defs:
+        func_def = __get_func_def(func_def)
+        if not __is_tabulated(func_def):
+            continue
+        entries = __evaluate_table(func_def)
+        for idx, (entry, expected) in enumerate(zip(entries, __evaluate_table(func_def, reverse=True))):
+            if entry != expected:
+                raise ValueError("{0} is not a pure function: entry {1} is {2} and {3}".format(func_def.base_name, idx,
+                                                                                          entry, expected))
+        if not result:
+            result += "#include <limits>\n"
+        result += "const {0} {1}[{2}] = {{\n".format(get_c_type_str(func_def.return_type), __get_table_name(func_def),
+                                                   len(entries))
+        for i in range(0, len(entries), 16):
+            result += __INDENTATION + ", ".join(entries[i:i + 16]) + ",\n"
+        result += "};\n"
+    return result
+
+
+def generate_table_lookup(func_def: Union[Function, DPIFunctionCall], stats: bool = False, record: bool = False):
+    func_def = __get_func_def(func_def)
+    index = ""
+    for name in func_def.arg_names:
+        t = func_def.arg_types[name]
+        width = Table.DOMAIN_WIDTHS[t]
+        value = name if t == DataType.Bit else "static_cast<uint{0}_t>({1})".format(width, name)
+        value = "static_cast<size_t>({0})".format(value)
+        # the first argument is the most significant part of the index
+        index = "({0} << {1}) | {2}".format(index, width, value) if index else value
+    value = "{0}[{1}]".format(__get_table_name(func_def), index or "0")
+    if not (stats or record):
+        return __INDENTATION + "return {0};\n".format(value)
+    result = __INDENTATION + "auto {0} = {1};\n".format(__TABLE_VALUE, value)
+    return result + __generate_lookup_return(func_def, __TABLE_VALUE, stats, record)
+
+
 def generate_check_interpreter():
     return __INDENTATION + __CHECK_INTERPRETER + "();\n"
 
 
+def generate_gil_acquire():
+    return __INDENTATION + "py::gil_scoped_acquire gil;\n"
+
+
 def generate_cxx_function(func_def: Union[Function, DPIFunctionCall], pretty_print: bool = True,
-                          add_sys_path: bool = True, add_class: bool = True, lib_name: str = ""):
+                          add_sys_path: bool = True, add_class: bool = True, lib_name: str = "", func_id: int = 0,
+                          release_gil: bool = False, stats: bool = False, trace: bool = False,
+                          record: bool = False, name_id: Union[int, None] = None):
+    # stats and trace entries are indexed by name_id, which is only different from func_id for the variants
+    if name_id is None:
+        name_id = func_id
     result = get_c_function_signature(func_def, pretty_print)
     if isinstance(func_def, DPIImportFunction):
         # just need to produce a function declaration
         result += ";\n"
         return result
     result += " {\n"
+    if __is_cache(func_def):
+        # cache counters don't need the runtime
+        result += generate_cache_control(func_def)
+        result += "}\n"
+        return result
+    cache = __is_cached(func_def)
+    # only the scalar calls are recorded, since they are what the replay runs
+    record = record and not (__is_batch(func_def) or __is_async(func_def))
+    # table and cache lookups don't touch the runtime, but they are still counted, traced and recorded
+    lookup = cache or __is_tabulated(func_def)
+    if lookup:
+        result += __generate_call_observers(func_def, func_id, name_id, stats, trace, record)
+    if __is_tabulated(func_def):
+        # results are computed when the code is generated
+        result += generate_table_lookup(func_def, stats=stats, record=record)
+        result += "}\n"
+        return result
+    if cache:
+        result += generate_cache_lookup(func_def, stats=stats, record=record)
     if add_sys_path:
         result += generate_sys_path_check()
     else:
         result += generate_check_interpreter()
-    result += generate_global_variables(func_def, add_class=add_class, lib_name=lib_name)
-    result += generate_local_variables(func_def)
-    result += generate_execute_code(func_def, pretty_print)
-    result += generate_return_value(func_def)
+    # worker threads may be running python code. polling doesn't need the GIL
+    if release_gil and not (__is_async(func_def) and func_def.stage == DPIAsyncFunction.POLL):
+        result += generate_gil_acquire()
+    # class methods are resolved through the object, which doesn't need any globals
+    if __use_function_def(__get_func_def(func_def)):
+        result += generate_function_def(func_def, func_id=func_id, add_class=add_class, lib_name=lib_name)
+    if not lookup:
+        result += __generate_call_observers(func_def, func_id, name_id, stats, trace, record)
+    if __is_batch(func_def):
+        # outputs are written to the arrays directly
+        result += generate_batch_execute_code(func_def, pretty_print)
+    elif __is_async(func_def):
+        result += generate_async_execute_code(func_def, func_id, pretty_print)
+    else:
+        result += generate_execute_code(func_def, pretty_print, func_id=func_id, stats=stats)
+        result += generate_return_value(func_def, record=record, cache=cache)
     result += "}\n"
 
     return result
 
 
+def __generate_call_observers(func_def: Union[Function, DPIFunctionCall], func_id: int, name_id: int, stats: bool,
+                              trace: bool, record: bool):
+    result = ""
+    if stats:
+        result += __INDENTATION + "StatsTimer {0}({1});\n".format(__STATS_TIMER, name_id)
+    if trace:
+        result += generate_trace_scope(func_def, name_id)
+    if record:
+        result += generate_record_args(func_def, func_id)
+    return result
+
+
+def generate_trace_scope(func_def: Union[Function, DPIFunctionCall], func_id: int = 0):
+    func_def = __get_func_def(func_def)
+    result = __INDENTATION + "TraceScope {0}({1});\n".format(__TRACE_SCOPE, func_id)
+    if __is_batch(func_def):
+        # the arguments are arrays
+        return result
+    # only scalar arguments are summarized, and the first object is the one the call works on
+    has_handle = False
+    for name in func_def.param_names or func_def.arg_names:
+        arg_type = func_def.arg_types[name]
+        if arg_type == DataType.Object and not has_handle:
+            result += __INDENTATION + "{0}.handle({1});\n".format(__TRACE_SCOPE, name)
+            has_handle = True
+        elif arg_type in __TRACE_ARG_TYPES:
+            result += __INDENTATION + '{0}.arg("{1}", {1});\n'.format(__TRACE_SCOPE, name)
+    return result
+
+
 def generate_sys_path_values(build_dir="", pretty_print=True):
     result = "auto " + __SYS_PATH_NAME + " = {"
     if pretty_print:
@@ -568,10 +1245,61 @@ def generate_sys_path_values(build_dir="", pretty_print=True):
     return result
 
 
+def __get_struct_dtype_name(struct: Struct):
+    return "pysv_dtype_" + struct.name
+
+
+def generate_struct_dtypes(struct_types):
+    result = "constexpr size_t NUM_STRUCT_TYPES = {0};\n".format(len(struct_types))
+    result += __get_code_snippet("struct_impl.cc")
+    for struct_id, struct in enumerate(struct_types):
+        result += "py::object &{0}() {{\n".format(__get_struct_dtype_name(struct))
+        result += __INDENTATION + 'return get_struct_dtype({0}, R"({1})");\n'.format(struct_id, struct.dtype_spec())
+        result += "}\n"
+    return result
+
+
+def generate_function_names(names):
+    result = "constexpr size_t NUM_FUNCTION_NAMES = {0};\n".format(len(names))
+    result += "const char *FUNCTION_NAMES[] = {"
+    result += ", ".join(['"{0}"'.format(name) for name in names])
+    result += "};\n"
+    return result
+
+
+def generate_function_def_size(num_functions):
+    return "constexpr size_t {0} = {1};\n".format(__NUM_FUNCTION_DEFS, num_functions)
+
+
+def generate_release_gil(release_gil):
+    return "constexpr bool {0} = {1};\n".format(__RELEASE_GIL, "true" if release_gil else "false")
+
+
 def generate_bootstrap_code(pretty_print=True, add_sys_path=True, add_class=True, add_imports=True,
-                            add_local_object=True, add_buffer_impl=False, build_dir=""):
+                            add_local_object=True, add_buffer_impl=False, add_batch_impl=False,
+                            add_async_executor=False, add_vector_impl=False, struct_types=(), build_dir="",
+                            num_functions=0, function_names=(), add_stats=False, add_trace=False,
+                            add_record=False, add_profile=False):
     result = __get_code_snippet("include_header.hh")
+    result += __get_code_snippet("handle_table.cc")
     result += __get_code_snippet("runtime_values.cc")
+    result += generate_function_def_size(num_functions)
+    # the GIL is only released when python code runs on other threads
+    result += generate_release_gil(add_async_executor)
+    result += __get_code_snippet("thread_state.cc")
+    result += __get_code_snippet("function_defs.cc")
+    result += __get_code_snippet("call_function.cc")
+    result += __get_code_snippet("type_conversion.cc")
+    if add_profile:
+        result += __get_code_snippet("profile_impl.cc")
+    else:
+        # the runtime starts and stops the profiler, which is not compiled in
+        result += "void start_profiler() {}\nvoid stop_profiler() {}\n"
+    if add_stats:
+        # the module is added when the interpreter starts, which comes before the statistics code
+        result += "void add_stats_module();\n"
+    else:
+        result += "void add_stats_module() {}\n"
 
     if add_sys_path:
         result += __get_conda_path()
@@ -590,6 +1318,22 @@ def generate_bootstrap_code(pretty_print=True, add_sys_path=True, add_class=True
         result += __get_code_snippet("get_local_object.cc")
     if add_buffer_impl:
         result += __get_code_snippet("buffer_impl.cc")
+    if add_vector_impl:
+        result += __get_code_snippet("vector_impl.cc")
+    if struct_types:
+        result += generate_struct_dtypes(struct_types)
+    if add_stats or add_trace or add_record:
+        result += generate_function_names(function_names)
+    if add_stats:
+        result += __get_code_snippet("stats_impl.cc")
+    if add_trace:
+        result += __get_code_snippet("trace_impl.cc")
+    if add_record:
+        result += __get_code_snippet("record_impl.cc")
+    if add_batch_impl:
+        result += __get_code_snippet("batch_impl.cc")
+    if add_async_executor:
+        result += __get_code_snippet("async_executor.cc")
 
     return result
 
@@ -602,13 +1346,101 @@ def pysv_finalize():
 pysv_finalize = sv()(pysv_finalize)
 
 
-def generate_runtime_finalize(pretty_print):
+def generate_runtime_finalize(pretty_print, add_async_executor=False, add_stats=False, add_trace=False,
+                              add_record=False):
     result = get_c_function_signature(pysv_finalize, pretty_print) + " {\n"
+    if add_stats:
+        result += __INDENTATION + "write_stats_report();\n"
+    if add_trace:
+        result += __INDENTATION + "write_trace_report();\n"
+    if add_record:
+        result += __INDENTATION + "finish_call_recording();\n"
+    if add_async_executor:
+        result += __get_code_snippet("finalize_async.cc")
     result += __get_code_snippet("finalize_runtime.cc")
     result += "}\n"
     return result
 
 
+def pysv_live_objects(class_name):
+    # a dummy to query number of live objects of a class
+    return 0
+
+
+pysv_live_objects = sv(class_name=DataType.String)(pysv_live_objects)
+
+
+def generate_runtime_live_objects(pretty_print):
+    result = get_c_function_signature(pysv_live_objects, pretty_print) + " {\n"
+    result += __get_code_snippet("live_objects.cc")
+    result += "}\n"
+    return result
+
+
+def pysv_set_sim_time(value):
+    # a dummy to attach the simulation time to the traced calls
+    pass
+
+
+pysv_set_sim_time = sv(value=DataType.Double, return_type=DataType.Void)(pysv_set_sim_time)
+
+
+def generate_runtime_set_sim_time(pretty_print):
+    result = get_c_function_signature(pysv_set_sim_time, pretty_print) + " {\n"
+    result += __INDENTATION + "sim_time = value;\n"
+    result += "}\n"
+    return result
+
+
+def __add_runtime_functions(func_defs, trace=False):
+    # finalize is a built-in function
+    if pysv_finalize not in func_defs:
+        func_defs = func_defs + [pysv_finalize]
+    # so is the simulation time if the calls are traced
+    if trace and pysv_set_sim_time not in func_defs:
+        func_defs = func_defs + [pysv_set_sim_time]
+    # so is the object query if there is any class
+    if should_add_class(func_defs) and pysv_live_objects not in func_defs:
+        func_defs = func_defs + [pysv_live_objects]
+    return func_defs
+
+
+def __get_function_def_key(func_def: Union[Function, DPIFunctionCall]):
+    func_def = __get_func_def(func_def)
+    if isinstance(func_def, DPIVariantFunction):
+        return func_def.scalar_def
+    return func_def
+
+
+def __get_function_name(func_def: Function):
+    if func_def.parent_class is None:
+        return func_def.func_name
+    return "{0}.{1}".format(func_def.parent_class.__name__, func_def.func_name)
+
+
+def __get_function_ids(func_defs):
+    # each function is assigned with an unique id to index into the runtime function table
+    # batched variants share the same python function with the scalar ones
+    func_ids = {}
+    for func_def in func_defs:
+        func_ids.setdefault(__get_function_def_key(func_def), len(func_ids))
+    return func_ids
+
+
+def __get_name_ids(func_defs):
+    # the scalar functions are named by their function ids. batched and async variants share the python function,
+    # but they are different DPI calls, so they get their own names after the scalar ones
+    func_ids = __get_function_ids(func_defs)
+    names = [__get_function_name(func_def) for func_def in func_ids]
+    name_ids = {}
+    for func_def in func_defs:
+        func_def = __get_func_def(func_def)
+        if __is_batch(func_def) or __is_async(func_def):
+            name_ids[func_def] = len(names)
+            names.append(__get_function_name(func_def))
+    return name_ids, names
+
+
 def generate_forward_sv_class_definition(class_refs):
     result = ""
     for cls in class_refs:
@@ -618,11 +1450,21 @@ def generate_forward_sv_class_definition(class_refs):
 
 
 def generate_pybind_code(func_defs: List[Union[type, DPIFunctionCall]], pretty_print: bool = True,
-                         namespace: str = "pysv", add_sys_path: bool = False, build_dir: str = ""):
+                         namespace: str = "pysv", add_sys_path: bool = False, build_dir: str = "",
+                         runtime: Runtime = Runtime.Embedded, server_address: str = "", stats: bool = False,
+                         trace: bool = False, record: bool = False, profile: bool = False):
     # initialize the check the classes
     __initialize_class_defs(func_defs)
     # remove unnecessary entries
     func_defs = make_unique_func_defs(func_defs)
+    if runtime != Runtime.Embedded:
+        assert not stats, "Call statistics are only supported by the embedded runtime"
+        assert not trace, "Call tracing is only supported by the embedded runtime"
+        assert not record, "Call recording is only supported by the embedded runtime"
+        assert not profile, "Profiling is only supported by the embedded runtime"
+        # calls are forwarded to the model server instead
+        return generate_remote_code(func_defs, pretty_print=pretty_print, namespace=namespace, build_dir=build_dir,
+                                    runtime=runtime, server_address=server_address)
 
     add_class = should_add_class(func_defs)
     add_pymodule = __should_generate_func_import(func_defs)
@@ -631,21 +1473,42 @@ def generate_pybind_code(func_defs: List[Union[type, DPIFunctionCall]], pretty_p
     add_imports = __has_imports(func_defs)
     add_local_object = __should_include_local_object(func_defs)
     add_buffer_impl = __should_include_buffer_impl(func_defs)
+    add_batch_impl = __should_include_batch_impl(func_defs)
+    add_async_executor = __should_include_async_executor(func_defs)
+    add_vector_impl = __should_include_vector_impl(func_defs)
+    struct_types = __get_struct_types(func_defs)
     if add_pymodule:
         assert build_dir, "build_dir not set for import mode"
+    new_defs = __get_func_defs(func_defs)
+    func_ids = __get_function_ids(new_defs)
+    name_ids, function_names = __get_name_ids(new_defs)
     result = generate_bootstrap_code(pretty_print, add_sys_path=add_sys_path, add_class=add_class,
                                      add_imports=add_imports, add_local_object=add_local_object,
-                                     add_buffer_impl=add_buffer_impl, build_dir=build_dir) + "\n"
+                                     add_buffer_impl=add_buffer_impl, add_batch_impl=add_batch_impl,
+                                     add_async_executor=add_async_executor, add_vector_impl=add_vector_impl,
+                                     struct_types=struct_types, build_dir=build_dir,
+                                     num_functions=len(func_ids), function_names=function_names,
+                                     add_stats=stats, add_trace=trace, add_record=record,
+                                     add_profile=profile) + "\n"
+    result += generate_cache_definitions(new_defs)
+    result += generate_table_definitions(new_defs)
     # generate extern C block
     result += 'extern "C" {\n'
     code_blocks = []
 
-    new_defs = __get_func_defs(func_defs)
     for func_def in new_defs:
+        func_id = func_ids[__get_function_def_key(func_def)]
         code_blocks.append(generate_cxx_function(func_def, pretty_print=pretty_print, add_sys_path=add_sys_path,
-                                                 add_class=add_class, lib_name=namespace))
+                                                 add_class=add_class, lib_name=namespace, func_id=func_id,
+                                                 release_gil=add_async_executor, stats=stats, trace=trace,
+                                                 record=record, name_id=name_ids.get(__get_func_def(func_def))))
     result += "\n".join(code_blocks)
-    result += generate_runtime_finalize(pretty_print=pretty_print)
+    result += generate_runtime_finalize(pretty_print=pretty_print, add_async_executor=add_async_executor,
+                                       add_stats=stats, add_trace=trace, add_record=record)
+    if trace:
+        result += generate_runtime_set_sim_time(pretty_print=pretty_print)
+    if add_class:
+        result += generate_runtime_live_objects(pretty_print=pretty_print)
     result += "}\n"
 
     # notice that if there is classes involved, we also need to generate the class implementation
@@ -656,25 +1519,244 @@ def generate_pybind_code(func_defs: List[Union[type, DPIFunctionCall]], pretty_p
     return result
 
 
+def get_model_filename(build_dir: str, lib_name: str):
+    return os.path.join(build_dir, "{0}_model.py".format(lib_name))
+
+
+def __check_remote_func_defs(func_defs, runtime: Runtime):
+    for func_def in func_defs:
+        assert not isinstance(func_def, DPIImportFunction), \
+            "Importing SV functions is not supported by {0} runtime".format(runtime.name)
+        func_def = __get_func_def(func_def)
+        assert not (__is_batch(func_def) or __is_async(func_def)), \
+            "Function {0} cannot be batched or async with {1} runtime".format(func_def.base_name, runtime.name)
+        for arg_type in func_def.arg_types.values():
+            assert not __is_array(arg_type), "Array type is not supported by {0} runtime".format(runtime.name)
+            assert not __is_vector(arg_type), "Packed vector is not supported by {0} runtime".format(runtime.name)
+        for m in func_def.imports.values():
+            assert not isinstance(m, DPIImportFunction), \
+                "Importing SV functions is not supported by {0} runtime".format(runtime.name)
+
+
+def __get_model_entry(func_def: Function):
+    return_object = func_def.return_type == DataType.Object
+    if func_def.parent_class is not None and not func_def.is_init:
+        if func_def.base_name == __PYSV_DESTROY:
+            return "(DESTROY, None, False)"
+        return '(METHOD, "{0}", {1})'.format(func_def.base_name, return_object)
+    if func_def.is_init:
+        return "(INIT, {0}, True)".format(__get_python_name(func_def))
+    return "(FUNCTION, {0}, {1})".format(__get_python_name(func_def), return_object)
+
+
+def generate_model_src(func_defs: List[Union[type, DPIFunctionCall]]):
+    """Python module loaded by the model server. FUNCTIONS is indexed by the function id used
+    in the generated library"""
+    __initialize_class_defs(func_defs)
+    func_defs = make_unique_func_defs(func_defs)
+    new_defs = __get_func_defs(func_defs)
+    func_ids = __get_function_ids(new_defs)
+    entries = [""] * len(func_ids)
+    imports = {}
+    sources = []
+    for func_def in new_defs:
+        func_def = __get_func_def(func_def)
+        entries[func_ids[__get_function_def_key(func_def)]] = __get_model_entry(func_def)
+        if not __use_function_def(func_def):
+            continue
+        py_src = func_def.get_func_src(False)
+        for n, m in func_def.imports.items():
+            if should_import(n, py_src):
+                imports.setdefault(n, m)
+        sources.append(get_python_src(func_def))
+    result = "from pysv.server import import_module, FUNCTION, INIT, METHOD, DESTROY\n"
+    for n, m in imports.items():
+        result += '{0} = import_module("{1}")\n'.format(n, m)
+    for src in sources:
+        result += "\n\n" + src.strip() + "\n"
+    result += "\n\nFUNCTIONS = [\n"
+    for entry in entries:
+        result += __INDENTATION * 2 + entry + ",\n"
+    result += "]\n"
+    return result
+
+
+def get_function_defs(func_defs: List[Union[type, DPIFunctionCall]]):
+    """Function definitions indexed by the function id used in the generated library, along with their
+    names in the function table"""
+    __initialize_class_defs(func_defs)
+    func_defs = make_unique_func_defs(func_defs)
+    func_ids = __get_function_ids(__get_func_defs(func_defs))
+    return [(__get_function_name(func_def), func_def) for func_def in func_ids]
+
+
+def __get_remote_writer(data_type: DataType):
+    if data_type == DataType.Bit:
+        return "write_bool"
+    elif data_type in {DataType.Byte, DataType.ShortInt, DataType.Int, DataType.LongInt}:
+        return "write_int"
+    elif data_type in {DataType.UByte, DataType.UShortInt, DataType.UInt, DataType.ULongInt}:
+        return "write_uint"
+    elif data_type in {DataType.Float, DataType.Double}:
+        return "write_double"
+    elif data_type == DataType.String:
+        return "write_string"
+    elif data_type == DataType.Object:
+        return "write_object"
+    else:
+        raise ValueError(data_type)
+
+
+def __get_remote_reader(data_type: DataType):
+    if data_type == DataType.Bit:
+        return "response.read_bit()"
+    elif data_type == DataType.Double:
+        return "response.read_double()"
+    elif data_type == DataType.Float:
+        return "static_cast<float>(response.read_double())"
+    elif data_type == DataType.String:
+        return "response.read_string()"
+    elif data_type == DataType.Object:
+        return "response.read_object()"
+    else:
+        return "static_cast<{0}>(response.read_integer())".format(get_c_type_str(data_type))
+
+
+def generate_remote_execute_code(func_def: Union[Function, DPIFunctionCall], func_id: int = 0):
+    func_def = __get_func_def(func_def)
+    result = __INDENTATION + "auto &client = {0}();\n".format(__GET_REMOTE_CLIENT)
+    # calls without any result are buffered and don't wait for the model server
+    has_result = __has_return_value(func_def)
+    result += __INDENTATION + "client.begin({0}, {1});\n".format("REMOTE_CALL" if has_result else "REMOTE_POST",
+                                                                  func_id)
+    for idx, name in enumerate(func_def.arg_names):
+        if func_def.is_init and idx == 0:
+            # the object is created by the server
+            continue
+        result += __INDENTATION + "client.{0}({1});\n".format(__get_remote_writer(func_def.arg_types[name]), name)
+    if has_result:
+        result += __INDENTATION + "auto response = client.call();\n"
+        result += generate_remote_return_value(func_def, cache=__is_cached(func_def))
+    else:
+        result += __INDENTATION + "client.post();\n"
+    return result
+
+
+def generate_remote_return_value(func_def: Union[Function, DPIFunctionCall], cache: bool = False):
+    func_def = __get_func_def(func_def)
+    result = ""
+    return_type = func_def.return_type
+    if return_type == DataType.Void:
+        outputs = func_def.output_names
+        if len(outputs) > 1:
+            result += __INDENTATION + "response.read_tuple({0});\n".format(len(outputs))
+        for name in outputs:
+            result += __INDENTATION + "*{0} = {1};\n".format(name, __get_remote_reader(func_def.arg_types[name]))
+    elif return_type == DataType.String:
+        result += __INDENTATION + "{0} = {1};\n".format(__GLOBAL_STRING_VAR_NAME, __get_remote_reader(return_type))
+        result += __INDENTATION + "return {0}.c_str();\n".format(__GLOBAL_STRING_VAR_NAME)
+    elif cache:
+        result += __INDENTATION + "auto c_result = {0};\n".format(__get_remote_reader(return_type))
+        result += generate_cache_update(func_def, "c_result")
+        result += __INDENTATION + "return c_result;\n"
+    else:
+        result += __INDENTATION + "return {0};\n".format(__get_remote_reader(return_type))
+    return result
+
+
+def generate_remote_cxx_function(func_def: Union[Function, DPIFunctionCall], pretty_print: bool = True,
+                                 func_id: int = 0):
+    result = get_c_function_signature(func_def, pretty_print) + " {\n"
+    if __is_cache(func_def):
+        result += generate_cache_control(func_def)
+    elif __is_tabulated(func_def):
+        result += generate_table_lookup(func_def)
+    else:
+        # a cache hit doesn't go to the model server
+        if __is_cached(func_def):
+            result += generate_cache_lookup(func_def)
+        result += generate_remote_execute_code(func_def, func_id)
+    result += "}\n"
+    return result
+
+
+def generate_model_server_values(lib_name: str, build_dir: str):
+    # the model server uses the same interpreter and packages as the code generator
+    pysv_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    python_path = [p for p in sys.path if p] + [pysv_dir, build_dir]
+    result = 'constexpr const char *PYTHON_EXECUTABLE = "{0}";\n'.format(sys.executable)
+    result += 'constexpr const char *MODEL_FILENAME = "{0}";\n'.format(get_model_filename(build_dir, lib_name))
+    result += 'constexpr const char *PYTHON_PATH = "{0}";\n'.format(os.pathsep.join(python_path))
+    return result
+
+
+def generate_remote_bootstrap_code(runtime: Runtime, lib_name: str, build_dir: str, server_address: str = ""):
+    result = __get_code_snippet("remote_header.hh")
+    result += generate_model_server_values(lib_name, build_dir)
+    result += __get_code_snippet("model_server.cc")
+    if runtime == Runtime.SharedMemory:
+        result += __get_code_snippet("shm_transport.cc")
+    elif runtime == Runtime.Socket:
+        # if not set, a local model server is started
+        result += 'constexpr const char *SERVER_ADDRESS = "{0}";\n'.format(server_address)
+        result += __get_code_snippet("socket_transport.cc")
+    else:
+        raise NotImplementedError(runtime)
+    result += __get_code_snippet("remote_client.cc")
+    return result
+
+
+def generate_remote_code(func_defs: List[Union[type, DPIFunctionCall]], pretty_print: bool = True,
+                         namespace: str = "pysv", build_dir: str = "", runtime: Runtime = Runtime.SharedMemory,
+                         server_address: str = ""):
+    assert build_dir, "build_dir not set for {0} runtime".format(runtime.name)
+    add_class = should_add_class(func_defs)
+    new_defs = __get_func_defs(func_defs)
+    __check_remote_func_defs(new_defs, runtime)
+    if runtime == Runtime.SharedMemory:
+        check_shm_machine()
+    func_ids = __get_function_ids(new_defs)
+    result = generate_remote_bootstrap_code(runtime, namespace, build_dir, server_address) + "\n"
+    result += generate_cache_definitions(new_defs)
+    result += generate_table_definitions(new_defs)
+    result += 'extern "C" {\n'
+    code_blocks = []
+    for func_def in new_defs:
+        func_id = func_ids[__get_function_def_key(func_def)]
+        code_blocks.append(generate_remote_cxx_function(func_def, pretty_print=pretty_print, func_id=func_id))
+    result += "\n".join(code_blocks)
+    result += get_c_function_signature(pysv_finalize, pretty_print) + " {\n"
+    result += __get_code_snippet("remote_finalize.cc")
+    result += "}\n"
+    if add_class:
+        result += get_c_function_signature(pysv_live_objects, pretty_print) + " {\n"
+        result += __get_code_snippet("remote_live_objects.cc")
+        result += "}\n"
+    result += "}\n"
+
+    if add_class:
+        result += generate_cxx_binding(func_defs, pretty_print=pretty_print, include_implementation=True,
+                                       namespace=namespace)
+
+    return result
+
+
 def generate_c_header(func_def: Union[Function, DPIFunctionCall], pretty_print: bool = True):
     return get_c_function_signature(func_def, pretty_print=pretty_print,
                                     include_attribute=False) + ";"
 
 
-def generate_c_headers(func_defs, pretty_print: bool = True):
+def generate_c_headers(func_defs, pretty_print: bool = True, trace: bool = False):
     headers = []
-    # finalize is a built-in function
-    if pysv_finalize not in func_defs:
-        func_defs = func_defs + [pysv_finalize]
+    func_defs = __add_runtime_functions(func_defs, trace)
     func_defs = make_unique_func_defs(func_defs)
-    for func_def in func_defs:
-        if is_class(func_def):
-            funcs = get_dpi_functions(func_def)
-            for f in funcs:
-                headers.append(generate_c_header(f, pretty_print))
-        else:
-            headers.append(generate_c_header(func_def, pretty_print))
+    for func_def in __get_func_defs(func_defs):
+        headers.append(generate_c_header(func_def, pretty_print))
     result = "#include <iostream>\n"
+    if __should_include_buffer_impl(func_defs) or __should_include_batch_impl(func_defs) or \
+            __should_include_vector_impl(func_defs) or __get_struct_types(func_defs):
+        # open array handle and packed vector types
+        result += '#include "svdpi.h"\n'
     result += 'extern "C" {\n'
     result += "\n".join(headers)
     result += "\n}\n"
@@ -878,8 +1960,20 @@ def generate_sv_class(func_def, pretty_print: bool = True, ref_ctor: bool = Fals
     return result
 
 
+def generate_sv_struct_definitions(func_defs, pretty_print: bool = True):
+    result = ""
+    for struct in __get_struct_types(func_defs):
+        fields = ["{0} {1};".format(__get_dpi_data_type(t), name) for name, t in struct.fields.items()]
+        if pretty_print:
+            body = "".join(["\n" + __INDENTATION + field for field in fields]) + "\n"
+        else:
+            body = " " + " ".join(fields) + " "
+        result += "typedef struct packed {{{0}}} {1};\n".format(body, struct.name)
+    return result
+
+
 def generate_sv_binding(func_defs: List[Union[type, DPIFunctionCall]], pkg_name="", pretty_print: bool = True,
-                        filename=None):
+                        filename=None, trace: bool = False):
     if len(pkg_name) == 0:
         pkg_name = "pysv"
     guard_name = "PYSV_" + pkg_name.upper()
@@ -894,8 +1988,10 @@ def generate_sv_binding(func_defs: List[Union[type, DPIFunctionCall]], pkg_name=
     __initialize_class_defs(func_defs)
     func_defs = make_unique_func_defs(func_defs)
 
+    # structs have to be declared before they are used
+    result += generate_sv_struct_definitions(func_defs, pretty_print)
     # produce DPI imports
-    result += generate_dpi_definitions(func_defs, pretty_print)
+    result += generate_dpi_definitions(func_defs, pretty_print, trace)
 
     # generate class definition
     # test if we need to generate class
@@ -970,7 +2066,8 @@ def generate_pybind_function(func_defs: List[Union[type, DPIFunctionCall]], pret
 
 
 def generate_cxx_binding(func_defs: List[Union[type, DPIFunctionCall]], pretty_print: bool = True,
-                         filename=None, include_implementation: bool = False, namespace: str = "pysv"):
+                         filename=None, include_implementation: bool = False, namespace: str = "pysv",
+                         trace: bool = False):
     if filename is not None:
         header_name = os.path.basename(filename)
         header_name = header_name.replace(".", "_").replace("-", "_")
@@ -990,7 +2087,7 @@ def generate_cxx_binding(func_defs: List[Union[type, DPIFunctionCall]], pretty_p
 
     # need to generate the C includes
     if not include_implementation:
-        result += generate_c_headers(func_defs, pretty_print)
+        result += generate_c_headers(func_defs, pretty_print, trace)
 
     add_func_import = __should_generate_func_import(func_defs)
     if add_func_import:
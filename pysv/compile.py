@@ -1,4 +1,6 @@
-from .codegen import generate_pybind_code, generate_c_headers, generate_cxx_binding
+from .codegen import (generate_pybind_code, generate_c_headers, generate_cxx_binding, generate_model_src,
+                      get_model_filename)
+from .types import Runtime
 import subprocess
 import os
 import shutil
@@ -7,13 +9,35 @@ import filecmp
 import sys
 
 
+def __write_if_changed(filename, content):
+    if os.path.exists(filename):
+        with open(filename) as f:
+            if f.read() == content:
+                return
+    with open(filename, "w+") as f:
+        f.write(content)
+
+
 def compile_lib(func_defs, cwd, lib_name="pysv", pretty_print=True, release_build=False, clean_up_build=False,
-                add_sys_path=False):
+                add_sys_path=False, runtime=Runtime.Embedded, server_address="", stats=False,
+                trace=False, record=False, profile=False):
     """
     Compile the python code into a shared library.
     if your simulator ships with its own Python distribution, e.g. Vivado simulator, you
     need to set this to True, otherwise leave it as is and pysv will figure it out
+    runtime decides where the Python code runs. with anything other than Runtime.Embedded, the
+    Python code is written to <lib_name>_model.py and runs in a model server process
+    server_address is the default model server address for Runtime.Socket, either unix:<path> or
+    tcp:<host>:<port>. if empty, the library starts a local model server
+    stats compiles per function call counters and timing into the library. the JSON report is written to
+    $PYSV_STATS_FILE (pysv_stats.json by default) when pysv_finalize is called
+    trace records a timeline of the DPI calls into per-thread ring buffers. the Chrome trace JSON is written to
+    $PYSV_TRACE_FILE (pysv_trace.json by default) when pysv_finalize is called
+    record logs every DPI call to $PYSV_RECORD_FILE (pysv_record.bin by default), which can be replayed without
+    the simulator
+    profile compiles the profiler into the library, which is started by setting $PYSV_PROFILE
     """
+    assert not server_address or runtime == Runtime.Socket, "server_address is only used by socket runtime"
     if not os.path.isdir(cwd):
         os.makedirs(cwd, exist_ok=True)
     # follow the "lib" + name convention so the linker can find the library easily
@@ -37,18 +61,15 @@ def compile_lib(func_defs, cwd, lib_name="pysv", pretty_print=True, release_buil
         shutil.copyfile(cmake_file, dst_cmake)
 
     # codegen the target
+    output_dir = os.path.realpath(cwd)
     src = generate_pybind_code(func_defs, pretty_print, add_sys_path=add_sys_path, namespace=lib_name,
-                               build_dir=os.path.realpath(cwd))
-    output_filename = os.path.join(cwd, "{0}.cc".format(lib_name))
-    skip_write_out = False
-    if os.path.exists(output_filename):
-        with open(output_filename) as f:
-            content = f.read()
-            if content == src:
-                skip_write_out = True
-    if not skip_write_out:
-        with open(os.path.join(cwd, "{0}.cc".format(lib_name)), "w+") as f:
-            f.write(src)
+                               build_dir=output_dir, runtime=runtime, server_address=server_address, stats=stats,
+                               trace=trace, record=record, profile=profile)
+    __write_if_changed(os.path.join(cwd, "{0}.cc".format(lib_name)), src)
+    embed_python = runtime == Runtime.Embedded
+    if not embed_python:
+        # the model server loads the python code from the build directory
+        __write_if_changed(get_model_filename(output_dir, lib_name), generate_model_src(func_defs))
 
     # need to run cmake command
     build_dir = os.path.join(cwd, "build")
@@ -63,6 +84,10 @@ def compile_lib(func_defs, cwd, lib_name="pysv", pretty_print=True, release_buil
         cmake_args.append("-DCMAKE_BUILD_TYPE=" + build_type)
     # add header definition
     cmake_args.append("-DDPI_HEADER_DIR=" + vlstd_path)
+    # the library doesn't link against python when the model runs in its own process
+    cmake_args.append("-DEMBED_PYTHON=" + ("ON" if embed_python else "OFF"))
+    # the call log is compressed with zlib if it is available
+    cmake_args.append("-DRECORD_CALLS=" + ("ON" if record else "OFF"))
     # tell cmake where to find python (in case it's not in the system path)
     cmake_args.append("-DPython_EXECUTABLE:FILEPATH=" + sys.executable)
     subprocess.check_call(["cmake"] + cmake_args + [".."],
@@ -103,12 +128,13 @@ def __get_cxx_compiler():  # pragma: no cover
         raise ValueError("Unable to find C++ compiler")
 
 
-def compile_and_run(lib_path, cxx_content, cwd, func_defs, extra_headers="", use_implementation=False):
+def compile_and_run(lib_path, cxx_content, cwd, func_defs, extra_headers="", use_implementation=False,
+                    trace=False):
     """Used for testing or simple C++ code. Returns captured stdout"""
     if use_implementation:
-        headers = generate_cxx_binding(func_defs)
+        headers = generate_cxx_binding(func_defs, trace=trace)
     else:
-        headers = generate_c_headers(func_defs)
+        headers = generate_c_headers(func_defs, trace=trace)
     headers += "\n" + extra_headers + "\n"
     # write out the file
     filename = os.path.join(cwd, "test_cxx.cc")
@@ -122,7 +148,9 @@ def compile_and_run(lib_path, cxx_content, cwd, func_defs, extra_headers="", use
     # need to figure out the system CXX compiler
     # this is not portable but good enough
     cxx = __get_cxx_compiler()
-    args = [cxx, filename, lib_path, f"-Wl,-rpath,{os.path.dirname(lib_path)}",
+    # DPI header is needed for open array types
+    vlstd_path = os.path.join(os.path.dirname(__file__), "extern", "vlstd")
+    args = [cxx, filename, lib_path, f"-Wl,-rpath,{os.path.dirname(lib_path)}", "-I" + vlstd_path,
             "-o", os.path.join(cwd, "test_cxx"), "-std=c++11"]
     print(" ".join(args))
     subprocess.check_call(args)
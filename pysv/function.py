@@ -1,7 +1,7 @@
 import inspect
 import abc
 from typing import Dict, List, Union, Callable
-from .types import DataType, Reference
+from .types import DataType, Reference, Batch, Async, Table, BitVector, Struct, StructArray, ArrayType
 from .frame import _inspect_frame, _get_import_name
 from .pyast import get_function_src, get_class_src, has_return
 
@@ -23,17 +23,26 @@ class Function:
         self.__func_name = ""
         self.arg_names: List[str] = []
         self.output_names: List[str] = []
-        self.arg_types: Dict[str, DataType] = {}
+        # output arrays that are also read by the function
+        self.inout_names: List[str] = []
+        # Python function parameters in order. output arrays are passed in as parameters as well
+        self.param_names: List[str] = []
+        self.arg_types: Dict[str, Union[DataType, ArrayType, BitVector, StructArray]] = {}
         self.return_type = DataType.Void
         self.parent_class: Union[type, None] = None
 
         # only used for init function
         self.is_init = False
+        # static methods don't take the object, even though they are called through it
+        self.is_static = False
 
         # for class reference in args and return type
         self.arg_obj_ref = {}
         self.return_obj_ref = None
 
+        # extra DPI functions generated from this one, e.g. batched or asynchronous calls
+        self.variants: List[Function] = []
+
     @abc.abstractmethod
     def get_func_src(self, check_sv_decorator=True):
         pass
@@ -50,11 +59,32 @@ class Function:
 
 
 class DPIFunction(Function):
-    def __init__(self, return_type: Union[DataType, type, Reference] = DataType.Int, imports=None, **arg_types):
+    # output that holds the return value when it cannot be returned through DPI
+    RESULT_NAME = "result"
+
+    def __init__(self, return_type: Union[DataType, BitVector, type, Reference] = DataType.Int, imports=None,
+                 batch: Union[bool, Batch, None] = None, run_async: Union[bool, Async, None] = None, cache: int = 0,
+                 table: Union[bool, Table, None] = None, const: bool = False, **arg_types):
         super().__init__()
         self.func = None
-        if not isinstance(return_type, DataType) and not isinstance(return_type, type) and not isinstance(return_type,
-                                                                                                          Reference):
+        if batch is True:
+            batch = Batch.Loop
+        assert batch in {None, False} or isinstance(batch, Batch), "Invalid batch mode " + str(batch)
+        self.batch_mode = batch if batch else None
+        if run_async is True:
+            run_async = Async()
+        assert run_async in {None, False} or isinstance(run_async, Async), "Invalid async config " + str(run_async)
+        self.async_config = run_async if run_async else None
+        assert isinstance(cache, int) and cache >= 0, "Invalid cache size " + str(cache)
+        # number of results kept by the LRU cache in the generated code
+        self.cache_size = cache
+        if table is True:
+            table = Table()
+        assert table in {None, False} or isinstance(table, Table), "Invalid table config " + str(table)
+        self.table_config = table if table else None
+        # constant functions are evaluated when the SystemVerilog package is generated
+        self.is_const = const
+        if not isinstance(return_type, (DataType, ArrayType, BitVector, type, Reference)):
             # someone didn't use preferred (). luckily we still support it
             assert hasattr(return_type, "__name__"), "Function does not have __name__"
             self.__call__(return_type)
@@ -63,11 +93,17 @@ class DPIFunction(Function):
             # compute output names
             if isinstance(return_type, Reference):
                 for arg_name, arg_type in return_type.kwargs.items():
-                    assert isinstance(arg_type, DataType) and arg_type not in {DataType.Void, DataType.Object}
+                    assert isinstance(arg_type, (DataType, ArrayType, BitVector, StructArray))
+                    assert arg_type not in {DataType.Void, DataType.Object}
                     self.output_names.append(arg_name)
                     self.arg_types[arg_name] = arg_type
+            elif isinstance(return_type, BitVector):
+                # DPI functions cannot return packed vectors, so the value is written to an output instead
+                self.output_names.append(self.RESULT_NAME)
+                self.arg_types[self.RESULT_NAME] = return_type
+                self.return_type = DataType.Void
             assert isinstance(self.return_type, DataType), "Return type has to be of " + DataType.__name__
-            assert self.return_type != DataType.IntArray, "Returning an array is not supported"
+            assert not self.return_type.is_array(), "Returning an array is not supported"
         if imports is None:
             self.imports = _inspect_frame()
         else:
@@ -79,13 +115,17 @@ class DPIFunction(Function):
 
         # check arg types
         for t in arg_types.values():
-            assert isinstance(t, (DataType, type))
+            assert isinstance(t, (DataType, ArrayType, BitVector, StructArray, type))
         for name, t in arg_types.items():
             t = self.__check_arg_type(name, t)
+            if name in self.output_names and t.is_array() and self.arg_types[name] == t:
+                # array that is both an input and an output
+                self.inout_names.append(name)
+                continue
             assert name not in self.arg_types, "Invalid arg name " + name
             self.arg_types[name] = t
         for t in self.arg_types.values():
-            assert isinstance(t, DataType)
+            assert isinstance(t, (DataType, ArrayType, BitVector, StructArray))
             assert t != DataType.Void, str(DataType.Void) + " can only used as return type"
 
     def __call__(self, fn):
@@ -95,11 +135,19 @@ class DPIFunction(Function):
         signature = inspect.signature(fn)
         params = signature.parameters
         for name in params:
+            self.param_names.append(name)
+            if name in self.output_names and self.arg_types[name].is_array():
+                # output arrays are filled in place and generated after the inputs
+                continue
+            assert name not in self.output_names, "Argument {0} has the same name as an output".format(name)
             # currently default value not supported
             if name not in self.arg_types:
                 self.arg_types[name] = DataType.Int
             # arg ordering
             self.arg_names.append(name)
+        for name in self.output_names:
+            if self.arg_types[name].is_array():
+                assert name in params, "Output array {0} has to be an argument of {1}".format(name, fn.__name__)
         if fn.__name__ == "__init__":
             # Verilator doesn't like double underscore
             # need to rename it
@@ -112,8 +160,42 @@ class DPIFunction(Function):
         if self.return_type == DataType.Int and not has_return(fn):
             self.return_type = DataType.Void
 
+        if self.batch_mode is not None:
+            self.variants.append(DPIBatchFunction(self, self.batch_mode))
+        if self.async_config is not None:
+            for stage in DPIAsyncFunction.STAGES:
+                self.variants.append(DPIAsyncFunction(self, self.async_config, stage))
+        if self.cache_size:
+            for stage in DPICacheFunction.STAGES:
+                self.variants.append(DPICacheFunction(self, stage))
+        if self.table_config is not None:
+            self.__check_table()
+        if self.is_const:
+            self.__check_const()
+
         return DPIFunctionCall(self)
 
+    def __check_table(self):
+        assert not self.cache_size, "Function cannot be both cached and tabulated"
+        assert not self.output_names, "Tabulated function cannot have outputs"
+        assert self.return_type in DPIBatchFunction.ELEMENT_TYPES, "Tabulated function has to return a scalar value"
+        num_entries = 1
+        for name in self.arg_names:
+            t = self.arg_types[name]
+            assert t in Table.DOMAIN_WIDTHS, "{0} ({1}) cannot be tabulated".format(name, t)
+            num_entries <<= Table.DOMAIN_WIDTHS[t]
+        assert num_entries <= self.table_config.max_entries, \
+            "Table of {0} has {1} entries, more than the limit of {2}".format(self.base_name, num_entries,
+                                                                              self.table_config.max_entries)
+
+    def __check_const(self):
+        assert not self.arg_names, "Constant function {0} cannot have arguments".format(self.base_name)
+        assert not self.output_names, "Constant function cannot have outputs"
+        assert self.return_type in DPIBatchFunction.ELEMENT_TYPES or self.return_type == DataType.String, \
+            "Constant function has to return a scalar value or a string"
+        assert not self.variants and not self.cache_size and self.table_config is None, \
+            "Constant function cannot be batched, async, cached or tabulated"
+
     def __check_arg_type(self, arg_name, arg_type):
         if isinstance(arg_type, type):
             if arg_name:
@@ -164,9 +246,116 @@ class DPIFunction(Function):
 sv = DPIFunction
 
 
+class DPIVariantFunction(Function):
+    """Extra DPI function generated from an exported function. It calls the same Python function
+    """
+    def __init__(self, func_def: DPIFunction, suffix: str):
+        super().__init__()
+        self.scalar_def = func_def
+        self.suffix = suffix
+        self.imports = func_def.imports
+
+    def get_func_src(self, check_sv_decorator: bool = True):
+        return self.scalar_def.get_func_src(check_sv_decorator)
+
+    @property
+    def func_name(self):
+        return self.scalar_def.func_name + self.suffix
+
+    @property
+    def base_name(self):
+        return self.scalar_def.base_name
+
+
+class DPIBatchFunction(DPIVariantFunction):
+    """Batched variant of a DPI function. Each argument and output becomes an open array
+    and all the elements are processed within a single DPI call
+    """
+    RESULT_NAME = "result"
+    ELEMENT_TYPES = {DataType.Bit, DataType.Byte, DataType.ShortInt, DataType.Int, DataType.LongInt, DataType.UByte,
+                     DataType.UShortInt, DataType.UInt, DataType.ULongInt, DataType.Float, DataType.Double}
+
+    def __init__(self, func_def: DPIFunction, mode: Batch):
+        super().__init__(func_def, "_batch")
+        self.mode = mode
+        self.arg_names = func_def.arg_names.copy()
+        self.output_names = func_def.output_names.copy()
+        self.arg_types = func_def.arg_types.copy()
+        # scalar return value is written to an output array instead
+        if func_def.return_type != DataType.Void:
+            assert self.RESULT_NAME not in self.arg_types, \
+                'Batched function cannot have an argument called "{0}"'.format(self.RESULT_NAME)
+            self.output_names.append(self.RESULT_NAME)
+            self.arg_types[self.RESULT_NAME] = func_def.return_type
+        assert len(self.arg_names) + len(self.output_names) > 0, "Batched function requires at least one argument"
+        for name, t in self.arg_types.items():
+            assert t in self.ELEMENT_TYPES, "{0} ({1}) cannot be batched".format(name, t)
+
+
+class DPIAsyncFunction(DPIVariantFunction):
+    """One stage of an asynchronous call to a DPI function. submit queues the call and returns a ticket,
+    which is used to poll and wait for the result
+    """
+    SUBMIT = "_submit"
+    POLL = "_poll"
+    WAIT = "_wait"
+    STAGES = (SUBMIT, POLL, WAIT)
+    TICKET_NAME = "ticket"
+
+    def __init__(self, func_def: DPIFunction, config: Async, stage: str):
+        super().__init__(func_def, stage)
+        assert not func_def.has_obj_ref(), "Function with class references cannot be async"
+        assert not any(t.is_array() for t in func_def.arg_types.values()), "Function with arrays cannot be async"
+        # structs refer to the simulator memory, which is only valid during the call
+        assert not any(isinstance(t, Struct) for t in func_def.arg_types.values()), \
+            "Function with structs cannot be async"
+        self.config = config
+        self.stage = stage
+        if stage == self.SUBMIT:
+            self.arg_names = func_def.arg_names.copy()
+            self.arg_types = {name: func_def.arg_types[name] for name in self.arg_names}
+            self.return_type = DataType.LongInt
+        else:
+            assert self.TICKET_NAME not in func_def.output_names, \
+                'Async function cannot have an output called "{0}"'.format(self.TICKET_NAME)
+            self.arg_names = [self.TICKET_NAME]
+            self.arg_types = {self.TICKET_NAME: DataType.LongInt}
+            if stage == self.POLL:
+                self.return_type = DataType.Bit
+            else:
+                # same return value as the function itself
+                self.return_type = func_def.return_type
+                self.output_names = func_def.output_names.copy()
+                for name in self.output_names:
+                    self.arg_types[name] = func_def.arg_types[name]
+
+
+class DPICacheFunction(DPIVariantFunction):
+    """Control function of the LRU cache in front of a pure DPI function. clear drops the cached results,
+    while hits and misses return the counters
+    """
+    CLEAR = "_cache_clear"
+    HITS = "_cache_hits"
+    MISSES = "_cache_misses"
+    STAGES = (CLEAR, HITS, MISSES)
+    # arguments are packed into the cache key, so they have to be plain values
+    KEY_TYPES = DPIBatchFunction.ELEMENT_TYPES
+
+    def __init__(self, func_def: DPIFunction, stage: str):
+        super().__init__(func_def, stage)
+        for name, t in func_def.arg_types.items():
+            assert t in self.KEY_TYPES, "{0} ({1}) cannot be cached".format(name, t)
+        assert func_def.return_type in self.KEY_TYPES, "Cached function has to return a scalar value"
+        assert not func_def.output_names, "Cached function cannot have outputs"
+        self.stage = stage
+        self.return_type = DataType.Void if stage == self.CLEAR else DataType.LongInt
+
+
 class DPIImportFunction(DPIFunction):
     def __init__(self, return_type: Union[DataType, type, Reference] = DataType.Int, **arg_types):
         super().__init__(return_type, **arg_types)
+        assert not any(isinstance(t, BitVector) for t in self.arg_types.values()), \
+            "Imported SV function cannot have packed vectors"
 
 
 # aliasing
@@ -200,7 +389,7 @@ class DPIFunctionCall:
             raise ValueError("Imported DPI function cannot be called directly from Python")
         if DPIFunctionCall.RUN_FUNCTION:
             # need to be extra careful about class methods
-            if self.func_def.parent_class is not None:
+            if self.func_def.parent_class is not None and not self.func_def.is_static:
                 return self.func_def.func(self.func_def.parent_class, *args, **kwargs)
             else:
                 return self.func_def.func(*args, **kwargs)
@@ -3,9 +3,30 @@ from .function import DPIFunctionCall, DPIFunction
 from .types import DataType
 from .util import is_class
 
+# argument that holds the object handle of static methods
+STATIC_HANDLE_NAME = "self"
+
+
+def _get_class_attr(cls: type, name: str):
+    attr = inspect.getattr_static(cls, name)
+    if not isinstance(attr, (staticmethod, classmethod)) or not isinstance(attr.__func__, DPIFunctionCall):
+        return getattr(cls, name)
+    # the descriptors of static and class methods don't return the exported function
+    call = attr.__func__
+    func_def = call.func_def
+    func_def.parent_class = cls
+    if isinstance(attr, staticmethod) and not func_def.is_static:
+        # static methods are still called through the object, which is passed in as a hidden handle
+        assert STATIC_HANDLE_NAME not in func_def.param_names, \
+            "Static method {0} cannot have an argument named {1}".format(func_def.base_name, STATIC_HANDLE_NAME)
+        func_def.is_static = True
+        func_def.arg_names.insert(0, STATIC_HANDLE_NAME)
+        func_def.param_names.insert(0, STATIC_HANDLE_NAME)
+    return call
+
 
 def get_dpi_functions(cls: type):
-    attrs = [getattr(cls, a) for a in dir(cls)]
+    attrs = [_get_class_attr(cls, a) for a in dir(cls)]
     result = []
     for attr in attrs:
         if isinstance(attr, DPIFunctionCall):
@@ -53,6 +74,8 @@ def check_class_method(cls: type):
     for func_def in func_defs:
         assert func_def.func_def.base_name[0] != "_", "Protected/Private methods not allowed to " \
                                                       "be exported to SystemVerilog"
+        assert len(func_def.func_def.variants) == 0, "Class method {0} cannot be batched, async or cached".format(
+            func_def.func_def.func_name)
 
 
 def inject_destructor(cls: type):
@@ -0,0 +1,458 @@
+"""
+Replay of the DPI calls recorded by a library compiled with compile_lib(record=True). The calls are
+streamed back into the exported Python functions and classes without the simulator:
+    result = replay("pysv_record.bin", [func, SomeClass])
+    assert not result.mismatches
+The Python code runs the same way as in the out-of-process runtimes, and objects are rebuilt through
+their constructors, so the recorded handles refer to the replayed objects.
+"""
+import mmap
+import struct
+import traceback
+import zlib
+from typing import List, Union
+from .codegen import generate_model_src, get_function_defs
+from .function import DPIFunctionCall
+from .server import ObjectHandle, METHOD, DESTROY
+from .types import DataType, BitVector, Struct
+
+# needs to match record_impl.cc
+RECORD_MAGIC = b"PYSVREC1"
+RECORD_CALL = 1
+RECORD_FINALIZE = 2
+RECORD_RAW = 0
+RECORD_ZLIB = 1
+TAG_INT = 1
+TAG_UINT = 2
+TAG_FLOAT = 3
+TAG_STRING = 4
+TAG_HANDLE = 5
+TAG_ARRAY = 6
+TAG_BITS = 7
+TAG_SHAPE = 8
+
+_U32 = struct.Struct("<I")
+_I64 = struct.Struct("<q")
+_U64 = struct.Struct("<Q")
+_F64 = struct.Struct("<d")
+_CALL_HEADER = struct.Struct("<IBB")
+_CHUNK_HEADER = struct.Struct("<BII")
+
+
+class ReplayError(Exception):
+    pass
+
+
+class RecordedCall:
+    """A DPI call read from the log. index counts the calls from the start of the log"""
+
+    def __init__(self, index, func_id, error, args, results):
+        self.index = index
+        self.func_id = func_id
+        self.error = error
+        self.args = args
+        self.results = results
+
+
+class Mismatch:
+    def __init__(self, index, function, expected, actual):
+        self.index = index
+        self.function = function
+        self.expected = expected
+        self.actual = actual
+
+    def __repr__(self):
+        return "Mismatch(call {0} to {1}: expected {2}, got {3})".format(self.index, self.function, self.expected,
+                                                                        self.actual)
+
+
+class ReplayResult:
+    def __init__(self, calls=0, mismatches=None):
+        self.calls = calls
+        self.mismatches = mismatches if mismatches is not None else []
+
+    def merge(self, other):
+        self.calls += other.calls
+        self.mismatches = sorted(self.mismatches + other.mismatches, key=lambda m: m.index)
+
+
+def _decode_value(data, pos):
+    tag = data[pos]
+    pos += 1
+    if tag == TAG_INT:
+        return _I64.unpack_from(data, pos)[0], pos + 8
+    elif tag == TAG_UINT:
+        return _U64.unpack_from(data, pos)[0], pos + 8
+    elif tag == TAG_FLOAT:
+        return _F64.unpack_from(data, pos)[0], pos + 8
+    elif tag == TAG_STRING:
+        size = _U32.unpack_from(data, pos)[0]
+        pos += 4
+        return bytes(data[pos:pos + size]).decode("utf-8"), pos + size
+    elif tag == TAG_HANDLE:
+        return ObjectHandle(_U64.unpack_from(data, pos)[0]), pos + 8
+    elif tag == TAG_BITS:
+        width = _U32.unpack_from(data, pos)[0]
+        pos += 4
+        size = (width + 31) // 32 * 4
+        return int.from_bytes(data[pos:pos + size], "little"), pos + size
+    elif tag in (TAG_ARRAY, TAG_SHAPE):
+        import numpy
+        itemsize = _U32.unpack_from(data, pos)[0]
+        size = data[pos + 4]
+        pos += 5
+        fmt = bytes(data[pos:pos + size]).decode("ascii")
+        pos += size
+        dim = data[pos]
+        pos += 1
+        shape = struct.unpack_from("<{0}Q".format(dim), data, pos)
+        pos += 8 * dim
+        count = 1
+        for s in shape:
+            count *= s
+        # struct arrays are read as raw items, which are viewed with the struct type later on
+        dtype = numpy.dtype("V{0}".format(itemsize) if fmt == "V" else fmt)
+        if tag == TAG_SHAPE:
+            # only the shape of output arrays is recorded, since the python code writes their content
+            return numpy.zeros(shape, dtype=dtype), pos
+        array = numpy.frombuffer(data, dtype=dtype, count=count, offset=pos).reshape(shape)
+        return array, pos + count * itemsize
+    raise ReplayError("Unknown value tag {0}".format(tag))
+
+
+def _decode_values(data, pos):
+    num_values = data[pos]
+    pos += 1
+    values = []
+    for _ in range(num_values):
+        value, pos = _decode_value(data, pos)
+        values.append(value)
+    return values, pos
+
+
+class RecordReader:
+    """Reads the log lazily, one chunk at a time. The file is memory mapped, so only the chunk being
+    decoded is held in memory. Iterating yields a RecordedCall for every call, and None where the runtime
+    is finalized"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            header = f.read(len(RECORD_MAGIC) + _U32.size)
+            if header[:len(RECORD_MAGIC)] != RECORD_MAGIC:
+                raise ReplayError("{0} is not a pysv record file".format(filename))
+            num_functions = _U32.unpack_from(header, len(RECORD_MAGIC))[0]
+            self.function_names = []
+            for _ in range(num_functions):
+                size = _U32.unpack(f.read(_U32.size))[0]
+                self.function_names.append(f.read(size).decode("utf-8"))
+            self.__data_offset = f.tell()
+
+    def chunks(self):
+        with open(self.filename, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                pos = self.__data_offset
+                while pos + _CHUNK_HEADER.size <= len(data):
+                    codec, raw_size, size = _CHUNK_HEADER.unpack_from(data, pos)
+                    pos += _CHUNK_HEADER.size
+                    if pos + size > len(data):
+                        # the simulator stopped in the middle of a write
+                        break
+                    chunk = data[pos:pos + size]
+                    pos += size
+                    if codec == RECORD_ZLIB:
+                        chunk = zlib.decompress(chunk)
+                    elif codec != RECORD_RAW:
+                        raise ReplayError("Unknown chunk codec {0}".format(codec))
+                    if len(chunk) != raw_size:
+                        raise ReplayError("Corrupted chunk at offset {0}".format(pos - size))
+                    yield chunk
+
+    def __iter__(self):
+        index = 0
+        for chunk in self.chunks():
+            # calls never span chunks
+            pos = 0
+            while pos < len(chunk):
+                kind = chunk[pos]
+                pos += 1
+                if kind == RECORD_FINALIZE:
+                    yield None
+                    continue
+                if kind != RECORD_CALL:
+                    raise ReplayError("Unknown record kind {0}".format(kind))
+                func_id, error, num_args = _CALL_HEADER.unpack_from(chunk, pos)
+                pos += _CALL_HEADER.size
+                args = []
+                for _ in range(num_args):
+                    value, pos = _decode_value(chunk, pos)
+                    args.append(value)
+                results, pos = _decode_values(chunk, pos)
+                yield RecordedCall(index, func_id, error != 0, args, results)
+                index += 1
+
+
+def _to_struct(value, struct_type: Struct):
+    import numpy
+    data = value.to_bytes(struct_type.itemsize, "little")
+    return numpy.frombuffer(data, dtype=numpy.dtype(struct_type.dtype_spec()))[0]
+
+
+def _from_struct(value, struct_type: Struct):
+    import numpy
+    array = numpy.zeros(1, dtype=numpy.dtype(struct_type.dtype_spec()))
+    array[0] = value
+    return int.from_bytes(array.tobytes(), "little")
+
+
+_INT_WIDTHS = {
+    DataType.Byte: (8, True),
+    DataType.ShortInt: (16, True),
+    DataType.Int: (32, True),
+    DataType.LongInt: (64, True),
+    DataType.UByte: (8, False),
+    DataType.UShortInt: (16, False),
+    DataType.UInt: (32, False),
+    DataType.ULongInt: (64, False),
+}
+
+
+def _to_c_value(value, data_type):
+    # same conversion as the generated library, so that the results can be compared with the recorded ones
+    if isinstance(data_type, Struct):
+        return _from_struct(value, data_type)
+    elif isinstance(data_type, BitVector):
+        return int(value) & ((1 << data_type.width) - 1)
+    elif data_type == DataType.Bit:
+        return int(bool(value))
+    elif data_type in _INT_WIDTHS:
+        width, signed = _INT_WIDTHS[data_type]
+        value = int(value) & ((1 << width) - 1)
+        if signed and value >> (width - 1):
+            value -= 1 << width
+        return value
+    elif data_type == DataType.Float:
+        return struct.unpack("<f", struct.pack("<f", value))[0]
+    elif data_type == DataType.Double:
+        return float(value)
+    elif data_type == DataType.String:
+        return str(value)
+    return value
+
+
+class Replayer:
+    """Runs the recorded calls against the exported Python code. The functions are indexed by the same
+    function ids as the generated library"""
+
+    def __init__(self, func_defs: List[Union[type, DPIFunctionCall]], compare=True, max_mismatches=100):
+        table = get_function_defs(func_defs)
+        self.function_names = [name for name, _ in table]
+        self.func_defs = [func_def for _, func_def in table]
+        # the python code is loaded the same way as the model server does
+        model = {}
+        exec(compile(generate_model_src(func_defs), "<pysv model>", "exec"), model)
+        self.functions = model["FUNCTIONS"]
+        self.compare = compare
+        self.max_mismatches = max_mismatches
+        self.handles = {}
+        self.result = ReplayResult()
+
+    def check_function_names(self, names):
+        if names != self.function_names:
+            raise ReplayError("Recorded functions {0} don't match {1}".format(names, self.function_names))
+
+    def finalize(self):
+        # same as pysv_finalize, all the objects are released
+        self.handles.clear()
+
+    def __mismatch(self, call: RecordedCall, expected, actual):
+        if len(self.result.mismatches) < self.max_mismatches:
+            name = self.function_names[call.func_id]
+            self.result.mismatches.append(Mismatch(call.index, name, expected, actual))
+
+    def __get_object(self, handle):
+        if handle == 0:
+            return None
+        if handle not in self.handles:
+            raise ReplayError("Unable to find object from handle {0}".format(handle))
+        return self.handles[handle]
+
+    def __get_arg(self, value, data_type):
+        if isinstance(value, ObjectHandle):
+            return self.__get_object(value)
+        if data_type.is_array():
+            element_type = data_type.element_type
+            if isinstance(element_type, Struct):
+                import numpy
+                value = value.view(numpy.dtype(element_type.dtype_spec()))
+            # arrays are writable, since outputs are filled in place
+            value = value.copy()
+            shape = getattr(data_type, "shape", None)
+            return value.reshape(shape) if shape is not None else value
+        if isinstance(data_type, Struct):
+            return _to_struct(value, data_type)
+        if data_type == DataType.Bit:
+            return bool(value)
+        return value
+
+    def __get_results(self, func_def, result, names, args):
+        # results are recorded as the return value, then the outputs in order
+        results = []
+        if func_def.return_type not in {DataType.Void, DataType.Object}:
+            results.append(_to_c_value(result, func_def.return_type))
+        returned = [name for name in func_def.output_names if not func_def.arg_types[name].is_array()]
+        if len(returned) == 1:
+            result = (result,)
+        for name in func_def.output_names:
+            data_type = func_def.arg_types[name]
+            if data_type.is_array():
+                results.append(args[names.index(name)])
+            else:
+                results.append(_to_c_value(result[returned.index(name)], data_type))
+        return results
+
+    def __compare(self, call: RecordedCall, func_def, results):
+        if func_def.return_type == DataType.Object:
+            # the handles are different, which is not a mismatch
+            results = [None] + results
+        for expected, actual in zip(call.results, results):
+            if actual is None:
+                continue
+            if hasattr(expected, "shape"):
+                import numpy
+                if not numpy.array_equal(expected.view(actual.dtype).reshape(actual.shape), actual):
+                    self.__mismatch(call, expected, actual)
+                    return
+            elif expected != actual:
+                self.__mismatch(call, call.results, results)
+                return
+
+    def replay_call(self, call: RecordedCall):
+        kind, target, return_object = self.functions[call.func_id]
+        func_def = self.func_defs[call.func_id]
+        self.result.calls += 1
+        if kind == DESTROY:
+            self.handles.pop(call.args[0], None)
+            return
+        names = func_def.param_names or func_def.arg_names
+        if func_def.parent_class is not None:
+            # methods are called on the object, while the constructor creates it
+            names = names[1:]
+        args = call.args[1:] if kind == METHOD else call.args
+        args = [self.__get_arg(value, func_def.arg_types[name]) for value, name in zip(args, names)]
+        try:
+            if kind == METHOD:
+                result = getattr(self.__get_object(call.args[0]), target)(*args)
+            else:
+                result = target(*args)
+            results = self.__get_results(func_def, result, names, args)
+        except ReplayError:
+            raise
+        except Exception:  # noqa
+            if not call.error and self.compare:
+                self.__mismatch(call, call.results, traceback.format_exc())
+            return
+        if call.error:
+            if self.compare:
+                self.__mismatch(call, "error", results)
+            return
+        if return_object:
+            # later calls refer to the object by its recorded handle
+            self.handles[call.results[0]] = result
+        if self.compare:
+            self.__compare(call, func_def, results)
+
+    @staticmethod
+    def stream_key(call: RecordedCall, epoch: int, object_groups):
+        # calls are grouped by the objects they work on, which includes the ones they create or return
+        handles = _get_handles(call)
+        return object_groups[(epoch, handles[0])] if handles else None
+
+    def run(self, reader: RecordReader, num_streams=1, stream=0, object_groups=None):
+        self.check_function_names(reader.function_names)
+        if num_streams > 1 and object_groups is None:
+            object_groups = group_objects(reader)
+        # handles are only unique within a runtime
+        epoch = 0
+        for call in reader:
+            if call is None:
+                self.finalize()
+                epoch += 1
+                continue
+            if num_streams > 1:
+                key = self.stream_key(call, epoch, object_groups)
+                if (0 if key is None else hash(key) % num_streams) != stream:
+                    continue
+            self.replay_call(call)
+        return self.result
+
+
+def _get_handles(call: RecordedCall):
+    return [int(value) for value in call.args + call.results if isinstance(value, ObjectHandle) and value != 0]
+
+
+def group_objects(reader: RecordReader):
+    """Maps every object in the log, keyed by the runtime epoch and its handle, to the group it is replayed in.
+    Objects used by the same call end up in one group, e.g. an object passed to a method of another one or
+    an object returned by a function that takes another one"""
+    parents = {}
+
+    def find(key):
+        while parents[key] != key:
+            parents[key] = parents[parents[key]]
+            key = parents[key]
+        return key
+
+    epoch = 0
+    for call in reader:
+        if call is None:
+            epoch += 1
+            continue
+        keys = [(epoch, handle) for handle in _get_handles(call)]
+        for key in keys:
+            parents.setdefault(key, key)
+        for key in keys[1:]:
+            root, other = find(keys[0]), find(key)
+            if root != other:
+                parents[other] = root
+    return {key: find(key) for key in parents}
+
+
+# set before the worker processes are forked
+_replay_args = None
+
+
+def _replay_stream(filename, num_streams, stream):
+    # a worker may run several streams, each of which starts with its own objects
+    func_defs, compare, max_mismatches, object_groups = _replay_args
+    replayer = Replayer(func_defs, compare=compare, max_mismatches=max_mismatches)
+    return replayer.run(RecordReader(filename), num_streams, stream, object_groups)
+
+
+def replay(filename: str, func_defs: List[Union[type, DPIFunctionCall]], compare: bool = True,
+           processes: int = 1, max_mismatches: int = 100):
+    """Replays the recorded calls and returns a ReplayResult. If compare is set, the results of the
+    Python code are compared with the recorded ones.
+    processes fans the objects out to a process pool. Objects used by the same call, including the ones
+    created or returned by it, are replayed in one process together with all their calls, while calls
+    that don't work on any object go to the first one. Every worker still reads and decodes the whole
+    log, so only the execution of the Python code runs in parallel"""
+    global _replay_args
+    if processes <= 1:
+        replayer = Replayer(func_defs, compare=compare, max_mismatches=max_mismatches)
+        return replayer.run(RecordReader(filename))
+
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    # the workers inherit the python code through fork, since the exported functions may not be picklable
+    _replay_args = (func_defs, compare, max_mismatches, group_objects(RecordReader(filename)))
+    try:
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("fork")) as executor:
+            futures = [executor.submit(_replay_stream, filename, processes, i) for i in range(processes)]
+            result = ReplayResult()
+            for future in futures:
+                result.merge(future.result())
+    finally:
+        _replay_args = None
+    del result.mismatches[max_mismatches:]
+    return result
@@ -0,0 +1,463 @@
+"""
+Model server for the out-of-process runtimes. The generated library forwards every DPI call to
+this process, which dispatches the call to the exported Python functions and classes.
+
+There is a single server process per library, since the objects and the call order have to stay in
+one process. With the shared memory runtime, the server is launched by the library itself:
+    python -m pysv.server --model <lib_name>_model.py --shm <shared memory file>
+With the socket runtime, the server can also run on a different host:
+    python -m pysv.server --model <lib_name>_model.py --listen tcp:<host>:<port>
+"""
+import argparse
+import importlib
+import importlib.util
+import mmap
+import operator
+import os
+import socket
+import struct
+import sys
+import time
+import traceback
+from .util import check_shm_machine
+
+# function table entry kinds, used by the generated model module
+FUNCTION = 0
+INIT = 1
+METHOD = 2
+DESTROY = 3
+
+# request kinds. needs to match remote_client.cc
+REQUEST_CALL = 0
+REQUEST_POST = 1
+REQUEST_LIVE_OBJECTS = 2
+REQUEST_SHUTDOWN = 3
+
+# response status
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+# value tags
+TAG_NONE = ord("n")
+TAG_BOOL = ord("?")
+TAG_INT = ord("q")
+TAG_UINT = ord("Q")
+TAG_DOUBLE = ord("d")
+TAG_STRING = ord("s")
+TAG_OBJECT = ord("o")
+TAG_TUPLE = ord("t")
+
+_U8 = struct.Struct("<B")
+_U32 = struct.Struct("<I")
+_I64 = struct.Struct("<q")
+_U64 = struct.Struct("<Q")
+_F64 = struct.Struct("<d")
+_REQUEST_HEADER = struct.Struct("<BI")
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+_UINT64_MASK = (1 << 64) - 1
+
+# shared memory layout. needs to match shm_transport.cc
+SHM_READY = 0
+SHM_CAPACITY = 8
+SHM_REQUEST_HEAD = 64
+SHM_REQUEST_TAIL = 128
+SHM_RESPONSE_HEAD = 192
+SHM_RESPONSE_TAIL = 256
+SHM_DATA = 512
+
+def import_module(module_name):
+    # same as the embedded runtime, nested names are resolved as attributes
+    tokens = [name for name in module_name.split(".") if name]
+    target = importlib.import_module(tokens[0])
+    for name in tokens[1:]:
+        target = getattr(target, name)
+    return target
+
+
+def load_model(filename):
+    spec = importlib.util.spec_from_file_location("pysv_model", filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class ObjectHandle(int):
+    """Handle of a Python object owned by the server"""
+    pass
+
+
+def decode_value(data, pos, handles=None):
+    tag = data[pos]
+    pos += 1
+    if tag == TAG_NONE:
+        return None, pos
+    elif tag == TAG_BOOL:
+        return data[pos] != 0, pos + 1
+    elif tag == TAG_INT:
+        return _I64.unpack_from(data, pos)[0], pos + 8
+    elif tag == TAG_UINT:
+        return _U64.unpack_from(data, pos)[0], pos + 8
+    elif tag == TAG_DOUBLE:
+        return _F64.unpack_from(data, pos)[0], pos + 8
+    elif tag == TAG_STRING:
+        size = _U32.unpack_from(data, pos)[0]
+        pos += 4
+        return bytes(data[pos:pos + size]).decode("utf-8"), pos + size
+    elif tag == TAG_OBJECT:
+        handle = _U64.unpack_from(data, pos)[0]
+        if handles is None:
+            return ObjectHandle(handle), pos + 8
+        if handle not in handles:
+            raise ValueError("Unable to find object from handle {0}".format(handle))
+        return handles[handle], pos + 8
+    elif tag == TAG_TUPLE:
+        size = _U32.unpack_from(data, pos)[0]
+        pos += 4
+        values = []
+        for _ in range(size):
+            value, pos = decode_value(data, pos, handles)
+            values.append(value)
+        return tuple(values), pos
+    raise ValueError("Unknown value tag {0}".format(tag))
+
+
+def decode_values(data, pos=0, handles=None):
+    values = []
+    while pos < len(data):
+        value, pos = decode_value(data, pos, handles)
+        values.append(value)
+    return values
+
+
+def encode_value(value, out: bytearray):
+    if value is None:
+        out += _U8.pack(TAG_NONE)
+    elif isinstance(value, ObjectHandle):
+        out += _U8.pack(TAG_OBJECT) + _U64.pack(value)
+    elif isinstance(value, bool):
+        out += _U8.pack(TAG_BOOL) + _U8.pack(1 if value else 0)
+    elif isinstance(value, int):
+        if _INT64_MIN <= value <= _INT64_MAX:
+            out += _U8.pack(TAG_INT) + _I64.pack(value)
+        else:
+            # same as SystemVerilog, values that don't fit are truncated to the lower bits
+            out += _U8.pack(TAG_UINT) + _U64.pack(value & _UINT64_MASK)
+    elif isinstance(value, float):
+        out += _U8.pack(TAG_DOUBLE) + _F64.pack(value)
+    elif isinstance(value, str):
+        data = value.encode("utf-8")
+        out += _U8.pack(TAG_STRING) + _U32.pack(len(data)) + data
+    elif isinstance(value, tuple):
+        out += _U8.pack(TAG_TUPLE) + _U32.pack(len(value))
+        for v in value:
+            encode_value(v, out)
+    else:
+        # integer-like values such as numpy integers
+        try:
+            index = operator.index(value)
+        except TypeError:
+            encode_value(float(value), out)
+        else:
+            encode_value(index, out)
+
+
+class ModelServer:
+    def __init__(self, functions):
+        # indexed by the function id used in the generated library
+        self.functions = functions
+        # objects referenced by the simulator. handle 0 is reserved for null
+        self.handles = {}
+        self.__next_handle = 1
+
+    def add_object(self, obj):
+        handle = self.__next_handle
+        self.__next_handle += 1
+        self.handles[handle] = obj
+        return ObjectHandle(handle)
+
+    def live_objects(self, class_name):
+        return sum(1 for obj in self.handles.values() if type(obj).__name__ == class_name)
+
+    def dispatch(self, func_id, payload):
+        kind, target, return_object = self.functions[func_id]
+        if kind == DESTROY:
+            handle, = decode_values(payload)
+            if self.handles.pop(handle, None) is None:
+                raise ValueError("Unable to destroy object from handle {0}".format(handle))
+            return None
+        args = decode_values(payload, handles=self.handles)
+        if kind == METHOD:
+            # the first argument is the object itself
+            result = getattr(args[0], target)(*args[1:])
+        else:
+            result = target(*args)
+        if return_object:
+            return self.add_object(result)
+        return result
+
+    def handle_request(self, request):
+        kind, func_id = _REQUEST_HEADER.unpack_from(request, 0)
+        payload = memoryview(request)[_REQUEST_HEADER.size:]
+        if kind == REQUEST_LIVE_OBJECTS:
+            class_name, = decode_values(payload)
+            return self.live_objects(class_name)
+        return self.dispatch(func_id, payload)
+
+    def serve(self, transport):
+        # the first error of the posted calls, which is reported with the next response
+        post_error = None
+        while True:
+            request = transport.read_frame()
+            if request is None:
+                # the simulator is gone without shutting down the server
+                if post_error is not None:
+                    print(post_error, file=sys.stderr, end="")
+                break
+            kind = request[0]
+            if kind == REQUEST_SHUTDOWN:
+                # the simulator waits for the response, so the error is not lost at the end of the simulation
+                self.__respond(transport, post_error)
+                break
+            if post_error is not None and kind != REQUEST_POST:
+                # the embedded runtime would have stopped at the failed call, so this one is not run
+                self.__respond(transport, post_error)
+                post_error = None
+                continue
+            try:
+                result = self.handle_request(request)
+            except Exception:  # noqa
+                if kind != REQUEST_POST:
+                    self.__respond(transport, traceback.format_exc())
+                elif post_error is None:
+                    post_error = "Error in an earlier call without result:\n" + traceback.format_exc()
+                else:
+                    # only the first error is reported to the simulator
+                    traceback.print_exc()
+                continue
+            if kind != REQUEST_POST:
+                self.__respond(transport, None, result)
+
+    @staticmethod
+    def __respond(transport, error, result=None):
+        if error is None:
+            response = bytearray(_U8.pack(STATUS_OK))
+            encode_value(result, response)
+        else:
+            # the error message is the Python traceback
+            response = bytearray(_U8.pack(STATUS_ERROR))
+            encode_value(error, response)
+        transport.write_frame(response)
+
+
+class Backoff:
+    """Waits for the other side of a transport. Spins for a short while before sleeping, so that
+    back-to-back calls don't pay for a context switch"""
+    SPIN_TIME = 50e-6
+    MAX_SLEEP = 1e-3
+
+    def __init__(self):
+        self.parent_pid = os.getppid()
+        self.start = None
+        self.sleep_time = 0
+
+    def reset(self):
+        self.start = None
+        self.sleep_time = 0
+
+    def wait(self):
+        if self.start is None:
+            self.start = time.perf_counter()
+        if time.perf_counter() - self.start < self.SPIN_TIME:
+            return
+        if os.getppid() != self.parent_pid:
+            # the simulator is gone
+            sys.exit(1)
+        time.sleep(self.sleep_time)
+        self.sleep_time = min(self.MAX_SLEEP, self.sleep_time * 2 + 1e-6)
+
+
+class _ShmRing:
+    """Single producer, single consumer byte ring inside the shared memory file.
+    Head and tail are monotonically increasing byte counts, and each side only writes its own
+    position after the data is copied. Python doesn't have any memory fence, so the position is
+    published with a plain store, which relies on the store ordering of x86"""
+
+    def __init__(self, buffer, head_offset, tail_offset, data_offset, capacity, backoff):
+        self.buffer = buffer
+        self.head_offset = head_offset
+        self.tail_offset = tail_offset
+        self.data_offset = data_offset
+        self.capacity = capacity
+        self.backoff = backoff
+
+    def __load(self, offset):
+        return _U64.unpack_from(self.buffer, offset)[0]
+
+    def read(self, size):
+        result = bytearray(size)
+        tail = self.__load(self.tail_offset)
+        pos = 0
+        self.backoff.reset()
+        while pos < size:
+            available = self.__load(self.head_offset) - tail
+            if available == 0:
+                self.backoff.wait()
+                continue
+            self.backoff.reset()
+            start = tail % self.capacity
+            chunk = min(size - pos, available, self.capacity - start)
+            begin = self.data_offset + start
+            result[pos:pos + chunk] = self.buffer[begin:begin + chunk]
+            pos += chunk
+            tail += chunk
+            _U64.pack_into(self.buffer, self.tail_offset, tail)
+        return result
+
+    def write(self, data):
+        head = self.__load(self.head_offset)
+        pos = 0
+        size = len(data)
+        self.backoff.reset()
+        while pos < size:
+            free = self.capacity - (head - self.__load(self.tail_offset))
+            if free == 0:
+                self.backoff.wait()
+                continue
+            self.backoff.reset()
+            start = head % self.capacity
+            chunk = min(size - pos, free, self.capacity - start)
+            begin = self.data_offset + start
+            self.buffer[begin:begin + chunk] = data[pos:pos + chunk]
+            pos += chunk
+            head += chunk
+            _U64.pack_into(self.buffer, self.head_offset, head)
+
+
+class ShmTransport:
+    def __init__(self, filename):
+        check_shm_machine()
+        with open(filename, "r+b") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0)
+        capacity = _U64.unpack_from(self.buffer, SHM_CAPACITY)[0]
+        backoff = Backoff()
+        self.requests = _ShmRing(self.buffer, SHM_REQUEST_HEAD, SHM_REQUEST_TAIL, SHM_DATA, capacity, backoff)
+        self.responses = _ShmRing(self.buffer, SHM_RESPONSE_HEAD, SHM_RESPONSE_TAIL, SHM_DATA + capacity, capacity,
+                                  backoff)
+
+    def set_ready(self):
+        _U64.pack_into(self.buffer, SHM_READY, 1)
+
+    def read_frame(self):
+        size, = _U32.unpack(self.requests.read(_U32.size))
+        return self.requests.read(size)
+
+    def write_frame(self, data):
+        self.responses.write(_U32.pack(len(data)) + data)
+
+    def close(self):
+        self.buffer.close()
+
+
+class SocketTransport:
+    BUFFER_SIZE = 1 << 16
+
+    def __init__(self, connection):
+        self.connection = connection
+        if connection.family != socket.AF_UNIX:
+            # small synchronous calls should not be delayed
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # posted calls arrive back to back, so read them in large chunks
+        self.reader = connection.makefile("rb", buffering=self.BUFFER_SIZE)
+
+    def read_frame(self):
+        header = self.reader.read(_U32.size)
+        if len(header) < _U32.size:
+            return None
+        size, = _U32.unpack(header)
+        data = self.reader.read(size)
+        if len(data) < size:
+            return None
+        return data
+
+    def write_frame(self, data):
+        self.connection.sendall(_U32.pack(len(data)) + data)
+
+    def close(self):
+        self.reader.close()
+        self.connection.close()
+
+
+def create_listener(address):
+    # address is either unix:<path> or tcp:<host>:<port>
+    if address.startswith("unix:"):
+        path = address[len("unix:"):]
+        if os.path.exists(path):
+            os.unlink(path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+    else:
+        if address.startswith("tcp:"):
+            address = address[len("tcp:"):]
+        host, _, port = address.rpartition(":")
+        family, kind, proto, _, addr = socket.getaddrinfo(host or None, int(port), type=socket.SOCK_STREAM,
+                                                          flags=socket.AI_PASSIVE)[0]
+        listener = socket.socket(family, kind, proto)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(addr)
+    listener.listen(1)
+    return listener
+
+
+def serve_shm(model, filename):
+    server = ModelServer(model.FUNCTIONS)
+    transport = ShmTransport(filename)
+    # the library waits for the model to be loaded
+    transport.set_ready()
+    try:
+        server.serve(transport)
+    finally:
+        transport.close()
+
+
+def serve_socket(model, address, once=False):
+    listener = create_listener(address)
+    print("pysv model server listening on {0}".format(address), file=sys.stderr, flush=True)
+    try:
+        while True:
+            connection, _ = listener.accept()
+            # each simulation starts with its own set of objects
+            server = ModelServer(model.FUNCTIONS)
+            transport = SocketTransport(connection)
+            try:
+                server.serve(transport)
+            except ConnectionError:
+                pass
+            finally:
+                transport.close()
+            if once:
+                break
+    finally:
+        listener.close()
+        if address.startswith("unix:") and os.path.exists(address[len("unix:"):]):
+            os.unlink(address[len("unix:"):])
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser("pysv model server")
+    parser.add_argument("--model", required=True, help="Generated model module")
+    transport = parser.add_mutually_exclusive_group(required=True)
+    transport.add_argument("--shm", help="Shared memory file created by the library")
+    transport.add_argument("--listen", help="Socket address to listen on, either unix:<path> or tcp:<host>:<port>")
+    parser.add_argument("--once", action="store_true", help="Exit after the first simulation disconnects")
+    args = parser.parse_args(args)
+
+    model = load_model(args.model)
+    if args.shm:
+        serve_shm(model, args.shm)
+    else:
+        serve_socket(model, args.listen, args.once)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#include <condition_variable>
+#include <deque>
+#include <exception>
+#include <mutex>
+#include <set>
+#include <thread>
+
+// runs python calls on worker threads. each call is identified by a ticket, and the result is kept
+// until the ticket is waited on. the simulator thread calls submit/poll/wait, which is the only
+// thread that creates tickets
+class AsyncExecutor {
+public:
+    AsyncExecutor(size_t num_workers, size_t max_in_flight, bool ordered)
+        : max_in_flight_(max_in_flight), ordered_(ordered) {
+        for (size_t i = 0; i < num_workers; i++) {
+            workers_.emplace_back(&AsyncExecutor::run, this);
+        }
+    }
+
+    ~AsyncExecutor() { stop(); }
+
+    template<class ...Args>
+    int64_t submit(const py::object &func, Args &&...args) {
+        // called with the GIL held
+        auto call_args = py::make_tuple(std::forward<Args>(args)...);
+        std::unique_lock<std::mutex> lock(mutex_);
+        if (pending_.size() >= max_in_flight_) {
+            // wait for a free slot without holding the GIL, so the workers can make progress
+            lock.unlock();
+            py::gil_scoped_release release;
+            lock.lock();
+            done_cond_.wait(lock, [this] { return pending_.size() < max_in_flight_; });
+            // the GIL has to be acquired before the lock
+            lock.unlock();
+        }
+        if (!lock.owns_lock()) lock.lock();
+        auto ticket = next_ticket_++;
+        pending_.emplace(ticket);
+        tasks_.push_back(Task{ticket, func, std::move(call_args)});
+        lock.unlock();
+        task_cond_.notify_one();
+        return ticket;
+    }
+
+    bool poll(int64_t ticket) {
+        std::lock_guard<std::mutex> lock(mutex_);
+        check_ticket(ticket);
+        return is_ready(ticket);
+    }
+
+    py::object wait(int64_t ticket) {
+        // called with the GIL held
+        std::unique_lock<std::mutex> lock(mutex_);
+        check_ticket(ticket);
+        if (!is_ready(ticket)) {
+            lock.unlock();
+            py::gil_scoped_release release;
+            lock.lock();
+            done_cond_.wait(lock, [this, ticket] { return is_ready(ticket); });
+            lock.unlock();
+        }
+        if (!lock.owns_lock()) lock.lock();
+        auto it = results_.find(ticket);
+        auto result = std::move(it->second);
+        results_.erase(it);
+        lock.unlock();
+        if (result.error) std::rethrow_exception(result.error);
+        return std::move(result.value);
+    }
+
+    void stop() {
+        // called without the GIL, since the workers may need it to finish the current call
+        {
+            std::lock_guard<std::mutex> lock(mutex_);
+            stopped_ = true;
+        }
+        task_cond_.notify_all();
+        for (auto &worker: workers_) {
+            if (worker.joinable()) worker.join();
+        }
+    }
+
+private:
+    struct Task {
+        int64_t ticket;
+        py::object func;
+        py::object args;
+    };
+    struct Result {
+        py::object value;
+        std::exception_ptr error;
+    };
+
+    size_t max_in_flight_;
+    bool ordered_;
+    bool stopped_ = false;
+    int64_t next_ticket_ = 1;
+    std::mutex mutex_;
+    std::condition_variable task_cond_;
+    std::condition_variable done_cond_;
+    std::deque<Task> tasks_;
+    // tickets that are submitted but not finished
+    std::set<int64_t> pending_;
+    // finished calls that are not waited on yet
+    std::unordered_map<int64_t, Result> results_;
+    std::vector<std::thread> workers_;
+
+    void check_ticket(int64_t ticket) const {
+        if (!pending_.count(ticket) && !results_.count(ticket)) {
+            throw std::runtime_error("Invalid async ticket " + std::to_string(ticket));
+        }
+    }
+
+    bool is_ready(int64_t ticket) const {
+        if (!results_.count(ticket)) return false;
+        // in order mode, all the calls submitted earlier have to finish first
+        return !ordered_ || pending_.empty() || *pending_.begin() > ticket;
+    }
+
+    void run() {
+        while (true) {
+            Task task;
+            {
+                std::unique_lock<std::mutex> lock(mutex_);
+                task_cond_.wait(lock, [this] { return stopped_ || !tasks_.empty(); });
+                if (stopped_) return;
+                task = std::move(tasks_.front());
+                tasks_.pop_front();
+            }
+            py::gil_scoped_acquire gil;
+            Result result;
+            try {
+                result.value = steal_result(PyObject_Call(task.func.ptr(), task.args.ptr(), nullptr));
+            } catch (...) {
+                result.error = std::current_exception();
+            }
+            auto ticket = task.ticket;
+            // release the references while holding the GIL
+            task = Task();
+            {
+                std::lock_guard<std::mutex> lock(mutex_);
+                pending_.erase(ticket);
+                results_.emplace(ticket, std::move(result));
+            }
+            done_cond_.notify_all();
+        }
+    }
+};
+
+std::unique_ptr<std::vector<std::unique_ptr<AsyncExecutor>>> async_executors;
+
+AsyncExecutor &get_async_executor(size_t func_id, size_t num_workers, size_t max_in_flight, bool ordered) {
+    if (!async_executors) {
+        async_executors = std::unique_ptr<std::vector<std::unique_ptr<AsyncExecutor>>>(
+            new std::vector<std::unique_ptr<AsyncExecutor>>(NUM_FUNCTION_DEFS));
+    }
+    auto &executor = (*async_executors)[func_id];
+    if (!executor) {
+        executor = std::unique_ptr<AsyncExecutor>(new AsyncExecutor(num_workers, max_in_flight, ordered));
+    }
+    return *executor;
+}
\ No newline at end of file
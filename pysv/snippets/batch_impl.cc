@@ -0,0 +1,55 @@
+#include "svdpi.h"
+
+// one dimensional open array used by batched functions. element i is counted from the left bound
+template<class T>
+class BatchArray {
+public:
+    explicit BatchArray(const svOpenArrayHandle array)
+        : array_(array), size_(svSize(array, 1)), left_(svLeft(array, 1)),
+          step_(svLeft(array, 1) <= svRight(array, 1) ? 1 : -1),
+          data_(reinterpret_cast<T *>(svGetArrayPtr(array))) {}
+
+    int size() const { return size_; }
+
+    T &operator[](int index) {
+        // arrays with native C representation are accessed directly
+        if (data_) return data_[index];
+        return *reinterpret_cast<T *>(svGetArrElemPtr1(array_, left_ + step_ * index));
+    }
+
+    py::object view(bool readonly) {
+        if (!data_) {
+            throw std::runtime_error("Array type does not have native C representation");
+        }
+        auto buffer = py::memoryview::from_buffer(data_, {static_cast<ssize_t>(size_)},
+                                                  {static_cast<ssize_t>(sizeof(T))}, readonly);
+        // numpy is only required by vectorized batch functions
+        if (!numpy_asarray) {
+            numpy_asarray = std::unique_ptr<py::object>(
+                new py::object(py::module::import("numpy").attr("asarray")));
+        }
+        return call_function(*numpy_asarray, buffer);
+    }
+
+private:
+    svOpenArrayHandle array_;
+    int size_;
+    int left_;
+    int step_;
+    T *data_;
+};
+
+int check_batch_size(std::initializer_list<int> sizes) {
+    // all the arrays have to have the same number of elements
+    auto size = *sizes.begin();
+    for (auto s: sizes) {
+        if (s != size) throw std::runtime_error("Batch arrays have different sizes");
+    }
+    return size;
+}
+
+template<class T>
+void copy_batch_result(BatchArray<T> &array, const py::handle &values) {
+    // let numpy cast the values into the output array
+    array.view(false)[py::ellipsis()] = values;
+}
\ No newline at end of file
@@ -1,7 +1,9 @@
 #include "svdpi.h"
 
+// T is the C type of the array element, which decides the format of the memoryview
+template<class T>
 py::memoryview to_buffer(const svOpenArrayHandle array_handle) {
-    ssize_t element_size = sizeof(int32_t);
+    ssize_t element_size = sizeof(T);
     void *base_ptr = nullptr;
     std::vector<ssize_t> sizes = {};
     std::vector<ssize_t> strides = {};
@@ -17,18 +19,66 @@ py::memoryview to_buffer(const svOpenArrayHandle array_handle) {
         sizes.emplace_back(s);
     }
     // assumes row major ordering
-    ssize_t stride = element_size;
     strides = std::vector<ssize_t>(dim, element_size);
-    for (int i = 0; i < dim - 1; i++) {
-        stride *= sizes[i];
-        strides[i] = stride;
+    for (int i = dim - 2; i >= 0; i--) {
+        strides[i] = strides[i + 1] * sizes[i + 1];
     }
 
     return py::memoryview::from_buffer(
         base_ptr,                                 /* Pointer to buffer */
         element_size,                             /* Size of one scalar */
-        py::format_descriptor<int32_t>::value, /* Python struct-style format descriptor */
+        py::format_descriptor<T>::value,          /* Python struct-style format descriptor */
         sizes,                                    /* Buffer dimensions */
         strides                                   /* Strides (in bytes) for each index */
     );
 }
+
+
+// view of an array with a fixed shape. the shape and strides are constants, and the view is reused as long as
+// the simulator passes the array at the same address. only a raw reference is kept, which is dropped once the
+// runtime is finalized, so that nothing is released after the interpreter is gone
+template<class T, ssize_t ...Shape>
+class FixedBuffer {
+public:
+    py::object view(const svOpenArrayHandle array_handle) {
+        auto *base_ptr = svGetArrayPtr(array_handle);
+        if (!base_ptr) {
+            throw std::runtime_error("Array type does not have native C representation");
+        }
+        constexpr ssize_t dim = sizeof...(Shape);
+        ssize_t shape[] = {Shape...};
+        // the shape is checked on every call, since a dynamic array can be reallocated with a different
+        // size at the same address. a cached view of the old shape would be read out of bounds otherwise
+        if (svDimensions(array_handle) != dim) {
+            throw std::runtime_error("Array has " + std::to_string(svDimensions(array_handle)) +
+                                     " dimensions instead of " + std::to_string(dim));
+        }
+        for (auto i = 0; i < dim; i++) {
+            if (svSize(array_handle, i + 1) != shape[i]) {
+                throw std::runtime_error("Array dimension " + std::to_string(i + 1) + " has " +
+                                         std::to_string(svSize(array_handle, i + 1)) + " elements instead of " +
+                                         std::to_string(shape[i]));
+            }
+        }
+        if (view_ && epoch_ == runtime_epoch) {
+            if (base_ptr == base_ptr_) return py::reinterpret_borrow<py::object>(view_);
+            Py_DECREF(view_);
+        }
+        view_ = nullptr;
+        std::vector<ssize_t> strides(dim, sizeof(T));
+        for (auto i = dim - 2; i >= 0; i--) {
+            strides[i] = strides[i + 1] * shape[i + 1];
+        }
+        auto view = py::memoryview::from_buffer(static_cast<T *>(base_ptr), std::vector<ssize_t>(shape, shape + dim),
+                                                strides);
+        view_ = view.release().ptr();
+        base_ptr_ = base_ptr;
+        epoch_ = runtime_epoch;
+        return py::reinterpret_borrow<py::object>(view_);
+    }
+
+private:
+    void *base_ptr_ = nullptr;
+    PyObject *view_ = nullptr;
+    size_t epoch_ = 0;
+};
\ No newline at end of file
@@ -0,0 +1,133 @@
+#include <array>
+#include <cstring>
+#include <type_traits>
+#include <unordered_map>
+#include <vector>
+
+// results of pure functions are kept in a fixed capacity LRU cache, keyed on the scalar arguments packed into
+// 64-bit words. a hit returns without entering the python runtime
+template<size_t N>
+using CacheKey = std::array<uint64_t, N>;
+
+template<typename T>
+typename std::enable_if<std::is_integral<T>::value, uint64_t>::type pack_cache_key(T value) {
+    return static_cast<uint64_t>(value);
+}
+
+inline uint64_t pack_cache_key(float value) {
+    uint32_t bits;
+    std::memcpy(&bits, &value, sizeof(bits));
+    return bits;
+}
+
+inline uint64_t pack_cache_key(double value) {
+    uint64_t bits;
+    std::memcpy(&bits, &value, sizeof(bits));
+    return bits;
+}
+
+template<size_t N>
+struct CacheKeyHash {
+    size_t operator()(const CacheKey<N> &key) const {
+        uint64_t hash = 0x9E3779B97F4A7C15ull;
+        for (auto value: key) {
+            hash = (hash ^ value) * 0xBF58476D1CE4E5B9ull;
+            hash ^= hash >> 31;
+        }
+        return static_cast<size_t>(hash);
+    }
+};
+
+template<size_t N, typename T>
+class LRUCache {
+public:
+    uint64_t hits = 0;
+    uint64_t misses = 0;
+
+    explicit LRUCache(size_t capacity) : capacity_(capacity) {
+        // entries never move, so the index holds their positions
+        entries_.reserve(capacity);
+        index_.reserve(capacity);
+    }
+
+    bool get(const CacheKey<N> &key, T &value) {
+        auto it = index_.find(key);
+        if (it == index_.end()) {
+            misses++;
+            return false;
+        }
+        hits++;
+        move_to_front(it->second);
+        value = entries_[it->second].value;
+        return true;
+    }
+
+    void put(const CacheKey<N> &key, const T &value) {
+        auto it = index_.find(key);
+        if (it != index_.end()) {
+            // filled by a nested call with the same arguments
+            entries_[it->second].value = value;
+            move_to_front(it->second);
+            return;
+        }
+        size_t pos;
+        if (entries_.size() < capacity_) {
+            pos = entries_.size();
+            entries_.push_back({key, value, NONE, NONE});
+        } else {
+            // the least recently used entry is reused
+            pos = tail_;
+            unlink(pos);
+            index_.erase(entries_[pos].key);
+            entries_[pos].key = key;
+            entries_[pos].value = value;
+        }
+        index_.emplace(key, pos);
+        link_front(pos);
+    }
+
+    // the counters are kept, so that they cover the whole simulation
+    void clear() {
+        entries_.clear();
+        index_.clear();
+        head_ = tail_ = NONE;
+    }
+
+private:
+    static constexpr size_t NONE = static_cast<size_t>(-1);
+
+    struct Entry {
+        CacheKey<N> key;
+        T value;
+        size_t prev;
+        size_t next;
+    };
+
+    size_t capacity_;
+    std::vector<Entry> entries_;
+    std::unordered_map<CacheKey<N>, size_t, CacheKeyHash<N>> index_;
+    // most recently used entry first
+    size_t head_ = NONE;
+    size_t tail_ = NONE;
+
+    void unlink(size_t pos) {
+        auto &entry = entries_[pos];
+        if (entry.prev != NONE) entries_[entry.prev].next = entry.next; else head_ = entry.next;
+        if (entry.next != NONE) entries_[entry.next].prev = entry.prev; else tail_ = entry.prev;
+    }
+
+    void link_front(size_t pos) {
+        auto &entry = entries_[pos];
+        entry.prev = NONE;
+        entry.next = head_;
+        if (head_ != NONE) entries_[head_].prev = pos;
+        head_ = pos;
+        if (tail_ == NONE) tail_ = pos;
+    }
+
+    void move_to_front(size_t pos) {
+        if (pos == head_) return;
+        unlink(pos);
+        link_front(pos);
+    }
+};
\ No newline at end of file
@@ -1,24 +1,92 @@
+// how the attribute resolved from the object type is called
+enum MethodCallMode { METHOD_LOOKUP = 0, METHOD_UNBOUND = 1, METHOD_DESCRIPTOR = 2, METHOD_ATTRIBUTE = 3 };
+
+// finds the attribute in the type and its bases without binding it
+py::object lookup_type_attr(const py::handle &type, const py::handle &name) {
+    for (auto base: type.attr("__mro__")) {
+        auto dict = base.attr("__dict__");
+        if (dict.contains(name)) return dict[name];
+    }
+    return py::object();
+}
+
 template<class ...Args>
-py::object call_class_func(void *py_ptr, const std::string &func_name, Args &&...args) {
-    if (!py_obj_map) return py::none();
-    if (py_obj_map->find(py_ptr) == py_obj_map->end()) {
+py::object call_method(const py::handle &obj, const py::handle &name, Args &&...args) {
+#if PY_VERSION_HEX >= 0x03090000
+    // same lookup as obj.name(...), which doesn't create the bound method or the instance __dict__
+    PyObject *arg_ptrs[] = {obj.ptr(), args.ptr()...};
+    auto result = PyObject_VectorcallMethod(name.ptr(), arg_ptrs, sizeof...(Args) + 1, nullptr);
+    if (!result) throw py::error_already_set();
+    return py::reinterpret_steal<py::object>(result);
+#else
+    auto attr = PyObject_GetAttr(obj.ptr(), name.ptr());
+    if (!attr) throw py::error_already_set();
+    return call_function(py::reinterpret_steal<py::object>(attr), std::forward<Args>(args)...);
+#endif
+}
+
+template<class ...Args>
+py::object call_class_func(size_t func_id, void *py_ptr, const char *func_name, Args &&...args) {
+    auto handle = py_obj_table ? py_obj_table->get(py_ptr) : py::handle();
+    if (!handle) {
         std::cerr << "ERROR: unable to call function " << func_name
                   << " from ptr " << py_ptr << std::endl;
         return py::none();
     }
-    auto handle = py_obj_map->at(py_ptr);
 
-    // special case for __destroy__ call
-    if (func_name == "destroy") {
-        // this is a special case
-        // 1. manually decrease the reference we increased during object creation
-        handle.dec_ref();
-        // 2. use pybind's RAII to remove the actual reference
-        py_obj_map->erase(py_ptr);
-        return py::none();
+    auto &method = get_method_def(func_id);
+    auto type = Py_TYPE(handle.ptr());
+    if (reinterpret_cast<PyObject *>(type) != method.type.ptr()) {
+        // resolve the attribute from the object type, which only happens once unless
+        // objects of different types are passed in
+        if (!method.name) {
+            method.name = py::reinterpret_steal<py::object>(PyUnicode_InternFromString(func_name));
+        }
+        auto type_obj = py::reinterpret_borrow<py::object>(reinterpret_cast<PyObject *>(type));
+        method.func = lookup_type_attr(type_obj, method.name);
+        auto attr_type = method.func ? Py_TYPE(method.func.ptr()) : nullptr;
+        method.descr_get = attr_type ? attr_type->tp_descr_get : nullptr;
+#ifdef Py_TPFLAGS_METHOD_DESCRIPTOR
+        bool is_method = attr_type && PyType_HasFeature(attr_type, Py_TPFLAGS_METHOD_DESCRIPTOR);
+#else
+        bool is_method = method.func && PyFunction_Check(method.func.ptr());
+#endif
+        bool is_data_descriptor = attr_type && attr_type->tp_descr_set;
+        // an instance attribute takes precedence over anything but a data descriptor, so the cached
+        // attribute is only used when the object doesn't have an instance __dict__
+        if (!method.func || type->tp_getattro != PyObject_GenericGetAttr ||
+            (type->tp_dictoffset && !is_data_descriptor)) {
+            method.call_mode = METHOD_LOOKUP;
+        } else if (is_method && !is_data_descriptor) {
+            method.call_mode = METHOD_UNBOUND;
+        } else if (method.descr_get) {
+            method.call_mode = METHOD_DESCRIPTOR;
+        } else {
+            method.call_mode = METHOD_ATTRIBUTE;
+        }
+        method.type = type_obj;
     }
 
-    auto func = handle.attr(func_name.c_str());
-    auto result = func(args...);
-    return result;
+    switch (method.call_mode) {
+        case METHOD_UNBOUND:
+            // the object is passed in as self
+            return call_function(method.func, handle, std::forward<Args>(args)...);
+        case METHOD_DESCRIPTOR: {
+            // e.g. static and class methods, or properties
+            auto bound = method.descr_get(method.func.ptr(), handle.ptr(), method.type.ptr());
+            if (!bound) throw py::error_already_set();
+            return call_function(py::reinterpret_steal<py::object>(bound), std::forward<Args>(args)...);
+        }
+        case METHOD_ATTRIBUTE:
+            return call_function(method.func, std::forward<Args>(args)...);
+        default:
+            return call_method(handle, method.name, std::forward<Args>(args)...);
+    }
 }
+
+void destroy_object(void *py_ptr) {
+    // the table releases its reference to the object
+    if (!py_obj_table || !py_obj_table->remove(py_ptr)) {
+        std::cerr << "ERROR: unable to destroy object from ptr " << py_ptr << std::endl;
+    }
+}
\ No newline at end of file
@@ -0,0 +1,20 @@
+#if PY_VERSION_HEX >= 0x03090000
+#define PYSV_VECTORCALL PyObject_Vectorcall
+#elif PY_VERSION_HEX >= 0x03080000
+#define PYSV_VECTORCALL _PyObject_Vectorcall
+#endif
+
+template<class ...Args>
+py::object call_function(const py::handle &func, Args &&...args) {
+#ifdef PYSV_VECTORCALL
+    // the first slot is reserved so that callee is allowed to prepend self without any allocation
+    PyObject *arg_ptrs[] = {nullptr, args.ptr()...};
+    auto result = PYSV_VECTORCALL(func.ptr(), arg_ptrs + 1, sizeof...(Args) | PY_VECTORCALL_ARGUMENTS_OFFSET,
+                                  nullptr);
+#else
+    auto py_args = py::make_tuple(args...);
+    auto result = PyObject_Call(func.ptr(), py_args.ptr(), nullptr);
+#endif
+    if (!result) throw py::error_already_set();
+    return py::reinterpret_steal<py::object>(result);
+}
\ No newline at end of file
@@ -1,3 +1,8 @@
 void check_interpreter() {
-    if (!guard) guard = std::unique_ptr<py::scoped_interpreter>(new py::scoped_interpreter());
+    if (!guard) {
+        guard = std::unique_ptr<py::scoped_interpreter>(new py::scoped_interpreter());
+        start_profiler();
+        add_stats_module();
+        release_main_thread();
+    }
 }
\ No newline at end of file
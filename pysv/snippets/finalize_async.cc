@@ -0,0 +1,8 @@
+    if (async_executors) {
+        // the worker threads may need the GIL to finish, so stop them before taking the GIL back
+        for (auto &executor: *async_executors) {
+            if (executor) executor->stop();
+        }
+        restore_main_thread();
+        async_executors.reset();
+    }
\ No newline at end of file
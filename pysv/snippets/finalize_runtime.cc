@@ -1,8 +1,21 @@
+    // take the GIL back before releasing any python object
+    restore_main_thread();
+    // profiles are written before any of the python functions are released
+    stop_profiler();
+    // clear the cached function definitions
+    function_defs.reset();
+    numpy_asarray.reset();
+    numpy_frombuffer.reset();
+    struct_dtypes.reset();
+    runtime_epoch++;
     // clear the cached global imports
     global_imports.reset();
-    // clear the object map
-    py_obj_map.reset();
+    // clear the object handle table
+    py_obj_table.reset();
     // clear the class map
     class_defs.reset();
+    class_namespaces.reset();
+    // the next call has to set up the runtime again
+    runtime_ready.store(false, std::memory_order_release);
     // the last part is tear down the runtime
     guard.reset();
\ No newline at end of file
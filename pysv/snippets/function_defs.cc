@@ -0,0 +1,10 @@
+FunctionDef &get_method_def(size_t func_id) {
+    if (!function_defs) {
+        function_defs = std::unique_ptr<std::vector<FunctionDef>>(new std::vector<FunctionDef>(NUM_FUNCTION_DEFS));
+    }
+    return (*function_defs)[func_id];
+}
+
+py::object &get_function_def(size_t func_id) {
+    return get_method_def(func_id).func;
+}
@@ -1,8 +1,8 @@
-void get_local_object(const std::string &local_name, void *ptr, py::dict &locals) {
-    if (!py_obj_map || py_obj_map->find(ptr) == py_obj_map->end()) {
-        std::cerr << "Unable to find object for " << local_name << std::endl;
-        return;
+py::object get_local_object(void *ptr) {
+    auto obj = py_obj_table ? py_obj_table->get(ptr) : py::handle();
+    if (!obj) {
+        std::cerr << "Unable to find object for " << ptr << std::endl;
+        return py::none();
     }
-    auto obj = py_obj_map->at(ptr);
-    locals[local_name.c_str()] = obj;
+    return py::reinterpret_borrow<py::object>(obj);
 }
\ No newline at end of file
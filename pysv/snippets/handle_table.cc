@@ -0,0 +1,71 @@
+// Python objects handed out to SystemVerilog as chandle. each handle encodes the slot index (offset by one so
+// that null is never a valid handle) in the lower half and the slot generation in the upper half. the generation
+// is bumped whenever a slot is freed, so a stale handle is detected with a single comparison
+class HandleTable {
+public:
+    void *add(const py::object &obj) {
+        uintptr_t index;
+        if (free_slots_.empty()) {
+            index = slots_.size();
+            slots_.emplace_back();
+        } else {
+            index = free_slots_.back();
+            free_slots_.pop_back();
+        }
+        auto &slot = slots_[index];
+        slot.obj = obj;
+        return reinterpret_cast<void *>((slot.generation << INDEX_BITS) | (index + 1));
+    }
+
+    // returns a null handle if the handle is invalid or stale
+    py::handle get(const void *handle) const {
+        auto slot = get_slot(handle);
+        return slot ? py::handle(slot->obj) : py::handle();
+    }
+
+    bool remove(const void *handle) {
+        auto slot = get_slot(handle);
+        if (!slot) return false;
+        auto index = slot - slots_.data();
+        slots_[index].obj = py::object();
+        slots_[index].generation = (slots_[index].generation + 1) & GENERATION_MASK;
+        free_slots_.emplace_back(index);
+        return true;
+    }
+
+    // number of live objects whose type name matches the class name
+    int32_t live_objects(const char *class_name) const {
+        int32_t result = 0;
+        auto name = std::string(class_name);
+        for (auto const &slot: slots_) {
+            if (slot.obj && name == Py_TYPE(slot.obj.ptr())->tp_name) result++;
+        }
+        return result;
+    }
+
+private:
+    static constexpr uintptr_t INDEX_BITS = sizeof(uintptr_t) * 4;
+    static constexpr uintptr_t INDEX_MASK = (static_cast<uintptr_t>(1) << INDEX_BITS) - 1;
+    static constexpr uintptr_t GENERATION_MASK = INDEX_MASK;
+
+    struct Slot {
+        py::object obj;
+        uintptr_t generation = 0;
+    };
+
+    const Slot *get_slot(const void *handle) const {
+        auto value = reinterpret_cast<uintptr_t>(handle);
+        auto index = value & INDEX_MASK;
+        if (index == 0 || index > slots_.size()) return nullptr;
+        auto const &slot = slots_[index - 1];
+        if (slot.generation != (value >> INDEX_BITS) || !slot.obj) return nullptr;
+        return &slot;
+    }
+
+    Slot *get_slot(const void *handle) {
+        return const_cast<Slot *>(static_cast<const HandleTable *>(this)->get_slot(handle));
+    }
+
+    std::vector<Slot> slots_;
+    std::vector<uintptr_t> free_slots_;
+};
@@ -1,11 +1,14 @@
 #include "pybind11/include/pybind11/embed.h"
 #include "pybind11/include/pybind11/eval.h"
+#include <atomic>
 #include <iostream>
 #include <unordered_map>
 #include <memory>
+#include <vector>
 
 // used for ModelSim/Questa to resolve some runtime native library loading issues
 // not needed for Xcelium and vcs, but include just in case
 #ifdef __linux__
 #include <dlfcn.h>
-#endif
\ No newline at end of file
+#endif
+namespace py = pybind11;
\ No newline at end of file
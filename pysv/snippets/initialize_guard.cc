@@ -61,10 +61,14 @@ void initialize_guard() {
             set_py_env(std::make_pair(conda_python_home, conda_python_path));
         }
         guard = std::unique_ptr<py::scoped_interpreter>(new py::scoped_interpreter());
+        start_profiler();
+        add_stats_module();
     } else {
         // unset the env
         unset_py_env();
         guard = std::unique_ptr<py::scoped_interpreter>(new py::scoped_interpreter());
+        start_profiler();
+        add_stats_module();
         // then restore it
         set_py_env(python_env_vars);
         has_py_env_set = true;
@@ -0,0 +1,2 @@
+    if (!py_obj_table) return 0;
+    return py_obj_table->live_objects(class_name);
\ No newline at end of file
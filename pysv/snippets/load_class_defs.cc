@@ -4,4 +4,27 @@ void load_class_defs(py::dict &globals) {
             globals[iter.first] = iter.second;
         }
     }
+}
+
+void add_class_namespace(py::dict &globals) {
+    load_class_defs(globals);
+    // keep track of the namespace so that classes defined later are visible as well
+    if (!class_namespaces) {
+        class_namespaces = std::unique_ptr<std::vector<py::dict>>(new std::vector<py::dict>());
+    }
+    class_namespaces->emplace_back(globals);
+}
+
+void add_class_def(const char *class_name, const py::object &class_def) {
+    // class is only defined once per interpreter so all the objects share the same type
+    if (!class_defs) {
+        class_defs = std::unique_ptr<py::dict>(new py::dict());
+    }
+    (*class_defs)[class_name] = class_def;
+    // cached function namespaces need to see the class definition as well
+    if (class_namespaces) {
+        for (auto &globals: (*class_namespaces)) {
+            globals[class_name] = class_def;
+        }
+    }
 }
\ No newline at end of file
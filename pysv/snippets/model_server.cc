@@ -0,0 +1,98 @@
+// the model server runs in its own Python process, launched with the same interpreter and
+// sys.path pysv is compiled with
+class ModelServerProcess {
+public:
+    explicit ModelServerProcess(const std::vector<std::string> &transport_args) {
+        std::vector<std::string> args = {PYTHON_EXECUTABLE, "-m", "pysv.server", "--model", MODEL_FILENAME};
+        args.insert(args.end(), transport_args.begin(), transport_args.end());
+        // the simulator may set up its own Python environment, which doesn't work with the interpreter
+        std::vector<std::string> env;
+        for (auto var = environ; *var; var++) {
+            std::string value = *var;
+            if (value.rfind("PYTHONHOME=", 0) == 0 || value.rfind("PYTHONPATH=", 0) == 0) continue;
+            env.emplace_back(value);
+        }
+        env.emplace_back(std::string("PYTHONPATH=") + PYTHON_PATH);
+        // keep the output in order with the simulator
+        env.emplace_back("PYTHONUNBUFFERED=1");
+
+        auto argv = to_c_array(args);
+        auto envp = to_c_array(env);
+        auto error = posix_spawn(&pid_, PYTHON_EXECUTABLE, nullptr, nullptr, argv.data(), envp.data());
+        if (error) {
+            pid_ = -1;
+            throw std::runtime_error("Unable to start Python model server: " + std::string(strerror(error)));
+        }
+    }
+
+    ~ModelServerProcess() {
+        if (pid_ > 0) {
+            kill(pid_, SIGKILL);
+            wait();
+        }
+    }
+
+    bool running() {
+        if (pid_ <= 0) return false;
+        int status;
+        if (waitpid(pid_, &status, WNOHANG) == pid_) {
+            pid_ = -1;
+            return false;
+        }
+        return true;
+    }
+
+    void wait() {
+        if (pid_ <= 0) return;
+        int status;
+        waitpid(pid_, &status, 0);
+        pid_ = -1;
+    }
+
+private:
+    pid_t pid_ = -1;
+
+    static std::vector<char *> to_c_array(std::vector<std::string> &values) {
+        std::vector<char *> result;
+        for (auto &value: values) result.emplace_back(&value[0]);
+        result.emplace_back(nullptr);
+        return result;
+    }
+};
+
+// waits for the model server. spins for a short while before yielding the core, so that
+// back-to-back calls don't pay for a context switch
+class Backoff {
+public:
+    void wait(ModelServerProcess &server) {
+        iterations_++;
+        if (iterations_ < SPIN_ITERATIONS) return;
+        // make sure the server is still there, otherwise the simulator hangs forever
+        if ((iterations_ % CHECK_INTERVAL) == 0 && !server.running()) {
+            throw std::runtime_error("Python model server exited unexpectedly");
+        }
+        if (iterations_ < YIELD_ITERATIONS) {
+            sched_yield();
+        } else {
+            timespec time = {0, SLEEP_NS};
+            nanosleep(&time, nullptr);
+        }
+    }
+
+    void reset() { iterations_ = 0; }
+
+private:
+    static constexpr uint64_t SPIN_ITERATIONS = 1 << 12;
+    static constexpr uint64_t YIELD_ITERATIONS = 1 << 14;
+    static constexpr uint64_t CHECK_INTERVAL = 1 << 8;
+    static constexpr long SLEEP_NS = 50000;
+    uint64_t iterations_ = 0;
+};
+
+// byte stream between the library and the model server
+class Transport {
+public:
+    virtual ~Transport() = default;
+    virtual void write(const char *data, size_t size) = 0;
+    virtual void read(char *data, size_t size) = 0;
+};
\ No newline at end of file
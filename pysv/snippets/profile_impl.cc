@@ -0,0 +1,146 @@
+#include <algorithm>
+#include <chrono>
+#include <condition_variable>
+#include <cstdlib>
+#include <fstream>
+#include <mutex>
+#include <string>
+#include <thread>
+
+// the python code can be profiled inside the simulator by setting PYSV_PROFILE when the interpreter starts.
+// "cprofile" writes the pstats of cProfile, and "sample" writes the stacks sampled every PYSV_PROFILE_INTERVAL
+// microseconds in the collapsed format used by flame graph tools
+std::unique_ptr<py::object> cprofile;
+
+uint64_t profile_now() {
+    return std::chrono::duration_cast<std::chrono::nanoseconds>(
+        std::chrono::steady_clock::now().time_since_epoch()).count();
+}
+
+// samples the python stacks of all the threads from a background thread, so the python code doesn't pay
+// anything between the samples
+class StackSampler {
+public:
+    explicit StackSampler(uint64_t interval_us)
+        : interval_(interval_us),
+          switch_interval_ns_(static_cast<uint64_t>(
+              py::module::import("sys").attr("getswitchinterval")().cast<double>() * 1e9)) {
+        thread_ = std::thread([this]() { run(); });
+    }
+
+    ~StackSampler() {
+        // the runtime may not be finalized, in which case the thread is stopped at exit
+        if (thread_.joinable()) stop();
+    }
+
+    void stop() {
+        {
+            std::lock_guard<std::mutex> lock(mutex_);
+            stopped_ = true;
+        }
+        cv_.notify_all();
+        // the thread may be waiting for the GIL
+        if (PyGILState_Check()) {
+            py::gil_scoped_release release;
+            thread_.join();
+        } else {
+            thread_.join();
+        }
+    }
+
+    void write(const char *filename) const {
+        std::vector<std::pair<std::string, uint64_t>> samples(counts_.begin(), counts_.end());
+        std::sort(samples.begin(), samples.end());
+        std::ofstream stream(filename);
+        for (auto const &sample: samples) {
+            stream << sample.first << " " << sample.second << "\n";
+        }
+    }
+
+private:
+    std::chrono::microseconds interval_;
+    uint64_t switch_interval_ns_;
+    std::thread thread_;
+    std::mutex mutex_;
+    std::condition_variable cv_;
+    bool stopped_ = false;
+    std::unordered_map<std::string, uint64_t> counts_;
+
+    void run() {
+        std::unique_lock<std::mutex> lock(mutex_);
+        while (!cv_.wait_for(lock, interval_, [this]() { return stopped_; })) {
+            lock.unlock();
+            sample();
+            lock.lock();
+        }
+    }
+
+    void sample() {
+        auto start = profile_now();
+        py::gil_scoped_acquire gil;
+        // a thread running python code hands over the GIL within the switch interval. a longer wait means the
+        // simulator thread held it between calls, and the stack it resumes with doesn't represent that time
+        if (profile_now() - start > 2 * switch_interval_ns_) return;
+        try {
+            // only threads that are running python code have a frame
+            auto frames = py::module::import("sys").attr("_current_frames")();
+            for (auto item: py::reinterpret_borrow<py::dict>(frames)) {
+                add_sample(item.second);
+            }
+        } catch (py::error_already_set &ex) {
+            // the profiler should never break the model code
+            ex.discard_as_unraisable(__func__);
+        }
+    }
+
+    void add_sample(py::handle frame) {
+        // only called once per interval, so the frames are walked through the python attributes
+        std::vector<std::string> names;
+        auto current = py::reinterpret_borrow<py::object>(frame);
+        while (!current.is_none()) {
+            auto code = current.attr("f_code");
+            names.emplace_back(py::str("{0} ({1}:{2})").format(code.attr("co_name"), code.attr("co_filename"),
+                                                              code.attr("co_firstlineno")));
+            current = current.attr("f_back");
+        }
+        std::string stack;
+        for (auto it = names.rbegin(); it != names.rend(); it++) {
+            if (!stack.empty()) stack += ";";
+            stack += *it;
+        }
+        counts_[stack]++;
+    }
+};
+
+std::unique_ptr<StackSampler> stack_sampler;
+
+void start_profiler() {
+    auto *mode = std::getenv("PYSV_PROFILE");
+    if (!mode || !*mode) return;
+    std::string name = mode;
+    if (name == "cprofile") {
+        auto profile = py::module::import("cProfile").attr("Profile")();
+        profile.attr("enable")();
+        cprofile = std::unique_ptr<py::object>(new py::object(profile));
+    } else if (name == "sample") {
+        auto *interval = std::getenv("PYSV_PROFILE_INTERVAL");
+        uint64_t interval_us = interval ? std::max<uint64_t>(std::strtoull(interval, nullptr, 10), 1) : 1000;
+        stack_sampler = std::unique_ptr<StackSampler>(new StackSampler(interval_us));
+    } else {
+        std::cerr << "Unknown PYSV_PROFILE mode " << name << ", expected cprofile or sample" << std::endl;
+    }
+}
+
+void stop_profiler() {
+    auto *filename = std::getenv("PYSV_PROFILE_FILE");
+    if (cprofile) {
+        cprofile->attr("disable")();
+        cprofile->attr("dump_stats")(filename ? filename : "pysv_profile.pstats");
+        cprofile.reset();
+    }
+    if (stack_sampler) {
+        stack_sampler->stop();
+        stack_sampler->write(filename ? filename : "pysv_profile.collapsed");
+        stack_sampler.reset();
+    }
+}
\ No newline at end of file
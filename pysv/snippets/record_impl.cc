@@ -0,0 +1,307 @@
+#include <condition_variable>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <deque>
+#include <exception>
+#include <mutex>
+#include <string>
+#include <thread>
+#include <type_traits>
+#include "svdpi.h"
+#ifdef PYSV_ZLIB
+#include <zlib.h>
+#endif
+
+// every DPI call is appended to a binary log, which pysv.replay reads back without the simulator. the file starts
+// with the function table, followed by chunks that are compressed and written by a background thread
+constexpr const char *RECORD_MAGIC = "PYSVREC1";
+constexpr size_t RECORD_CHUNK_SIZE = 1 << 20;
+// the simulator thread only waits for the writer if it falls this many chunks behind
+constexpr size_t RECORD_MAX_PENDING_CHUNKS = 64;
+enum RecordKind { RECORD_CALL = 1, RECORD_FINALIZE = 2 };
+enum RecordCodec { RECORD_RAW = 0, RECORD_ZLIB = 1 };
+// each value starts with its tag, so the log can be read without the function types
+enum RecordTag {
+    TAG_INT = 1, TAG_UINT = 2, TAG_FLOAT = 3, TAG_STRING = 4, TAG_HANDLE = 5, TAG_ARRAY = 6, TAG_BITS = 7,
+    TAG_SHAPE = 8
+};
+
+template<typename T>
+void append_raw(std::string &buffer, T value) {
+    buffer.append(reinterpret_cast<const char *>(&value), sizeof(T));
+}
+
+class CallRecorder {
+public:
+    void open() {
+        if (file_) return;
+        auto *filename = std::getenv("PYSV_RECORD_FILE");
+        file_ = std::fopen(filename ? filename : "pysv_record.bin", has_header_ ? "ab" : "wb");
+        if (!file_) throw std::runtime_error("Unable to open the record file");
+        if (!has_header_) {
+            std::string header(RECORD_MAGIC);
+            append_raw<uint32_t>(header, NUM_FUNCTION_DEFS);
+            for (size_t i = 0; i < NUM_FUNCTION_DEFS; i++) {
+                append_raw<uint32_t>(header, std::strlen(FUNCTION_NAMES[i]));
+                header += FUNCTION_NAMES[i];
+            }
+            std::fwrite(header.data(), 1, header.size(), file_);
+            has_header_ = true;
+        }
+        stop_ = false;
+        chunk_.reserve(RECORD_CHUNK_SIZE * 2);
+        writer_ = std::thread(&CallRecorder::write_chunks, this);
+    }
+
+    bool is_open() const { return file_ != nullptr; }
+
+    void append(const std::string &record) {
+        chunk_ += record;
+        if (chunk_.size() >= RECORD_CHUNK_SIZE) submit();
+    }
+
+    void close() {
+        if (!file_) return;
+        submit();
+        {
+            std::lock_guard<std::mutex> lock(mutex_);
+            stop_ = true;
+        }
+        ready_.notify_one();
+        writer_.join();
+        std::fclose(file_);
+        file_ = nullptr;
+    }
+
+    ~CallRecorder() { close(); }
+
+private:
+    FILE *file_ = nullptr;
+    std::string chunk_;
+    std::deque<std::string> chunks_;
+    std::mutex mutex_;
+    std::condition_variable ready_;
+    std::condition_variable written_;
+    std::thread writer_;
+    bool stop_ = false;
+    // calls after a finalize are appended to the same file
+    bool has_header_ = false;
+
+    void submit() {
+        if (chunk_.empty()) return;
+        {
+            std::unique_lock<std::mutex> lock(mutex_);
+            written_.wait(lock, [this]() { return chunks_.size() < RECORD_MAX_PENDING_CHUNKS; });
+            chunks_.emplace_back(std::move(chunk_));
+        }
+        ready_.notify_one();
+        chunk_ = std::string();
+        chunk_.reserve(RECORD_CHUNK_SIZE * 2);
+    }
+
+    void write_chunks() {
+        while (true) {
+            std::string chunk;
+            {
+                std::unique_lock<std::mutex> lock(mutex_);
+                ready_.wait(lock, [this]() { return stop_ || !chunks_.empty(); });
+                if (chunks_.empty()) return;
+                chunk = std::move(chunks_.front());
+                chunks_.pop_front();
+            }
+            written_.notify_one();
+            write_chunk(chunk);
+        }
+    }
+
+    void write_chunk(const std::string &chunk) {
+        // each chunk is stored as codec, raw size, stored size and the data
+        std::string header;
+        const std::string *data = &chunk;
+#ifdef PYSV_ZLIB
+        std::string compressed(compressBound(chunk.size()), '\0');
+        auto size = static_cast<uLongf>(compressed.size());
+        if (compress2(reinterpret_cast<Bytef *>(&compressed[0]), &size,
+                      reinterpret_cast<const Bytef *>(chunk.data()), chunk.size(), Z_BEST_SPEED) == Z_OK) {
+            compressed.resize(size);
+            data = &compressed;
+        }
+#endif
+        append_raw<uint8_t>(header, data == &chunk ? RECORD_RAW : RECORD_ZLIB);
+        append_raw<uint32_t>(header, chunk.size());
+        append_raw<uint32_t>(header, data->size());
+        std::fwrite(header.data(), 1, header.size(), file_);
+        std::fwrite(data->data(), 1, data->size(), file_);
+    }
+} call_recorder;
+
+// buffers of the calls in progress, one per nesting level so that the memory is reused
+std::deque<std::string> record_buffers;
+size_t record_depth = 0;
+
+// a call is recorded as its function id, status, arguments and results. the arguments are written before
+// the python function runs, since arrays may be changed in place
+class CallRecord {
+public:
+    explicit CallRecord(size_t func_id) : exceptions_(uncaught_exceptions()) {
+        // the file is opened on the first call, so that errors are reported to the simulator
+        call_recorder.open();
+        if (record_buffers.size() <= record_depth) record_buffers.emplace_back();
+        buffer_ = &record_buffers[record_depth++];
+        buffer_->clear();
+        append_raw<uint8_t>(*buffer_, RECORD_CALL);
+        append_raw<uint32_t>(*buffer_, func_id);
+        // status and number of arguments are filled in at the end
+        append_raw<uint8_t>(*buffer_, 0);
+        append_raw<uint8_t>(*buffer_, 0);
+    }
+
+    template<typename T>
+    typename std::enable_if<std::is_floating_point<T>::value>::type write(T value) {
+        begin_value(TAG_FLOAT);
+        append_raw<double>(*buffer_, value);
+    }
+
+    template<typename T>
+    typename std::enable_if<std::is_integral<T>::value && std::is_signed<T>::value>::type write(T value) {
+        begin_value(TAG_INT);
+        append_raw<int64_t>(*buffer_, value);
+    }
+
+    template<typename T>
+    typename std::enable_if<std::is_integral<T>::value && std::is_unsigned<T>::value>::type write(T value) {
+        begin_value(TAG_UINT);
+        append_raw<uint64_t>(*buffer_, value);
+    }
+
+    void write(const char *value) {
+        begin_value(TAG_STRING);
+        auto size = std::strlen(value);
+        append_raw<uint32_t>(*buffer_, size);
+        buffer_->append(value, size);
+    }
+
+    void write_handle(void *value) {
+        begin_value(TAG_HANDLE);
+        append_raw<uint64_t>(*buffer_, reinterpret_cast<uintptr_t>(value));
+    }
+
+    template<typename T>
+    void write_array(const svOpenArrayHandle array_handle) {
+        write_array_data(array_handle, sizeof(T), py::format_descriptor<T>::format());
+    }
+
+    template<typename T = void>
+    void write_struct_array(const svOpenArrayHandle array_handle, size_t itemsize) {
+        // the fields are decoded with the struct type of the function
+        write_array_data(array_handle, itemsize, "V");
+    }
+
+    // output arrays are not initialized before the call, so only their shape is recorded
+    template<typename T>
+    void write_array_shape(const svOpenArrayHandle array_handle) {
+        write_array_data(array_handle, sizeof(T), py::format_descriptor<T>::format(), false);
+    }
+
+    template<typename T = void>
+    void write_struct_array_shape(const svOpenArrayHandle array_handle, size_t itemsize) {
+        write_array_data(array_handle, itemsize, "V", false);
+    }
+
+    void write_bits(const svBitVecVal *value, int width) {
+        begin_bits(width);
+        for (int i = 0; i < SV_PACKED_DATA_NELEMS(width); i++) append_raw<svBitVecVal>(*buffer_, value[i]);
+    }
+
+    void write_logic(const svLogicVecVal *value, int width) {
+        // same as the conversion to python, x and z are recorded as 0
+        begin_bits(width);
+        for (int i = 0; i < SV_PACKED_DATA_NELEMS(width); i++) {
+            append_raw<svBitVecVal>(*buffer_, value[i].aval & ~value[i].bval);
+        }
+    }
+
+    void begin_results() {
+        results_pos_ = buffer_->size();
+        append_raw<uint8_t>(*buffer_, 0);
+    }
+
+    ~CallRecord() {
+        record_depth--;
+        if (uncaught_exceptions() > exceptions_) {
+            // results of a failed call are not recorded
+            (*buffer_)[5] = 1;
+            if (results_pos_) buffer_->resize(results_pos_);
+            results_pos_ = 0;
+        }
+        (*buffer_)[6] = static_cast<char>(num_args_);
+        if (results_pos_) {
+            (*buffer_)[results_pos_] = static_cast<char>(num_results_);
+        } else {
+            append_raw<uint8_t>(*buffer_, 0);
+        }
+        call_recorder.append(*buffer_);
+    }
+
+private:
+    std::string *buffer_;
+    int exceptions_;
+    size_t results_pos_ = 0;
+    int num_args_ = 0;
+    int num_results_ = 0;
+
+    void begin_value(RecordTag tag) {
+        if (results_pos_) {
+            num_results_++;
+        } else {
+            num_args_++;
+        }
+        append_raw<uint8_t>(*buffer_, tag);
+    }
+
+    void begin_bits(int width) {
+        begin_value(TAG_BITS);
+        append_raw<uint32_t>(*buffer_, width);
+    }
+
+    // only instantiated when there are arrays, since the simulator provides the array functions
+    template<typename T = void>
+    void write_array_data(const svOpenArrayHandle array_handle, size_t itemsize, const std::string &format,
+                          bool with_data = true) {
+        auto *data = svGetArrayPtr(array_handle);
+        if (!data) {
+            throw std::runtime_error("Array type does not have native C representation");
+        }
+        begin_value(with_data ? TAG_ARRAY : TAG_SHAPE);
+        append_raw<uint32_t>(*buffer_, itemsize);
+        append_raw<uint8_t>(*buffer_, format.size());
+        *buffer_ += format;
+        auto dim = svDimensions(array_handle);
+        append_raw<uint8_t>(*buffer_, dim);
+        auto size = itemsize;
+        for (auto i = 1; i <= dim; i++) {
+            auto s = svSize(array_handle, i);
+            append_raw<uint64_t>(*buffer_, s);
+            size *= s;
+        }
+        if (with_data) buffer_->append(reinterpret_cast<const char *>(data), size);
+    }
+
+    static int uncaught_exceptions() {
+#if __cplusplus >= 201703L
+        return std::uncaught_exceptions();
+#else
+        return std::uncaught_exception() ? 1 : 0;
+#endif
+    }
+};
+
+void finish_call_recording() {
+    if (!call_recorder.is_open()) return;
+    // the objects are gone after finalize, so the replay starts over from this point
+    std::string record;
+    append_raw<uint8_t>(record, RECORD_FINALIZE);
+    call_recorder.append(record);
+    call_recorder.close();
+}
\ No newline at end of file
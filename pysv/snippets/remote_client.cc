@@ -0,0 +1,205 @@
+// request kinds, response status and value tags. needs to match pysv/server.py
+// values are written in the host byte order, which is little endian on all the supported platforms
+constexpr uint8_t REMOTE_CALL = 0;
+constexpr uint8_t REMOTE_POST = 1;
+constexpr uint8_t REMOTE_LIVE_OBJECTS = 2;
+constexpr uint8_t REMOTE_SHUTDOWN = 3;
+constexpr uint8_t REMOTE_STATUS_OK = 0;
+constexpr char TAG_BOOL = '?';
+constexpr char TAG_INT = 'q';
+constexpr char TAG_UINT = 'Q';
+constexpr char TAG_DOUBLE = 'd';
+constexpr char TAG_STRING = 's';
+constexpr char TAG_OBJECT = 'o';
+constexpr char TAG_TUPLE = 't';
+
+class RemoteResponse {
+public:
+    explicit RemoteResponse(std::vector<char> data) : data_(std::move(data)) {}
+
+    bool read_bit() {
+        auto tag = get<char>();
+        if (tag == TAG_BOOL) return get<uint8_t>() != 0;
+        return read_number<uint64_t>(tag) != 0;
+    }
+
+    uint64_t read_integer() {
+        auto tag = get<char>();
+        if (tag == TAG_BOOL) return get<uint8_t>();
+        return read_number<uint64_t>(tag);
+    }
+
+    double read_double() { return read_number<double>(get<char>()); }
+
+    std::string read_string() {
+        check_tag(get<char>(), TAG_STRING);
+        auto size = get<uint32_t>();
+        check_size(size);
+        std::string result(data_.data() + pos_, size);
+        pos_ += size;
+        return result;
+    }
+
+    void *read_object() {
+        check_tag(get<char>(), TAG_OBJECT);
+        return reinterpret_cast<void *>(static_cast<uintptr_t>(get<uint64_t>()));
+    }
+
+    void read_tuple(uint32_t size) {
+        // multiple outputs are returned as a tuple
+        if (get<char>() != TAG_TUPLE || get<uint32_t>() != size) {
+            throw std::runtime_error("Invalid return tuple size");
+        }
+    }
+
+private:
+    std::vector<char> data_;
+    // skip the status
+    size_t pos_ = 1;
+
+    template<class T>
+    T get() {
+        check_size(sizeof(T));
+        T value;
+        std::memcpy(&value, data_.data() + pos_, sizeof(T));
+        pos_ += sizeof(T);
+        return value;
+    }
+
+    template<class T>
+    T read_number(char tag) {
+        if (tag == TAG_INT) return static_cast<T>(get<int64_t>());
+        if (tag == TAG_UINT) return static_cast<T>(get<uint64_t>());
+        if (tag == TAG_DOUBLE) return static_cast<T>(get<double>());
+        throw std::runtime_error("Invalid return value type from Python model");
+    }
+
+    void check_size(size_t size) const {
+        if (pos_ + size > data_.size()) throw std::runtime_error("Invalid response from Python model");
+    }
+
+    static void check_tag(char tag, char expected) {
+        if (tag != expected) throw std::runtime_error("Invalid return value type from Python model");
+    }
+};
+
+// serializes the DPI calls into frames. calls without any result are buffered and sent together
+// with the next call that needs one, so that the simulator doesn't wait for the model on every call.
+// only the simulator thread is expected to make DPI calls
+class RemoteClient {
+public:
+    explicit RemoteClient(std::unique_ptr<Transport> transport) : transport_(std::move(transport)) {}
+
+    void begin(uint8_t kind, uint32_t func_id) {
+        frame_start_ = buffer_.size();
+        // frame size is filled in once all the arguments are written
+        put<uint32_t>(0);
+        put(kind);
+        put(func_id);
+    }
+
+    void write_bool(bool value) {
+        put(TAG_BOOL);
+        put<uint8_t>(value ? 1 : 0);
+    }
+
+    void write_int(int64_t value) {
+        put(TAG_INT);
+        put(value);
+    }
+
+    void write_uint(uint64_t value) {
+        put(TAG_UINT);
+        put(value);
+    }
+
+    void write_double(double value) {
+        put(TAG_DOUBLE);
+        put(value);
+    }
+
+    void write_string(const char *value) {
+        auto size = static_cast<uint32_t>(std::strlen(value));
+        put(TAG_STRING);
+        put(size);
+        buffer_.insert(buffer_.end(), value, value + size);
+    }
+
+    void write_object(void *value) {
+        put(TAG_OBJECT);
+        put<uint64_t>(reinterpret_cast<uintptr_t>(value));
+    }
+
+    void post() {
+        end_frame();
+        if (buffer_.size() >= FLUSH_SIZE) flush();
+    }
+
+    RemoteResponse call() {
+        end_frame();
+        flush();
+        uint32_t size;
+        transport_->read(reinterpret_cast<char *>(&size), sizeof(size));
+        std::vector<char> data(size);
+        transport_->read(data.data(), size);
+        auto ok = size > 0 && data[0] == REMOTE_STATUS_OK;
+        RemoteResponse response(std::move(data));
+        if (!ok) {
+            // the error message is the Python traceback
+            throw std::runtime_error(response.read_string());
+        }
+        return response;
+    }
+
+    void shutdown() {
+        // the response carries the error of a posted call that is not reported yet
+        begin(REMOTE_SHUTDOWN, 0);
+        call();
+    }
+
+private:
+    static constexpr size_t FLUSH_SIZE = 1 << 16;
+    std::unique_ptr<Transport> transport_;
+    std::vector<char> buffer_;
+    size_t frame_start_ = 0;
+
+    template<class T>
+    void put(T value) {
+        auto pos = buffer_.size();
+        buffer_.resize(pos + sizeof(T));
+        std::memcpy(buffer_.data() + pos, &value, sizeof(T));
+    }
+
+    void end_frame() {
+        auto size = static_cast<uint32_t>(buffer_.size() - frame_start_ - sizeof(uint32_t));
+        std::memcpy(buffer_.data() + frame_start_, &size, sizeof(size));
+    }
+
+    void flush() {
+        if (buffer_.empty()) return;
+        transport_->write(buffer_.data(), buffer_.size());
+        buffer_.clear();
+    }
+};
+
+std::unique_ptr<RemoteClient> remote_client;
+std::string string_result_value;
+
+RemoteClient &get_remote_client() {
+    // the model server is started on the first call
+    if (!remote_client) {
+        remote_client = std::unique_ptr<RemoteClient>(new RemoteClient(create_transport()));
+    }
+    return *remote_client;
+}
+
+void shutdown_remote_client() {
+    if (!remote_client) return;
+    try {
+        // pending calls are sent before the shutdown request
+        remote_client->shutdown();
+    } catch (const std::exception &ex) {
+        std::cerr << "ERROR: " << ex.what() << std::endl;
+    }
+    remote_client.reset();
+}
\ No newline at end of file
@@ -0,0 +1 @@
+    shutdown_remote_client();
\ No newline at end of file
@@ -0,0 +1,4 @@
+    auto &client = get_remote_client();
+    client.begin(REMOTE_LIVE_OBJECTS, 0);
+    client.write_string(class_name);
+    return static_cast<int32_t>(client.call().read_integer());
\ No newline at end of file
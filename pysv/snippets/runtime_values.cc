@@ -1,6 +1,28 @@
-namespace py = pybind11;
 std::unique_ptr<std::unordered_map<std::string, py::object>> global_imports = nullptr;
 std::unique_ptr<py::scoped_interpreter> guard = nullptr;
-std::unique_ptr<std::unordered_map<void*, py::object>> py_obj_map;
+// set once the interpreter and sys.path are fully set up, so the check on every call is a
+// single load and branch
+std::atomic<bool> runtime_ready(false);
+// simulator thread state while the GIL is released
+PyThreadState *main_thread_state = nullptr;
+std::unique_ptr<HandleTable> py_obj_table;
 std::unique_ptr<py::dict> class_defs;
+std::unique_ptr<std::vector<py::dict>> class_namespaces;
+// cached Python definition for each exported function. class methods also keep the type
+// the attribute is resolved from, the interned method name, and how the attribute is called
+struct FunctionDef {
+    py::object func;
+    py::object type;
+    py::object name;
+    int call_mode = 0;
+    descrgetfunc descr_get = nullptr;
+};
+std::unique_ptr<std::vector<FunctionDef>> function_defs;
+// used to create numpy views for vectorized batch functions and structs
+std::unique_ptr<py::object> numpy_asarray;
+std::unique_ptr<py::object> numpy_frombuffer;
+// numpy dtypes of the packed structs, indexed by the struct id
+std::unique_ptr<std::vector<py::object>> struct_dtypes;
+// increased every time the runtime is finalized, which invalidates the cached array views
+size_t runtime_epoch = 0;
 std::string string_result_value;
@@ -0,0 +1,138 @@
+// the model server publishes the ring positions without any fence, which is only safe with the
+// store ordering of x86. see pysv/server.py
+#if !defined(__x86_64__) && !defined(__i386__)
+#error "Shared memory runtime is only supported on x86 hosts, use Runtime.Socket instead"
+#endif
+
+// shared memory layout. needs to match pysv/server.py
+// positions are kept in separate cache lines to avoid false sharing between the two processes
+constexpr size_t SHM_READY = 0;
+constexpr size_t SHM_CAPACITY = 8;
+constexpr size_t SHM_REQUEST_HEAD = 64;
+constexpr size_t SHM_REQUEST_TAIL = 128;
+constexpr size_t SHM_RESPONSE_HEAD = 192;
+constexpr size_t SHM_RESPONSE_TAIL = 256;
+constexpr size_t SHM_DATA = 512;
+constexpr uint64_t SHM_RING_SIZE = 1 << 20;
+
+inline uint64_t shm_load(char *base, size_t offset) {
+    return __atomic_load_n(reinterpret_cast<uint64_t *>(base + offset), __ATOMIC_ACQUIRE);
+}
+
+inline void shm_store(char *base, size_t offset, uint64_t value) {
+    __atomic_store_n(reinterpret_cast<uint64_t *>(base + offset), value, __ATOMIC_RELEASE);
+}
+
+// single producer, single consumer byte ring. head and tail are monotonically increasing byte
+// counts, and each side only updates its own position after the data is copied, so no lock is needed
+class ShmRing {
+public:
+    ShmRing(char *base, size_t head, size_t tail, size_t data)
+        : base_(base), head_(head), tail_(tail), data_(base + data) {}
+
+    void write(const char *data, size_t size, ModelServerProcess &server) {
+        auto head = shm_load(base_, head_);
+        Backoff backoff;
+        while (size > 0) {
+            auto free = SHM_RING_SIZE - (head - shm_load(base_, tail_));
+            if (!free) {
+                backoff.wait(server);
+                continue;
+            }
+            backoff.reset();
+            auto start = head % SHM_RING_SIZE;
+            auto chunk = std::min<uint64_t>({size, free, SHM_RING_SIZE - start});
+            std::memcpy(data_ + start, data, chunk);
+            data += chunk;
+            size -= chunk;
+            head += chunk;
+            shm_store(base_, head_, head);
+        }
+    }
+
+    void read(char *data, size_t size, ModelServerProcess &server) {
+        auto tail = shm_load(base_, tail_);
+        Backoff backoff;
+        while (size > 0) {
+            auto available = shm_load(base_, head_) - tail;
+            if (!available) {
+                backoff.wait(server);
+                continue;
+            }
+            backoff.reset();
+            auto start = tail % SHM_RING_SIZE;
+            auto chunk = std::min<uint64_t>({size, available, SHM_RING_SIZE - start});
+            std::memcpy(data, data_ + start, chunk);
+            data += chunk;
+            size -= chunk;
+            tail += chunk;
+            shm_store(base_, tail_, tail);
+        }
+    }
+
+private:
+    char *base_;
+    size_t head_;
+    size_t tail_;
+    char *data_;
+};
+
+class ShmTransport : public Transport {
+public:
+    ShmTransport() {
+        // prefer the memory backed file system
+        std::string filename = access("/dev/shm", W_OK) == 0 ? "/dev/shm/pysv-XXXXXX" : "/tmp/pysv-XXXXXX";
+        auto fd = mkstemp(&filename[0]);
+        if (fd < 0) throw std::runtime_error("Unable to create shared memory file " + filename);
+        size_ = SHM_DATA + 2 * SHM_RING_SIZE;
+        void *ptr = MAP_FAILED;
+        if (ftruncate(fd, size_) == 0) {
+            ptr = mmap(nullptr, size_, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+        }
+        close(fd);
+        if (ptr == MAP_FAILED) {
+            unlink(filename.c_str());
+            throw std::runtime_error("Unable to map shared memory file " + filename);
+        }
+        base_ = static_cast<char *>(ptr);
+        // the file is zero filled, so both rings start out empty
+        shm_store(base_, SHM_CAPACITY, SHM_RING_SIZE);
+        requests_ = std::unique_ptr<ShmRing>(new ShmRing(base_, SHM_REQUEST_HEAD, SHM_REQUEST_TAIL, SHM_DATA));
+        responses_ = std::unique_ptr<ShmRing>(
+            new ShmRing(base_, SHM_RESPONSE_HEAD, SHM_RESPONSE_TAIL, SHM_DATA + SHM_RING_SIZE));
+
+        try {
+            server_ = std::unique_ptr<ModelServerProcess>(new ModelServerProcess({"--shm", filename}));
+            // wait for the server to load the model
+            Backoff backoff;
+            while (!shm_load(base_, SHM_READY)) backoff.wait(*server_);
+        } catch (...) {
+            server_.reset();
+            unlink(filename.c_str());
+            munmap(base_, size_);
+            throw;
+        }
+        // both sides have the file mapped at this point
+        unlink(filename.c_str());
+    }
+
+    ~ShmTransport() override {
+        // the server exits after the shutdown request
+        server_->wait();
+        munmap(base_, size_);
+    }
+
+    void write(const char *data, size_t size) override { requests_->write(data, size, *server_); }
+    void read(char *data, size_t size) override { responses_->read(data, size, *server_); }
+
+private:
+    char *base_ = nullptr;
+    size_t size_ = 0;
+    std::unique_ptr<ShmRing> requests_;
+    std::unique_ptr<ShmRing> responses_;
+    std::unique_ptr<ModelServerProcess> server_;
+};
+
+std::unique_ptr<Transport> create_transport() {
+    return std::unique_ptr<Transport>(new ShmTransport());
+}
\ No newline at end of file
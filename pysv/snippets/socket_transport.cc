@@ -0,0 +1,137 @@
+#include <cerrno>
+#include <cstdlib>
+#include <netdb.h>
+#include <netinet/in.h>
+#include <netinet/tcp.h>
+#include <sys/socket.h>
+#include <sys/un.h>
+
+#ifdef MSG_NOSIGNAL
+constexpr int SOCKET_SEND_FLAGS = MSG_NOSIGNAL;
+#else
+constexpr int SOCKET_SEND_FLAGS = 0;
+#endif
+
+// address is either unix:<path> or tcp:<host>:<port>. returns -1 if the server is not reachable
+int connect_socket(const std::string &address) {
+    if (address.rfind("unix:", 0) == 0) {
+        auto path = address.substr(5);
+        sockaddr_un addr = {};
+        addr.sun_family = AF_UNIX;
+        if (path.size() >= sizeof(addr.sun_path)) throw std::runtime_error("Socket path is too long: " + path);
+        std::strncpy(addr.sun_path, path.c_str(), sizeof(addr.sun_path) - 1);
+        auto fd = socket(AF_UNIX, SOCK_STREAM, 0);
+        if (fd < 0) return -1;
+        if (connect(fd, reinterpret_cast<sockaddr *>(&addr), sizeof(addr)) != 0) {
+            close(fd);
+            return -1;
+        }
+        return fd;
+    }
+    auto host_port = address.rfind("tcp:", 0) == 0 ? address.substr(4) : address;
+    auto pos = host_port.rfind(':');
+    if (pos == std::string::npos) throw std::runtime_error("Invalid model server address " + address);
+    auto host = host_port.substr(0, pos);
+    auto port = host_port.substr(pos + 1);
+    addrinfo hints = {};
+    hints.ai_family = AF_UNSPEC;
+    hints.ai_socktype = SOCK_STREAM;
+    addrinfo *infos;
+    if (getaddrinfo(host.c_str(), port.c_str(), &hints, &infos) != 0) return -1;
+    int fd = -1;
+    for (auto info = infos; info; info = info->ai_next) {
+        fd = socket(info->ai_family, info->ai_socktype, info->ai_protocol);
+        if (fd < 0) continue;
+        if (connect(fd, info->ai_addr, info->ai_addrlen) == 0) break;
+        close(fd);
+        fd = -1;
+    }
+    freeaddrinfo(infos);
+    if (fd >= 0) {
+        // small synchronous calls should not be delayed
+        int flag = 1;
+        setsockopt(fd, IPPROTO_TCP, TCP_NODELAY, &flag, sizeof(flag));
+    }
+    return fd;
+}
+
+class SocketTransport : public Transport {
+public:
+    SocketTransport() {
+        // the server address can be changed without recompiling the library
+        auto env_address = std::getenv("PYSV_SERVER");
+        std::string address = env_address ? env_address : SERVER_ADDRESS;
+        if (address.empty()) {
+            start_local_server();
+        } else {
+            fd_ = connect_socket(address);
+            if (fd_ < 0) throw std::runtime_error("Unable to connect to Python model server at " + address);
+        }
+#ifdef SO_NOSIGPIPE
+        int flag = 1;
+        setsockopt(fd_, SOL_SOCKET, SO_NOSIGPIPE, &flag, sizeof(flag));
+#endif
+    }
+
+    ~SocketTransport() override {
+        close(fd_);
+        // the local server exits once the connection is closed
+        if (server_) server_->wait();
+    }
+
+    void write(const char *data, size_t size) override {
+        while (size > 0) {
+            auto n = send(fd_, data, size, SOCKET_SEND_FLAGS);
+            if (n < 0) {
+                if (errno == EINTR) continue;
+                throw std::runtime_error("Unable to send to Python model server: " + std::string(strerror(errno)));
+            }
+            data += n;
+            size -= n;
+        }
+    }
+
+    void read(char *data, size_t size) override {
+        while (size > 0) {
+            auto n = recv(fd_, data, size, 0);
+            if (n == 0) throw std::runtime_error("Python model server closed the connection");
+            if (n < 0) {
+                if (errno == EINTR) continue;
+                throw std::runtime_error("Unable to receive from Python model server: " +
+                                         std::string(strerror(errno)));
+            }
+            data += n;
+            size -= n;
+        }
+    }
+
+private:
+    int fd_ = -1;
+    std::unique_ptr<ModelServerProcess> server_;
+
+    void start_local_server() {
+        // no server is given, start one on a Unix domain socket
+        std::string dir = "/tmp/pysv-XXXXXX";
+        if (!mkdtemp(&dir[0])) throw std::runtime_error("Unable to create socket directory " + dir);
+        auto path = dir + "/server.sock";
+        auto address = "unix:" + path;
+        try {
+            server_ = std::unique_ptr<ModelServerProcess>(new ModelServerProcess({"--listen", address, "--once"}));
+            // wait for the server to load the model
+            Backoff backoff;
+            while ((fd_ = connect_socket(address)) < 0) backoff.wait(*server_);
+        } catch (...) {
+            server_.reset();
+            unlink(path.c_str());
+            rmdir(dir.c_str());
+            throw;
+        }
+        // the server only accepts one connection
+        unlink(path.c_str());
+        rmdir(dir.c_str());
+    }
+};
+
+std::unique_ptr<Transport> create_transport() {
+    return std::unique_ptr<Transport>(new SocketTransport());
+}
\ No newline at end of file
@@ -0,0 +1,158 @@
+#include <chrono>
+#include <cstdlib>
+#include <exception>
+#include <fstream>
+
+// per function call statistics. they are only touched by the simulator thread and don't hold any python
+// object, so they outlive the interpreter and can be reported at any time
+constexpr int STATS_NUM_BUCKETS = 48;
+enum StatsStage { STATS_ARGS = 0, STATS_PYTHON = 1, STATS_RESULT = 2, STATS_NUM_STAGES = 3 };
+const char *STATS_STAGE_NAMES[] = {"args", "python", "result"};
+
+// bucket i counts the samples within [2^(i-1), 2^i) nanoseconds
+struct StatsHistogram {
+    uint64_t total_ns = 0;
+    uint64_t max_ns = 0;
+    uint64_t buckets[STATS_NUM_BUCKETS] = {};
+
+    void add(uint64_t ns) {
+        total_ns += ns;
+        if (ns > max_ns) max_ns = ns;
+        int bucket = 0;
+        while (ns && bucket < STATS_NUM_BUCKETS - 1) {
+            ns >>= 1;
+            bucket++;
+        }
+        buckets[bucket]++;
+    }
+};
+
+struct FunctionStats {
+    uint64_t calls = 0;
+    uint64_t errors = 0;
+    // calls answered by the cache or the table, which don't run any stage
+    uint64_t cached = 0;
+    StatsHistogram stages[STATS_NUM_STAGES];
+};
+
+FunctionStats function_stats[NUM_FUNCTION_NAMES];
+// set when there are calls that are not in the report yet
+bool stats_pending = false;
+
+// times the stages of a DPI call. the last stage ends when the timer goes out of scope, which is after the
+// return value is converted
+class StatsTimer {
+public:
+    explicit StatsTimer(size_t func_id) : stats_(function_stats[func_id]), exceptions_(uncaught_exceptions()) {
+        stats_.calls++;
+        stats_pending = true;
+        last_ = now();
+    }
+
+    void lap(StatsStage stage) {
+        auto time = now();
+        stats_.stages[stage].add(time - last_);
+        last_ = time;
+        stage_ = stage + 1;
+    }
+
+    void cached() {
+        stats_.cached++;
+        stage_ = STATS_NUM_STAGES;
+    }
+
+    ~StatsTimer() {
+        if (uncaught_exceptions() > exceptions_) {
+            stats_.errors++;
+        } else if (stage_ < STATS_NUM_STAGES) {
+            lap(static_cast<StatsStage>(stage_));
+        }
+    }
+
+private:
+    FunctionStats &stats_;
+    int exceptions_;
+    uint64_t last_ = 0;
+    // calls without any lap are counted as python execution
+    int stage_ = STATS_PYTHON;
+
+    static uint64_t now() {
+        // monotonic clock, which doesn't jump with the wall time
+        return std::chrono::duration_cast<std::chrono::nanoseconds>(
+            std::chrono::steady_clock::now().time_since_epoch()).count();
+    }
+
+    static int uncaught_exceptions() {
+#if __cplusplus >= 201703L
+        return std::uncaught_exceptions();
+#else
+        return std::uncaught_exception() ? 1 : 0;
+#endif
+    }
+};
+
+py::dict read_stats() {
+    py::dict result;
+    for (size_t i = 0; i < NUM_FUNCTION_NAMES; i++) {
+        auto &stats = function_stats[i];
+        if (!stats.calls) continue;
+        py::dict entry;
+        entry["calls"] = stats.calls;
+        entry["errors"] = stats.errors;
+        entry["cached"] = stats.cached;
+        for (int stage = 0; stage < STATS_NUM_STAGES; stage++) {
+            auto &histogram = stats.stages[stage];
+            py::dict stage_entry;
+            stage_entry["total_ns"] = histogram.total_ns;
+            stage_entry["max_ns"] = histogram.max_ns;
+            py::list buckets;
+            for (auto count: histogram.buckets) buckets.append(count);
+            stage_entry["histogram"] = buckets;
+            entry[STATS_STAGE_NAMES[stage]] = stage_entry;
+        }
+        result[FUNCTION_NAMES[i]] = entry;
+    }
+    return result;
+}
+
+void add_stats_module() {
+    // the counters can be read live from the python code running inside the simulator, through
+    // pysv_stats.read(). the module is added whenever the interpreter starts, before any model code is imported
+    auto module = py::module::import("types").attr("ModuleType")("pysv_stats");
+    module.attr("read") = py::cpp_function(&read_stats);
+    py::module::import("sys").attr("modules")["pysv_stats"] = module;
+}
+
+void write_stats_report() {
+    stats_pending = false;
+    auto *filename = std::getenv("PYSV_STATS_FILE");
+    std::ofstream stream(filename ? filename : "pysv_stats.json");
+    stream << "{";
+    bool first = true;
+    for (size_t i = 0; i < NUM_FUNCTION_NAMES; i++) {
+        auto &stats = function_stats[i];
+        if (!stats.calls) continue;
+        if (!first) stream << ",";
+        first = false;
+        stream << "\n  \"" << FUNCTION_NAMES[i] << "\": {\"calls\": " << stats.calls << ", \"errors\": "
+               << stats.errors << ", \"cached\": " << stats.cached;
+        for (int stage = 0; stage < STATS_NUM_STAGES; stage++) {
+            auto &histogram = stats.stages[stage];
+            stream << ", \"" << STATS_STAGE_NAMES[stage] << "\": {\"total_ns\": " << histogram.total_ns
+                   << ", \"max_ns\": " << histogram.max_ns << ", \"histogram\": [";
+            for (int bucket = 0; bucket < STATS_NUM_BUCKETS; bucket++) {
+                stream << (bucket ? ", " : "") << histogram.buckets[bucket];
+            }
+            stream << "]}";
+        }
+        stream << "}";
+    }
+    stream << "\n}\n";
+}
+
+// if the report file is set, calls made after the last finalize are written at exit as well
+struct StatsReporter {
+    ~StatsReporter() {
+        if (stats_pending && std::getenv("PYSV_STATS_FILE")) write_stats_report();
+    }
+} stats_reporter;
\ No newline at end of file
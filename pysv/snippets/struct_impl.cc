@@ -0,0 +1,53 @@
+#include "svdpi.h"
+
+// packed structs are passed to Python as numpy structured scalars and arrays, which share the memory with the
+// simulator. the dtype layout matches the packed words, so none of the fields is copied
+py::object &get_struct_dtype(size_t struct_id, const char *spec) {
+    if (!struct_dtypes) {
+        struct_dtypes = std::unique_ptr<std::vector<py::object>>(new std::vector<py::object>(NUM_STRUCT_TYPES));
+    }
+    auto &dtype = (*struct_dtypes)[struct_id];
+    if (!dtype) {
+        auto numpy = py::module::import("numpy");
+        if (!numpy_frombuffer) {
+            numpy_frombuffer = std::unique_ptr<py::object>(new py::object(numpy.attr("frombuffer")));
+        }
+        dtype = numpy.attr("dtype")(py::eval(spec));
+    }
+    return dtype;
+}
+
+py::object to_py_struct_view(void *data, ssize_t size, const py::object &dtype, bool readonly) {
+    auto buffer = py::memoryview::from_memory(data, size, readonly);
+    return call_function(*numpy_frombuffer, buffer, dtype);
+}
+
+inline py::object to_py_struct(const svBitVecVal *value, const py::object &dtype, ssize_t itemsize) {
+    auto array = to_py_struct_view(const_cast<svBitVecVal *>(value), itemsize, dtype, true);
+    return steal_result(PySequence_GetItem(array.ptr(), 0));
+}
+
+py::object to_py_struct_array(const svOpenArrayHandle array_handle, const py::object &dtype, ssize_t itemsize) {
+    auto *data = svGetArrayPtr(array_handle);
+    if (!data) {
+        throw std::runtime_error("Array type does not have native C representation");
+    }
+    auto dim = svDimensions(array_handle);
+    py::tuple shape(dim);
+    ssize_t size = itemsize;
+    for (auto i = 1; i <= dim; i++) {
+        auto s = svSize(array_handle, i);
+        shape[i - 1] = py::int_(s);
+        size *= s;
+    }
+    auto array = to_py_struct_view(data, size, dtype, false);
+    // assumes row major ordering
+    if (dim == 1) return array;
+    return array.attr("reshape")(shape);
+}
+
+inline void from_py_struct(py::handle obj, svBitVecVal *value, const py::object &dtype, ssize_t itemsize) {
+    // numpy casts tuples and structured scalars into the packed layout in place
+    auto array = to_py_struct_view(value, itemsize, dtype, false);
+    if (PySequence_SetItem(array.ptr(), 0, obj.ptr()) < 0) throw py::error_already_set();
+}
\ No newline at end of file
@@ -1,4 +1,4 @@
-void check_sys_path(const char *python_lib) {
+void initialize_sys_path(const char *python_lib) {
     // always check guard first
     initialize_guard();
     // only modify the sys.path if the one is . (set by pybind)
@@ -20,4 +20,12 @@ void check_sys_path(const char *python_lib) {
         dlopen(python_lib, RTLD_LAZY | RTLD_GLOBAL);
         #endif
     }
+}
+
+void check_sys_path(const char *python_lib) {
+    // fast path once the runtime is set up
+    if (runtime_ready.load(std::memory_order_acquire)) return;
+    initialize_sys_path(python_lib);
+    release_main_thread();
+    runtime_ready.store(true, std::memory_order_release);
 }
\ No newline at end of file
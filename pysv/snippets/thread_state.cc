@@ -0,0 +1,11 @@
+// when python functions run on worker threads, the simulator thread only holds the GIL during DPI calls
+void release_main_thread() {
+    if (RELEASE_GIL && !main_thread_state) main_thread_state = PyEval_SaveThread();
+}
+
+void restore_main_thread() {
+    if (main_thread_state) {
+        PyEval_RestoreThread(main_thread_state);
+        main_thread_state = nullptr;
+    }
+}
\ No newline at end of file
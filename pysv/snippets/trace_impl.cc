@@ -0,0 +1,226 @@
+#include <algorithm>
+#include <chrono>
+#include <cmath>
+#include <cstdlib>
+#include <exception>
+#include <fstream>
+#include <limits>
+#include <memory>
+#include <mutex>
+#include <type_traits>
+#include <vector>
+
+// timeline of the DPI calls in the Chrome trace event format, which Perfetto loads as well. each thread records
+// into its own ring buffer, so only the latest events are kept once the buffer is full. none of the events holds
+// any python object, and they are only formatted when the trace is written
+constexpr int TRACE_MAX_ARGS = 4;
+constexpr size_t TRACE_DEFAULT_EVENTS = 65536;
+enum TraceArgKind { TRACE_INT, TRACE_UINT, TRACE_FLOAT };
+
+struct TraceArg {
+    const char *name;
+    TraceArgKind kind;
+    union {
+        int64_t i;
+        uint64_t u;
+        double f;
+    };
+};
+
+struct TraceEvent {
+    size_t func_id;
+    uint64_t begin_ns;
+    // 0 while the call is running
+    uint64_t end_ns;
+    double sim_time;
+    void *handle;
+    int num_args;
+    bool error;
+    TraceArg args[TRACE_MAX_ARGS];
+};
+
+struct TraceBuffer {
+    std::vector<TraceEvent> events;
+    // number of events recorded so far, including the ones overwritten
+    size_t count = 0;
+    size_t thread_id;
+
+    TraceBuffer(size_t capacity, size_t thread_id) : events(capacity), thread_id(thread_id) {}
+};
+
+uint64_t trace_now() {
+    // monotonic clock, which doesn't jump with the wall time
+    return std::chrono::duration_cast<std::chrono::nanoseconds>(
+        std::chrono::steady_clock::now().time_since_epoch()).count();
+}
+
+// simulation time set by pysv_set_sim_time, negative if the simulator never sets it. it is not part of the
+// runtime, so finalize keeps it
+double sim_time = -1;
+// timestamps in the trace are relative to the library load
+uint64_t trace_start_ns = trace_now();
+std::mutex trace_mutex;
+std::vector<std::unique_ptr<TraceBuffer>> trace_buffers;
+thread_local TraceBuffer *trace_buffer = nullptr;
+// set when there are calls that are not in the trace file yet
+bool trace_pending = false;
+
+TraceBuffer &get_trace_buffer() {
+    if (!trace_buffer) {
+        size_t capacity = TRACE_DEFAULT_EVENTS;
+        auto *value = std::getenv("PYSV_TRACE_EVENTS");
+        if (value) capacity = std::max<size_t>(std::strtoull(value, nullptr, 10), 1);
+        std::lock_guard<std::mutex> lock(trace_mutex);
+        trace_buffers.emplace_back(new TraceBuffer(capacity, trace_buffers.size()));
+        trace_buffer = trace_buffers.back().get();
+    }
+    return *trace_buffer;
+}
+
+// records a DPI call from its construction until it goes out of scope, which is after the return value is
+// converted
+class TraceScope {
+public:
+    explicit TraceScope(size_t func_id) : exceptions_(uncaught_exceptions()) {
+        auto &buffer = get_trace_buffer();
+        event_ = &buffer.events[buffer.count++ % buffer.events.size()];
+        event_->func_id = func_id;
+        event_->end_ns = 0;
+        event_->sim_time = sim_time;
+        event_->handle = nullptr;
+        event_->num_args = 0;
+        event_->error = false;
+        trace_pending = true;
+        event_->begin_ns = trace_now();
+    }
+
+    template<typename T>
+    typename std::enable_if<std::is_floating_point<T>::value>::type arg(const char *name, T value) {
+        auto *arg = next_arg(name, TRACE_FLOAT);
+        if (arg) arg->f = value;
+    }
+
+    template<typename T>
+    typename std::enable_if<std::is_integral<T>::value && std::is_signed<T>::value>::type arg(const char *name,
+                                                                                               T value) {
+        auto *arg = next_arg(name, TRACE_INT);
+        if (arg) arg->i = value;
+    }
+
+    template<typename T>
+    typename std::enable_if<std::is_integral<T>::value && std::is_unsigned<T>::value>::type arg(const char *name,
+                                                                                                 T value) {
+        auto *arg = next_arg(name, TRACE_UINT);
+        if (arg) arg->u = value;
+    }
+
+    void handle(void *value) { event_->handle = value; }
+
+    ~TraceScope() {
+        event_->error = uncaught_exceptions() > exceptions_;
+        event_->end_ns = trace_now();
+    }
+
+private:
+    TraceEvent *event_;
+    int exceptions_;
+
+    TraceArg *next_arg(const char *name, TraceArgKind kind) {
+        // only the first few arguments are kept
+        if (event_->num_args == TRACE_MAX_ARGS) return nullptr;
+        auto &arg = event_->args[event_->num_args++];
+        arg.name = name;
+        arg.kind = kind;
+        return &arg;
+    }
+
+    static int uncaught_exceptions() {
+#if __cplusplus >= 201703L
+        return std::uncaught_exceptions();
+#else
+        return std::uncaught_exception() ? 1 : 0;
+#endif
+    }
+};
+
+void write_trace_time(std::ostream &stream, uint64_t ns) {
+    // trace event times are in microseconds
+    stream << ns / 1000 << "." << (ns % 1000) / 100 << (ns % 100) / 10 << ns % 10;
+}
+
+void write_trace_double(std::ostream &stream, double value) {
+    if (std::isfinite(value)) {
+        stream << value;
+    } else {
+        stream << "null";
+    }
+}
+
+void write_trace_report() {
+    trace_pending = false;
+    auto *filename = std::getenv("PYSV_TRACE_FILE");
+    std::ofstream stream(filename ? filename : "pysv_trace.json");
+    stream.precision(std::numeric_limits<double>::max_digits10);
+    stream << "{\"displayTimeUnit\": \"ns\", \"traceEvents\": [";
+    bool first = true;
+    std::lock_guard<std::mutex> lock(trace_mutex);
+    for (auto &buffer: trace_buffers) {
+        auto capacity = buffer->events.size();
+        auto start = buffer->count > capacity ? buffer->count - capacity : 0;
+        double last_sim_time = -1;
+        for (auto i = start; i < buffer->count; i++) {
+            auto &event = buffer->events[i % capacity];
+            if (!event.end_ns) continue;
+            auto begin_ns = event.begin_ns - std::min(event.begin_ns, trace_start_ns);
+            if (event.sim_time >= 0 && event.sim_time != last_sim_time) {
+                // the simulation time is shown as a counter track right above the calls
+                stream << (first ? "" : ",") << "\n  {\"name\": \"sim_time\", \"ph\": \"C\", \"pid\": 1, \"ts\": ";
+                write_trace_time(stream, begin_ns);
+                stream << ", \"args\": {\"sim_time\": ";
+                write_trace_double(stream, event.sim_time);
+                stream << "}}";
+                first = false;
+                last_sim_time = event.sim_time;
+            }
+            stream << (first ? "" : ",") << "\n  {\"name\": \"" << FUNCTION_NAMES[event.func_id]
+                   << "\", \"cat\": \"dpi\", \"ph\": \"X\", \"pid\": 1, \"tid\": " << buffer->thread_id
+                   << ", \"ts\": ";
+            write_trace_time(stream, begin_ns);
+            stream << ", \"dur\": ";
+            write_trace_time(stream, event.end_ns - event.begin_ns);
+            stream << ", \"args\": {";
+            for (int j = 0; j < event.num_args; j++) {
+                auto &arg = event.args[j];
+                stream << (j ? ", " : "") << "\"" << arg.name << "\": ";
+                if (arg.kind == TRACE_INT) {
+                    stream << arg.i;
+                } else if (arg.kind == TRACE_UINT) {
+                    stream << arg.u;
+                } else {
+                    write_trace_double(stream, arg.f);
+                }
+            }
+            auto separator = event.num_args ? ", " : "";
+            if (event.handle) {
+                stream << separator << "\"handle\": " << reinterpret_cast<uintptr_t>(event.handle);
+                separator = ", ";
+            }
+            if (event.sim_time >= 0) {
+                stream << separator << "\"sim_time\": ";
+                write_trace_double(stream, event.sim_time);
+                separator = ", ";
+            }
+            if (event.error) stream << separator << "\"error\": true";
+            stream << "}}";
+            first = false;
+        }
+    }
+    stream << "\n]}\n";
+}
+
+// if the trace file is set, calls made after the last finalize are written at exit as well
+struct TraceReporter {
+    ~TraceReporter() {
+        if (trace_pending && std::getenv("PYSV_TRACE_FILE")) write_trace_report();
+    }
+} trace_reporter;
\ No newline at end of file
@@ -0,0 +1,61 @@
+// converters between DPI types and Python objects. they are used instead of the generic pybind11 casting
+// so that no template dispatch is involved in the hot path
+// notice that CPython serves small integers from its own cache, and bit values are mapped to the bool singletons
+inline py::object steal_result(PyObject *obj) {
+    if (!obj) throw py::error_already_set();
+    return py::reinterpret_steal<py::object>(obj);
+}
+
+inline py::object to_py_bit(bool value) {
+    return py::reinterpret_borrow<py::object>(value ? Py_True : Py_False);
+}
+
+inline py::object to_py_int8(int8_t value) { return steal_result(PyLong_FromLong(value)); }
+inline py::object to_py_int16(int16_t value) { return steal_result(PyLong_FromLong(value)); }
+inline py::object to_py_int32(int32_t value) { return steal_result(PyLong_FromLong(value)); }
+inline py::object to_py_int64(int64_t value) { return steal_result(PyLong_FromLongLong(value)); }
+inline py::object to_py_uint8(uint8_t value) { return steal_result(PyLong_FromUnsignedLong(value)); }
+inline py::object to_py_uint16(uint16_t value) { return steal_result(PyLong_FromUnsignedLong(value)); }
+inline py::object to_py_uint32(uint32_t value) { return steal_result(PyLong_FromUnsignedLong(value)); }
+inline py::object to_py_uint64(uint64_t value) { return steal_result(PyLong_FromUnsignedLongLong(value)); }
+inline py::object to_py_float(float value) { return steal_result(PyFloat_FromDouble(value)); }
+inline py::object to_py_double(double value) { return steal_result(PyFloat_FromDouble(value)); }
+inline py::object to_py_string(const char *value) { return steal_result(PyUnicode_FromString(value)); }
+
+inline uint64_t from_py_integer(py::handle obj) {
+    // same as SystemVerilog, values that don't fit into the type are truncated to the lower bits
+    // this also works with negative values and arbitrarily large Python integers
+    auto value = PyLong_AsUnsignedLongLongMask(obj.ptr());
+    if (value == static_cast<unsigned long long>(-1) && PyErr_Occurred()) throw py::error_already_set();
+    return value;
+}
+
+inline bool from_py_bit(py::handle obj) {
+    auto value = PyObject_IsTrue(obj.ptr());
+    if (value < 0) throw py::error_already_set();
+    return value != 0;
+}
+
+inline int8_t from_py_int8(py::handle obj) { return static_cast<int8_t>(from_py_integer(obj)); }
+inline int16_t from_py_int16(py::handle obj) { return static_cast<int16_t>(from_py_integer(obj)); }
+inline int32_t from_py_int32(py::handle obj) { return static_cast<int32_t>(from_py_integer(obj)); }
+inline int64_t from_py_int64(py::handle obj) { return static_cast<int64_t>(from_py_integer(obj)); }
+inline uint8_t from_py_uint8(py::handle obj) { return static_cast<uint8_t>(from_py_integer(obj)); }
+inline uint16_t from_py_uint16(py::handle obj) { return static_cast<uint16_t>(from_py_integer(obj)); }
+inline uint32_t from_py_uint32(py::handle obj) { return static_cast<uint32_t>(from_py_integer(obj)); }
+inline uint64_t from_py_uint64(py::handle obj) { return from_py_integer(obj); }
+
+inline double from_py_double(py::handle obj) {
+    auto value = PyFloat_AsDouble(obj.ptr());
+    if (value == -1.0 && PyErr_Occurred()) throw py::error_already_set();
+    return value;
+}
+
+inline float from_py_float(py::handle obj) { return static_cast<float>(from_py_double(obj)); }
+
+inline std::string from_py_string(py::handle obj) {
+    Py_ssize_t size;
+    auto value = PyUnicode_AsUTF8AndSize(obj.ptr(), &size);
+    if (!value) throw py::error_already_set();
+    return std::string(value, size);
+}
\ No newline at end of file
@@ -0,0 +1,60 @@
+#include <cstring>
+#include "svdpi.h"
+
+// packed vectors are stored as 32-bit words, least significant word first. on little endian hosts this is the
+// byte order used by int.from_bytes and int.to_bytes, so the whole vector is converted in one call
+template<class F>
+py::object to_py_vector(int width, F &&get_word) {
+    auto num_words = SV_PACKED_DATA_NELEMS(width);
+    auto bytes = steal_result(PyBytes_FromStringAndSize(nullptr, num_words * sizeof(svBitVecVal)));
+    auto *data = PyBytes_AS_STRING(bytes.ptr());
+    for (int i = 0; i < num_words; i++) {
+        svBitVecVal word = get_word(i);
+        // bits above the width are not defined
+        if (i == num_words - 1 && width % 32) word &= (1u << (width % 32)) - 1;
+        std::memcpy(data + i * sizeof(svBitVecVal), &word, sizeof(word));
+    }
+    return steal_result(PyObject_CallMethod(reinterpret_cast<PyObject *>(&PyLong_Type), "from_bytes", "Os",
+                                            bytes.ptr(), "little"));
+}
+
+template<class F>
+void from_py_vector(py::handle obj, int width, F &&set_word) {
+    auto num_words = SV_PACKED_DATA_NELEMS(width);
+    // same as SystemVerilog, values are truncated to the width and negative values are in two's complement
+    auto value = steal_result(PyNumber_Index(obj.ptr()));
+    auto one = steal_result(PyLong_FromLong(1));
+    auto shift = steal_result(PyLong_FromLong(width));
+    auto mask = steal_result(PyNumber_Subtract(steal_result(PyNumber_Lshift(one.ptr(), shift.ptr())).ptr(),
+                                               one.ptr()));
+    value = steal_result(PyNumber_And(value.ptr(), mask.ptr()));
+    auto bytes = steal_result(PyObject_CallMethod(value.ptr(), "to_bytes", "ns",
+                                                  static_cast<Py_ssize_t>(num_words * sizeof(svBitVecVal)),
+                                                  "little"));
+    auto *data = PyBytes_AS_STRING(bytes.ptr());
+    for (int i = 0; i < num_words; i++) {
+        svBitVecVal word;
+        std::memcpy(&word, data + i * sizeof(svBitVecVal), sizeof(word));
+        set_word(i, word);
+    }
+}
+
+inline py::object to_py_bits(const svBitVecVal *value, int width) {
+    return to_py_vector(width, [value](int i) { return value[i]; });
+}
+
+inline py::object to_py_logic(const svLogicVecVal *value, int width) {
+    // same as casting logic to bit, x and z are read as 0
+    return to_py_vector(width, [value](int i) { return value[i].aval & ~value[i].bval; });
+}
+
+inline void from_py_bits(py::handle obj, svBitVecVal *value, int width) {
+    from_py_vector(obj, width, [value](int i, svBitVecVal word) { value[i] = word; });
+}
+
+inline void from_py_logic(py::handle obj, svLogicVecVal *value, int width) {
+    from_py_vector(obj, width, [value](int i, svBitVecVal word) {
+        value[i].aval = word;
+        value[i].bval = 0;
+    });
+}
\ No newline at end of file
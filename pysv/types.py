@@ -17,8 +17,17 @@ class DataType(enum.Enum):
     Double = enum.auto()
     # only for return type
     Void = enum.auto()
-    # the only array type supported
+    # open arrays of numeric types
     IntArray = enum.auto()
+    ByteArray = enum.auto()
+    ShortIntArray = enum.auto()
+    LongIntArray = enum.auto()
+    UByteArray = enum.auto()
+    UShortIntArray = enum.auto()
+    UIntArray = enum.auto()
+    ULongIntArray = enum.auto()
+    FloatArray = enum.auto()
+    DoubleArray = enum.auto()
 
     def __new__(cls, *args, **kargs):
         obj = object.__new__(cls)
@@ -28,12 +37,238 @@ class DataType(enum.Enum):
     def __init__(self, _):
         self.dim = 1
 
+    def __getitem__(self, dim):
+        # either the number of dimensions, or a tuple of the fixed shape
+        assert self.is_array(), "Only arrays are allowed to have dimensions"
+        if isinstance(dim, tuple):
+            return ArrayType(self, len(dim), dim)
+        assert isinstance(dim, int), "Array dim must be an integer"
+        # a single number is easily mistaken for the size of a 1-D array
+        assert 0 < dim <= MAX_ARRAY_DIM, \
+            "Array dim {0} is not between 1 and {1}. Use {2}[{0},] for a 1-D array of {0} elements".format(
+                dim, MAX_ARRAY_DIM, self.name)
+        return ArrayType(self, dim)
+
+    def is_array(self):
+        return self in ARRAY_ELEMENT_TYPES
+
+    @property
+    def element_type(self):
+        return ARRAY_ELEMENT_TYPES[self]
+
+
+# largest number of dimensions accepted by DataType.IntArray[n]. larger arrays need a fixed shape
+MAX_ARRAY_DIM = 4
+
+ARRAY_ELEMENT_TYPES = {
+    DataType.IntArray: DataType.Int,
+    DataType.ByteArray: DataType.Byte,
+    DataType.ShortIntArray: DataType.ShortInt,
+    DataType.LongIntArray: DataType.LongInt,
+    DataType.UByteArray: DataType.UByte,
+    DataType.UShortIntArray: DataType.UShortInt,
+    DataType.UIntArray: DataType.UInt,
+    DataType.ULongIntArray: DataType.ULongInt,
+    DataType.FloatArray: DataType.Float,
+    DataType.DoubleArray: DataType.Double,
+}
+
+
+class ArrayType:
+    """Open array with the number of dimensions. If the shape is fixed, the dimensions are not queried
+    from the simulator on every call. It compares equal to the array type it is created from
+    """
+    def __init__(self, data_type: DataType, dim: int, shape=None):
+        assert dim > 0, "Array dim must be positive"
+        if shape is not None:
+            assert all(isinstance(s, int) and s > 0 for s in shape), "Array shape must be positive integers"
+        self.data_type = data_type
+        self.dim = dim
+        self.shape = shape
+
+    @staticmethod
+    def is_array():
+        return True
+
+    @property
+    def element_type(self):
+        return self.data_type.element_type
+
+    def __eq__(self, other):
+        if isinstance(other, DataType):
+            return self.data_type == other
+        if not isinstance(other, ArrayType):
+            return NotImplemented
+        return self.data_type == other.data_type and self.dim == other.dim and self.shape == other.shape
+
+    def __hash__(self):
+        return hash(self.data_type)
+
+    def __repr__(self):
+        return "{0}[{1}]".format(self.data_type, self.shape if self.shape is not None else self.dim)
+
+
+class _BitVectorMeta(type):
+    def __getitem__(cls, width: int):
+        return cls(width)
+
+
+class BitVector(metaclass=_BitVectorMeta):
+    """Packed vector with a fixed width, which is passed to Python as an int.
+    Use Bits[N] or Logic[N] to create one
+    """
+    four_state = False
+
+    def __init__(self, width: int):
+        assert isinstance(width, int) and width > 0, "Vector width must be a positive integer"
+        self.width = width
+
+    @staticmethod
+    def is_array():
+        return False
+
+    def __eq__(self, other):
+        if not isinstance(other, BitVector):
+            return NotImplemented
+        return self.four_state == other.four_state and self.width == other.width
+
+    def __hash__(self):
+        return hash((self.four_state, self.width))
+
+    def __repr__(self):
+        return "{0}[{1}]".format(type(self).__name__, self.width)
+
+
+class Bits(BitVector):
+    # bit [N-1:0] in SystemVerilog, passed as svBitVecVal
+    four_state = False
+
+
+class Logic(BitVector):
+    # logic [N-1:0] in SystemVerilog, passed as svLogicVecVal
+    four_state = True
+
+
+class Struct(BitVector):
+    """Packed struct, which is passed to Python as a numpy structured scalar without copying the fields.
+    Fields are listed from the most significant one, same as SystemVerilog
+    """
+    # numpy formats of the supported field types. fields have to be byte aligned to share the memory
+    FIELD_FORMATS = {
+        DataType.Byte: "i1",
+        DataType.ShortInt: "<i2",
+        DataType.Int: "<i4",
+        DataType.LongInt: "<i8",
+        DataType.UByte: "u1",
+        DataType.UShortInt: "<u2",
+        DataType.UInt: "<u4",
+        DataType.ULongInt: "<u8",
+    }
+
+    def __init__(self, name: str, **fields):
+        assert len(fields) > 0, "Struct {0} does not have any field".format(name)
+        for field_name, t in fields.items():
+            assert t in self.FIELD_FORMATS, "Unsupported type {0} for field {1}.{2}".format(t, name, field_name)
+        self.name = name
+        self.fields = fields
+        super().__init__(sum(self.__get_size(t) for t in fields.values()) * 8)
+
+    @staticmethod
+    def __get_size(t: DataType):
+        return int(Struct.FIELD_FORMATS[t][-1])
+
     def __getitem__(self, dim: int):
-        assert self == DataType.IntArray, "Only Int array allowed to have dimensions"
+        # open array of structs
+        return StructArray(self, dim)
+
+    @property
+    def itemsize(self):
+        # packed values are stored in 32-bit words
+        return (self.width + 31) // 32 * 4
+
+    def dtype_spec(self):
+        # the last field is the least significant one, which is stored first
+        offsets = []
+        offset = self.width // 8
+        for t in self.fields.values():
+            offset -= self.__get_size(t)
+            offsets.append(offset)
+        return {"names": list(self.fields.keys()), "formats": [self.FIELD_FORMATS[t] for t in self.fields.values()],
+                "offsets": offsets, "itemsize": self.itemsize}
+
+    def __eq__(self, other):
+        if not isinstance(other, Struct):
+            return NotImplemented
+        return self.name == other.name and self.fields == other.fields
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __repr__(self):
+        return "Struct({0})".format(self.name)
+
+
+class StructArray:
+    """Open array of packed structs, which is passed to Python as a numpy structured array
+    """
+    def __init__(self, element_type: Struct, dim: int):
         assert isinstance(dim, int), "Array dim must be an integer"
-        res = DataType.IntArray
-        res.dim = dim
-        return res
+        self.element_type = element_type
+        self.dim = dim
+
+    @staticmethod
+    def is_array():
+        return True
+
+    def __eq__(self, other):
+        if not isinstance(other, StructArray):
+            return NotImplemented
+        return self.element_type == other.element_type and self.dim == other.dim
+
+    def __hash__(self):
+        return hash((self.element_type, self.dim))
+
+    def __repr__(self):
+        return "{0}[{1}]".format(self.element_type, self.dim)
+
+
+class Batch(enum.Enum):
+    # call the Python function once per element
+    Loop = enum.auto()
+    # call the Python function once with NumPy views of the arrays
+    Vector = enum.auto()
+
+
+class Async:
+    def __init__(self, max_in_flight: int = 16, workers: int = 1, ordered: bool = True):
+        assert max_in_flight > 0, "max_in_flight has to be positive"
+        assert workers > 0, "Async function needs at least one worker"
+        # maximum number of calls that are submitted but not finished
+        self.max_in_flight = max_in_flight
+        # number of threads running the calls
+        self.workers = workers
+        # if set, results become ready in the same order as the calls are submitted
+        self.ordered = ordered
+
+
+class Table:
+    # input types that can be tabulated and their widths
+    DOMAIN_WIDTHS = {DataType.Bit: 1, DataType.Byte: 8, DataType.UByte: 8, DataType.ShortInt: 16,
+                     DataType.UShortInt: 16}
+
+    def __init__(self, max_entries: int = 1 << 16):
+        assert max_entries > 0, "max_entries has to be positive"
+        # guards against evaluating a large input domain by accident
+        self.max_entries = max_entries
+
+
+class Runtime(enum.Enum):
+    # Python interpreter is embedded into the simulator process
+    Embedded = enum.auto()
+    # Python model runs in a separate process and calls go through a shared memory ring
+    SharedMemory = enum.auto()
+    # Python model runs in a model server, which can be on a different host, and calls go through a socket
+    Socket = enum.auto()
 
 
 class Reference:
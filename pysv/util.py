@@ -4,6 +4,17 @@ import subprocess
 import os
 import abc
 import sysconfig
+import platform
+
+# the model server publishes the shared memory ring positions with plain stores, which are only ordered after
+# the data on hosts with total store ordering
+SHM_MACHINES = {"x86_64", "amd64", "i386", "i686", "x86"}
+
+
+def check_shm_machine(machine=None):
+    machine = (machine or platform.machine()).lower()
+    assert machine in SHM_MACHINES, \
+        "Shared memory runtime is only supported on x86 hosts, not {0}. Use Runtime.Socket instead".format(machine)
 
 
 def is_conda():
@@ -15,6 +15,7 @@ void SomeClass_print_a(void* self);
 void SomeClass_print_b(void* self,
                        int32_t num);
 void pysv_finalize();
+int32_t pysv_live_objects(const char* class_name);
 }
 namespace pysv {
 class PySVObject {
@@ -1,8 +1,10 @@
 #include "pybind11/include/pybind11/embed.h"
 #include "pybind11/include/pybind11/eval.h"
+#include <atomic>
 #include <iostream>
 #include <unordered_map>
 #include <memory>
+#include <vector>
 
 // used for ModelSim/Questa to resolve some runtime native library loading issues
 // not needed for Xcelium and vcs, but include just in case
@@ -10,14 +12,222 @@
 #include <dlfcn.h>
 #endif
 namespace py = pybind11;
+// Python objects handed out to SystemVerilog as chandle. each handle encodes the slot index (offset by one so
+// that null is never a valid handle) in the lower half and the slot generation in the upper half. the generation
+// is bumped whenever a slot is freed, so a stale handle is detected with a single comparison
+class HandleTable {
+public:
+    void *add(const py::object &obj) {
+        uintptr_t index;
+        if (free_slots_.empty()) {
+            index = slots_.size();
+            slots_.emplace_back();
+        } else {
+            index = free_slots_.back();
+            free_slots_.pop_back();
+        }
+        auto &slot = slots_[index];
+        slot.obj = obj;
+        return reinterpret_cast<void *>((slot.generation << INDEX_BITS) | (index + 1));
+    }
+
+    // returns a null handle if the handle is invalid or stale
+    py::handle get(const void *handle) const {
+        auto slot = get_slot(handle);
+        return slot ? py::handle(slot->obj) : py::handle();
+    }
+
+    bool remove(const void *handle) {
+        auto slot = get_slot(handle);
+        if (!slot) return false;
+        auto index = slot - slots_.data();
+        slots_[index].obj = py::object();
+        slots_[index].generation = (slots_[index].generation + 1) & GENERATION_MASK;
+        free_slots_.emplace_back(index);
+        return true;
+    }
+
+    // number of live objects whose type name matches the class name
+    int32_t live_objects(const char *class_name) const {
+        int32_t result = 0;
+        auto name = std::string(class_name);
+        for (auto const &slot: slots_) {
+            if (slot.obj && name == Py_TYPE(slot.obj.ptr())->tp_name) result++;
+        }
+        return result;
+    }
+
+private:
+    static constexpr uintptr_t INDEX_BITS = sizeof(uintptr_t) * 4;
+    static constexpr uintptr_t INDEX_MASK = (static_cast<uintptr_t>(1) << INDEX_BITS) - 1;
+    static constexpr uintptr_t GENERATION_MASK = INDEX_MASK;
+
+    struct Slot {
+        py::object obj;
+        uintptr_t generation = 0;
+    };
+
+    const Slot *get_slot(const void *handle) const {
+        auto value = reinterpret_cast<uintptr_t>(handle);
+        auto index = value & INDEX_MASK;
+        if (index == 0 || index > slots_.size()) return nullptr;
+        auto const &slot = slots_[index - 1];
+        if (slot.generation != (value >> INDEX_BITS) || !slot.obj) return nullptr;
+        return &slot;
+    }
+
+    Slot *get_slot(const void *handle) {
+        return const_cast<Slot *>(static_cast<const HandleTable *>(this)->get_slot(handle));
+    }
+
+    std::vector<Slot> slots_;
+    std::vector<uintptr_t> free_slots_;
+};
+
 std::unique_ptr<std::unordered_map<std::string, py::object>> global_imports = nullptr;
 std::unique_ptr<py::scoped_interpreter> guard = nullptr;
-std::unique_ptr<std::unordered_map<void*, py::object>> py_obj_map;
+// set once the interpreter and sys.path are fully set up, so the check on every call is a
+// single load and branch
+std::atomic<bool> runtime_ready(false);
+// simulator thread state while the GIL is released
+PyThreadState *main_thread_state = nullptr;
+std::unique_ptr<HandleTable> py_obj_table;
 std::unique_ptr<py::dict> class_defs;
+std::unique_ptr<std::vector<py::dict>> class_namespaces;
+// cached Python definition for each exported function. class methods also keep the type
+// the attribute is resolved from, the interned method name, and how the attribute is called
+struct FunctionDef {
+    py::object func;
+    py::object type;
+    py::object name;
+    int call_mode = 0;
+    descrgetfunc descr_get = nullptr;
+};
+std::unique_ptr<std::vector<FunctionDef>> function_defs;
+// used to create numpy views for vectorized batch functions and structs
+std::unique_ptr<py::object> numpy_asarray;
+std::unique_ptr<py::object> numpy_frombuffer;
+// numpy dtypes of the packed structs, indexed by the struct id
+std::unique_ptr<std::vector<py::object>> struct_dtypes;
+// increased every time the runtime is finalized, which invalidates the cached array views
+size_t runtime_epoch = 0;
 std::string string_result_value;
 
+constexpr size_t NUM_FUNCTION_DEFS = 1;
+constexpr bool RELEASE_GIL = false;
+// when python functions run on worker threads, the simulator thread only holds the GIL during DPI calls
+void release_main_thread() {
+    if (RELEASE_GIL && !main_thread_state) main_thread_state = PyEval_SaveThread();
+}
+
+void restore_main_thread() {
+    if (main_thread_state) {
+        PyEval_RestoreThread(main_thread_state);
+        main_thread_state = nullptr;
+    }
+}
+FunctionDef &get_method_def(size_t func_id) {
+    if (!function_defs) {
+        function_defs = std::unique_ptr<std::vector<FunctionDef>>(new std::vector<FunctionDef>(NUM_FUNCTION_DEFS));
+    }
+    return (*function_defs)[func_id];
+}
+
+py::object &get_function_def(size_t func_id) {
+    return get_method_def(func_id).func;
+}
+
+#if PY_VERSION_HEX >= 0x03090000
+#define PYSV_VECTORCALL PyObject_Vectorcall
+#elif PY_VERSION_HEX >= 0x03080000
+#define PYSV_VECTORCALL _PyObject_Vectorcall
+#endif
+
+template<class ...Args>
+py::object call_function(const py::handle &func, Args &&...args) {
+#ifdef PYSV_VECTORCALL
+    // the first slot is reserved so that callee is allowed to prepend self without any allocation
+    PyObject *arg_ptrs[] = {nullptr, args.ptr()...};
+    auto result = PYSV_VECTORCALL(func.ptr(), arg_ptrs + 1, sizeof...(Args) | PY_VECTORCALL_ARGUMENTS_OFFSET,
+                                  nullptr);
+#else
+    auto py_args = py::make_tuple(args...);
+    auto result = PyObject_Call(func.ptr(), py_args.ptr(), nullptr);
+#endif
+    if (!result) throw py::error_already_set();
+    return py::reinterpret_steal<py::object>(result);
+}
+// converters between DPI types and Python objects. they are used instead of the generic pybind11 casting
+// so that no template dispatch is involved in the hot path
+// notice that CPython serves small integers from its own cache, and bit values are mapped to the bool singletons
+inline py::object steal_result(PyObject *obj) {
+    if (!obj) throw py::error_already_set();
+    return py::reinterpret_steal<py::object>(obj);
+}
+
+inline py::object to_py_bit(bool value) {
+    return py::reinterpret_borrow<py::object>(value ? Py_True : Py_False);
+}
+
+inline py::object to_py_int8(int8_t value) { return steal_result(PyLong_FromLong(value)); }
+inline py::object to_py_int16(int16_t value) { return steal_result(PyLong_FromLong(value)); }
+inline py::object to_py_int32(int32_t value) { return steal_result(PyLong_FromLong(value)); }
+inline py::object to_py_int64(int64_t value) { return steal_result(PyLong_FromLongLong(value)); }
+inline py::object to_py_uint8(uint8_t value) { return steal_result(PyLong_FromUnsignedLong(value)); }
+inline py::object to_py_uint16(uint16_t value) { return steal_result(PyLong_FromUnsignedLong(value)); }
+inline py::object to_py_uint32(uint32_t value) { return steal_result(PyLong_FromUnsignedLong(value)); }
+inline py::object to_py_uint64(uint64_t value) { return steal_result(PyLong_FromUnsignedLongLong(value)); }
+inline py::object to_py_float(float value) { return steal_result(PyFloat_FromDouble(value)); }
+inline py::object to_py_double(double value) { return steal_result(PyFloat_FromDouble(value)); }
+inline py::object to_py_string(const char *value) { return steal_result(PyUnicode_FromString(value)); }
+
+inline uint64_t from_py_integer(py::handle obj) {
+    // same as SystemVerilog, values that don't fit into the type are truncated to the lower bits
+    // this also works with negative values and arbitrarily large Python integers
+    auto value = PyLong_AsUnsignedLongLongMask(obj.ptr());
+    if (value == static_cast<unsigned long long>(-1) && PyErr_Occurred()) throw py::error_already_set();
+    return value;
+}
+
+inline bool from_py_bit(py::handle obj) {
+    auto value = PyObject_IsTrue(obj.ptr());
+    if (value < 0) throw py::error_already_set();
+    return value != 0;
+}
+
+inline int8_t from_py_int8(py::handle obj) { return static_cast<int8_t>(from_py_integer(obj)); }
+inline int16_t from_py_int16(py::handle obj) { return static_cast<int16_t>(from_py_integer(obj)); }
+inline int32_t from_py_int32(py::handle obj) { return static_cast<int32_t>(from_py_integer(obj)); }
+inline int64_t from_py_int64(py::handle obj) { return static_cast<int64_t>(from_py_integer(obj)); }
+inline uint8_t from_py_uint8(py::handle obj) { return static_cast<uint8_t>(from_py_integer(obj)); }
+inline uint16_t from_py_uint16(py::handle obj) { return static_cast<uint16_t>(from_py_integer(obj)); }
+inline uint32_t from_py_uint32(py::handle obj) { return static_cast<uint32_t>(from_py_integer(obj)); }
+inline uint64_t from_py_uint64(py::handle obj) { return from_py_integer(obj); }
+
+inline double from_py_double(py::handle obj) {
+    auto value = PyFloat_AsDouble(obj.ptr());
+    if (value == -1.0 && PyErr_Occurred()) throw py::error_already_set();
+    return value;
+}
+
+inline float from_py_float(py::handle obj) { return static_cast<float>(from_py_double(obj)); }
+
+inline std::string from_py_string(py::handle obj) {
+    Py_ssize_t size;
+    auto value = PyUnicode_AsUTF8AndSize(obj.ptr(), &size);
+    if (!value) throw py::error_already_set();
+    return std::string(value, size);
+}
+void start_profiler() {}
+void stop_profiler() {}
+void add_stats_module() {}
 void check_interpreter() {
-    if (!guard) guard = std::unique_ptr<py::scoped_interpreter>(new py::scoped_interpreter());
+    if (!guard) {
+        guard = std::unique_ptr<py::scoped_interpreter>(new py::scoped_interpreter());
+        start_profiler();
+        add_stats_module();
+        release_main_thread();
+    }
 }
 
 extern "C" {
@@ -25,27 +235,42 @@ __attribute__((visibility("default"))) int32_t simple_func(int32_t a,
                                                            int32_t b,
                                                            int32_t c) {
   check_interpreter();
-  auto globals = py::dict();
-  auto locals = py::dict();
-  locals["__a"] = a;
-  locals["__b"] = b;
-  locals["__c"] = c;
-
-  py::exec(R"(
+  auto &py_func = get_function_def(0);
+  if (!py_func) {
+    auto globals = py::dict();
+    py::exec(R"(
 def simple_func(a, b, c):
     return a + b - c
 
-__result = simple_func(__a, __b, __c)
-)", globals, locals);
-  return locals["__result"].cast<int32_t>();
+)", globals);
+    py_func = globals["simple_func"];
+  }
+  auto py_result = call_function(py_func,
+                                 to_py_int32(a),
+                                 to_py_int32(b),
+                                 to_py_int32(c));
+  return from_py_int32(py_result);
 }
 __attribute__((visibility("default"))) void pysv_finalize() {
+    // take the GIL back before releasing any python object
+    restore_main_thread();
+    // profiles are written before any of the python functions are released
+    stop_profiler();
+    // clear the cached function definitions
+    function_defs.reset();
+    numpy_asarray.reset();
+    numpy_frombuffer.reset();
+    struct_dtypes.reset();
+    runtime_epoch++;
     // clear the cached global imports
     global_imports.reset();
-    // clear the object map
-    py_obj_map.reset();
+    // clear the object handle table
+    py_obj_table.reset();
     // clear the class map
     class_defs.reset();
+    class_namespaces.reset();
+    // the next call has to set up the runtime again
+    runtime_ready.store(false, std::memory_order_release);
     // the last part is tear down the runtime
     guard.reset();
 }
@@ -1,8 +1,10 @@
 #include "pybind11/include/pybind11/embed.h"
 #include "pybind11/include/pybind11/eval.h"
+#include <atomic>
 #include <iostream>
 #include <unordered_map>
 #include <memory>
+#include <vector>
 
 // used for ModelSim/Questa to resolve some runtime native library loading issues
 // not needed for Xcelium and vcs, but include just in case
@@ -10,57 +12,321 @@
 #include <dlfcn.h>
 #endif
 namespace py = pybind11;
+// Python objects handed out to SystemVerilog as chandle. each handle encodes the slot index (offset by one so
+// that null is never a valid handle) in the lower half and the slot generation in the upper half. the generation
+// is bumped whenever a slot is freed, so a stale handle is detected with a single comparison
+class HandleTable {
+public:
+    void *add(const py::object &obj) {
+        uintptr_t index;
+        if (free_slots_.empty()) {
+            index = slots_.size();
+            slots_.emplace_back();
+        } else {
+            index = free_slots_.back();
+            free_slots_.pop_back();
+        }
+        auto &slot = slots_[index];
+        slot.obj = obj;
+        return reinterpret_cast<void *>((slot.generation << INDEX_BITS) | (index + 1));
+    }
+
+    // returns a null handle if the handle is invalid or stale
+    py::handle get(const void *handle) const {
+        auto slot = get_slot(handle);
+        return slot ? py::handle(slot->obj) : py::handle();
+    }
+
+    bool remove(const void *handle) {
+        auto slot = get_slot(handle);
+        if (!slot) return false;
+        auto index = slot - slots_.data();
+        slots_[index].obj = py::object();
+        slots_[index].generation = (slots_[index].generation + 1) & GENERATION_MASK;
+        free_slots_.emplace_back(index);
+        return true;
+    }
+
+    // number of live objects whose type name matches the class name
+    int32_t live_objects(const char *class_name) const {
+        int32_t result = 0;
+        auto name = std::string(class_name);
+        for (auto const &slot: slots_) {
+            if (slot.obj && name == Py_TYPE(slot.obj.ptr())->tp_name) result++;
+        }
+        return result;
+    }
+
+private:
+    static constexpr uintptr_t INDEX_BITS = sizeof(uintptr_t) * 4;
+    static constexpr uintptr_t INDEX_MASK = (static_cast<uintptr_t>(1) << INDEX_BITS) - 1;
+    static constexpr uintptr_t GENERATION_MASK = INDEX_MASK;
+
+    struct Slot {
+        py::object obj;
+        uintptr_t generation = 0;
+    };
+
+    const Slot *get_slot(const void *handle) const {
+        auto value = reinterpret_cast<uintptr_t>(handle);
+        auto index = value & INDEX_MASK;
+        if (index == 0 || index > slots_.size()) return nullptr;
+        auto const &slot = slots_[index - 1];
+        if (slot.generation != (value >> INDEX_BITS) || !slot.obj) return nullptr;
+        return &slot;
+    }
+
+    Slot *get_slot(const void *handle) {
+        return const_cast<Slot *>(static_cast<const HandleTable *>(this)->get_slot(handle));
+    }
+
+    std::vector<Slot> slots_;
+    std::vector<uintptr_t> free_slots_;
+};
+
 std::unique_ptr<std::unordered_map<std::string, py::object>> global_imports = nullptr;
 std::unique_ptr<py::scoped_interpreter> guard = nullptr;
-std::unique_ptr<std::unordered_map<void*, py::object>> py_obj_map;
+// set once the interpreter and sys.path are fully set up, so the check on every call is a
+// single load and branch
+std::atomic<bool> runtime_ready(false);
+// simulator thread state while the GIL is released
+PyThreadState *main_thread_state = nullptr;
+std::unique_ptr<HandleTable> py_obj_table;
 std::unique_ptr<py::dict> class_defs;
+std::unique_ptr<std::vector<py::dict>> class_namespaces;
+// cached Python definition for each exported function. class methods also keep the type
+// the attribute is resolved from, the interned method name, and how the attribute is called
+struct FunctionDef {
+    py::object func;
+    py::object type;
+    py::object name;
+    int call_mode = 0;
+    descrgetfunc descr_get = nullptr;
+};
+std::unique_ptr<std::vector<FunctionDef>> function_defs;
+// used to create numpy views for vectorized batch functions and structs
+std::unique_ptr<py::object> numpy_asarray;
+std::unique_ptr<py::object> numpy_frombuffer;
+// numpy dtypes of the packed structs, indexed by the struct id
+std::unique_ptr<std::vector<py::object>> struct_dtypes;
+// increased every time the runtime is finalized, which invalidates the cached array views
+size_t runtime_epoch = 0;
 std::string string_result_value;
 
+constexpr size_t NUM_FUNCTION_DEFS = 6;
+constexpr bool RELEASE_GIL = false;
+// when python functions run on worker threads, the simulator thread only holds the GIL during DPI calls
+void release_main_thread() {
+    if (RELEASE_GIL && !main_thread_state) main_thread_state = PyEval_SaveThread();
+}
+
+void restore_main_thread() {
+    if (main_thread_state) {
+        PyEval_RestoreThread(main_thread_state);
+        main_thread_state = nullptr;
+    }
+}
+FunctionDef &get_method_def(size_t func_id) {
+    if (!function_defs) {
+        function_defs = std::unique_ptr<std::vector<FunctionDef>>(new std::vector<FunctionDef>(NUM_FUNCTION_DEFS));
+    }
+    return (*function_defs)[func_id];
+}
+
+py::object &get_function_def(size_t func_id) {
+    return get_method_def(func_id).func;
+}
+
+#if PY_VERSION_HEX >= 0x03090000
+#define PYSV_VECTORCALL PyObject_Vectorcall
+#elif PY_VERSION_HEX >= 0x03080000
+#define PYSV_VECTORCALL _PyObject_Vectorcall
+#endif
+
+template<class ...Args>
+py::object call_function(const py::handle &func, Args &&...args) {
+#ifdef PYSV_VECTORCALL
+    // the first slot is reserved so that callee is allowed to prepend self without any allocation
+    PyObject *arg_ptrs[] = {nullptr, args.ptr()...};
+    auto result = PYSV_VECTORCALL(func.ptr(), arg_ptrs + 1, sizeof...(Args) | PY_VECTORCALL_ARGUMENTS_OFFSET,
+                                  nullptr);
+#else
+    auto py_args = py::make_tuple(args...);
+    auto result = PyObject_Call(func.ptr(), py_args.ptr(), nullptr);
+#endif
+    if (!result) throw py::error_already_set();
+    return py::reinterpret_steal<py::object>(result);
+}
+// converters between DPI types and Python objects. they are used instead of the generic pybind11 casting
+// so that no template dispatch is involved in the hot path
+// notice that CPython serves small integers from its own cache, and bit values are mapped to the bool singletons
+inline py::object steal_result(PyObject *obj) {
+    if (!obj) throw py::error_already_set();
+    return py::reinterpret_steal<py::object>(obj);
+}
+
+inline py::object to_py_bit(bool value) {
+    return py::reinterpret_borrow<py::object>(value ? Py_True : Py_False);
+}
+
+inline py::object to_py_int8(int8_t value) { return steal_result(PyLong_FromLong(value)); }
+inline py::object to_py_int16(int16_t value) { return steal_result(PyLong_FromLong(value)); }
+inline py::object to_py_int32(int32_t value) { return steal_result(PyLong_FromLong(value)); }
+inline py::object to_py_int64(int64_t value) { return steal_result(PyLong_FromLongLong(value)); }
+inline py::object to_py_uint8(uint8_t value) { return steal_result(PyLong_FromUnsignedLong(value)); }
+inline py::object to_py_uint16(uint16_t value) { return steal_result(PyLong_FromUnsignedLong(value)); }
+inline py::object to_py_uint32(uint32_t value) { return steal_result(PyLong_FromUnsignedLong(value)); }
+inline py::object to_py_uint64(uint64_t value) { return steal_result(PyLong_FromUnsignedLongLong(value)); }
+inline py::object to_py_float(float value) { return steal_result(PyFloat_FromDouble(value)); }
+inline py::object to_py_double(double value) { return steal_result(PyFloat_FromDouble(value)); }
+inline py::object to_py_string(const char *value) { return steal_result(PyUnicode_FromString(value)); }
+
+inline uint64_t from_py_integer(py::handle obj) {
+    // same as SystemVerilog, values that don't fit into the type are truncated to the lower bits
+    // this also works with negative values and arbitrarily large Python integers
+    auto value = PyLong_AsUnsignedLongLongMask(obj.ptr());
+    if (value == static_cast<unsigned long long>(-1) && PyErr_Occurred()) throw py::error_already_set();
+    return value;
+}
+
+inline bool from_py_bit(py::handle obj) {
+    auto value = PyObject_IsTrue(obj.ptr());
+    if (value < 0) throw py::error_already_set();
+    return value != 0;
+}
+
+inline int8_t from_py_int8(py::handle obj) { return static_cast<int8_t>(from_py_integer(obj)); }
+inline int16_t from_py_int16(py::handle obj) { return static_cast<int16_t>(from_py_integer(obj)); }
+inline int32_t from_py_int32(py::handle obj) { return static_cast<int32_t>(from_py_integer(obj)); }
+inline int64_t from_py_int64(py::handle obj) { return static_cast<int64_t>(from_py_integer(obj)); }
+inline uint8_t from_py_uint8(py::handle obj) { return static_cast<uint8_t>(from_py_integer(obj)); }
+inline uint16_t from_py_uint16(py::handle obj) { return static_cast<uint16_t>(from_py_integer(obj)); }
+inline uint32_t from_py_uint32(py::handle obj) { return static_cast<uint32_t>(from_py_integer(obj)); }
+inline uint64_t from_py_uint64(py::handle obj) { return from_py_integer(obj); }
+
+inline double from_py_double(py::handle obj) {
+    auto value = PyFloat_AsDouble(obj.ptr());
+    if (value == -1.0 && PyErr_Occurred()) throw py::error_already_set();
+    return value;
+}
+
+inline float from_py_float(py::handle obj) { return static_cast<float>(from_py_double(obj)); }
+
+inline std::string from_py_string(py::handle obj) {
+    Py_ssize_t size;
+    auto value = PyUnicode_AsUTF8AndSize(obj.ptr(), &size);
+    if (!value) throw py::error_already_set();
+    return std::string(value, size);
+}
+void start_profiler() {}
+void stop_profiler() {}
+void add_stats_module() {}
 void check_interpreter() {
-    if (!guard) guard = std::unique_ptr<py::scoped_interpreter>(new py::scoped_interpreter());
+    if (!guard) {
+        guard = std::unique_ptr<py::scoped_interpreter>(new py::scoped_interpreter());
+        start_profiler();
+        add_stats_module();
+        release_main_thread();
+    }
+}
+// how the attribute resolved from the object type is called
+enum MethodCallMode { METHOD_LOOKUP = 0, METHOD_UNBOUND = 1, METHOD_DESCRIPTOR = 2, METHOD_ATTRIBUTE = 3 };
+
+// finds the attribute in the type and its bases without binding it
+py::object lookup_type_attr(const py::handle &type, const py::handle &name) {
+    for (auto base: type.attr("__mro__")) {
+        auto dict = base.attr("__dict__");
+        if (dict.contains(name)) return dict[name];
+    }
+    return py::object();
+}
+
+template<class ...Args>
+py::object call_method(const py::handle &obj, const py::handle &name, Args &&...args) {
+#if PY_VERSION_HEX >= 0x03090000
+    // same lookup as obj.name(...), which doesn't create the bound method or the instance __dict__
+    PyObject *arg_ptrs[] = {obj.ptr(), args.ptr()...};
+    auto result = PyObject_VectorcallMethod(name.ptr(), arg_ptrs, sizeof...(Args) + 1, nullptr);
+    if (!result) throw py::error_already_set();
+    return py::reinterpret_steal<py::object>(result);
+#else
+    auto attr = PyObject_GetAttr(obj.ptr(), name.ptr());
+    if (!attr) throw py::error_already_set();
+    return call_function(py::reinterpret_steal<py::object>(attr), std::forward<Args>(args)...);
+#endif
 }
+
 template<class ...Args>
-py::object call_class_func(void *py_ptr, const std::string &func_name, Args &&...args) {
-    if (!py_obj_map) return py::none();
-    if (py_obj_map->find(py_ptr) == py_obj_map->end()) {
+py::object call_class_func(size_t func_id, void *py_ptr, const char *func_name, Args &&...args) {
+    auto handle = py_obj_table ? py_obj_table->get(py_ptr) : py::handle();
+    if (!handle) {
         std::cerr << "ERROR: unable to call function " << func_name
                   << " from ptr " << py_ptr << std::endl;
         return py::none();
     }
-    auto handle = py_obj_map->at(py_ptr);
 
-    // special case for __destroy__ call
-    if (func_name == "destroy") {
-        // this is a special case
-        // 1. manually decrease the reference we increased during object creation
-        handle.dec_ref();
-        // 2. use pybind's RAII to remove the actual reference
-        py_obj_map->erase(py_ptr);
-        return py::none();
+    auto &method = get_method_def(func_id);
+    auto type = Py_TYPE(handle.ptr());
+    if (reinterpret_cast<PyObject *>(type) != method.type.ptr()) {
+        // resolve the attribute from the object type, which only happens once unless
+        // objects of different types are passed in
+        if (!method.name) {
+            method.name = py::reinterpret_steal<py::object>(PyUnicode_InternFromString(func_name));
+        }
+        auto type_obj = py::reinterpret_borrow<py::object>(reinterpret_cast<PyObject *>(type));
+        method.func = lookup_type_attr(type_obj, method.name);
+        auto attr_type = method.func ? Py_TYPE(method.func.ptr()) : nullptr;
+        method.descr_get = attr_type ? attr_type->tp_descr_get : nullptr;
+#ifdef Py_TPFLAGS_METHOD_DESCRIPTOR
+        bool is_method = attr_type && PyType_HasFeature(attr_type, Py_TPFLAGS_METHOD_DESCRIPTOR);
+#else
+        bool is_method = method.func && PyFunction_Check(method.func.ptr());
+#endif
+        bool is_data_descriptor = attr_type && attr_type->tp_descr_set;
+        // an instance attribute takes precedence over anything but a data descriptor, so the cached
+        // attribute is only used when the object doesn't have an instance __dict__
+        if (!method.func || type->tp_getattro != PyObject_GenericGetAttr ||
+            (type->tp_dictoffset && !is_data_descriptor)) {
+            method.call_mode = METHOD_LOOKUP;
+        } else if (is_method && !is_data_descriptor) {
+            method.call_mode = METHOD_UNBOUND;
+        } else if (method.descr_get) {
+            method.call_mode = METHOD_DESCRIPTOR;
+        } else {
+            method.call_mode = METHOD_ATTRIBUTE;
+        }
+        method.type = type_obj;
     }
 
-    auto func = handle.attr(func_name.c_str());
-    auto result = func(args...);
-    return result;
+    switch (method.call_mode) {
+        case METHOD_UNBOUND:
+            // the object is passed in as self
+            return call_function(method.func, handle, std::forward<Args>(args)...);
+        case METHOD_DESCRIPTOR: {
+            // e.g. static and class methods, or properties
+            auto bound = method.descr_get(method.func.ptr(), handle.ptr(), method.type.ptr());
+            if (!bound) throw py::error_already_set();
+            return call_function(py::reinterpret_steal<py::object>(bound), std::forward<Args>(args)...);
+        }
+        case METHOD_ATTRIBUTE:
+            return call_function(method.func, std::forward<Args>(args)...);
+        default:
+            return call_method(handle, method.name, std::forward<Args>(args)...);
+    }
 }
 
-void * create_class_func(py::dict &locals, const std::string &class_name) {
-    if (!py_obj_map) {
-        py_obj_map = std::unique_ptr<std::unordered_map<void*, py::object>>(new std::unordered_map<void*, py::object>());
+void destroy_object(void *py_ptr) {
+    // the table releases its reference to the object
+    if (!py_obj_table || !py_obj_table->remove(py_ptr)) {
+        std::cerr << "ERROR: unable to destroy object from ptr " << py_ptr << std::endl;
     }
-    py::object result = locals["__result"];
-    // manually increase the ref count to avoid being gc'ed; just in case
-    result.inc_ref();
-    auto r_ptr = result.ptr();
-    py_obj_map->emplace(r_ptr, result);
-    // also need to taken care of move the class definition to
-    if (!class_name.empty()) {
-        if (!class_defs) {
-            class_defs = std::unique_ptr<py::dict>(new py::dict());
-        }
-        (*class_defs)[class_name.c_str()] = locals[class_name.c_str()];
+}
+void * create_class_func(const py::object &result) {
+    if (!py_obj_table) {
+        py_obj_table = std::unique_ptr<HandleTable>(new HandleTable());
     }
-    return r_ptr;
+    // the table holds a reference to the object until it is destroyed
+    return py_obj_table->add(result);
 }
 void load_class_defs(py::dict &globals) {
     if (class_defs) {
@@ -70,14 +336,37 @@ void load_class_defs(py::dict &globals) {
     }
 }
 
+void add_class_namespace(py::dict &globals) {
+    load_class_defs(globals);
+    // keep track of the namespace so that classes defined later are visible as well
+    if (!class_namespaces) {
+        class_namespaces = std::unique_ptr<std::vector<py::dict>>(new std::vector<py::dict>());
+    }
+    class_namespaces->emplace_back(globals);
+}
+
+void add_class_def(const char *class_name, const py::object &class_def) {
+    // class is only defined once per interpreter so all the objects share the same type
+    if (!class_defs) {
+        class_defs = std::unique_ptr<py::dict>(new py::dict());
+    }
+    (*class_defs)[class_name] = class_def;
+    // cached function namespaces need to see the class definition as well
+    if (class_namespaces) {
+        for (auto &globals: (*class_namespaces)) {
+            globals[class_name] = class_def;
+        }
+    }
+}
+
 extern "C" {
 __attribute__((visibility("default"))) void* SomeClass_pysv_init() {
   check_interpreter();
-  auto globals = py::dict();
-  load_class_defs(globals);
-  auto locals = py::dict();
-
-  py::exec(R"(
+  auto &py_func = get_function_def(0);
+  if (!py_func) {
+    auto globals = py::dict();
+    add_class_namespace(globals);
+    py::exec(R"(
 class SomeClass:
 
     def __init__(self):
@@ -95,9 +384,12 @@ class SomeClass:
     def add_sub(self, a, b):
         return a + b, a - b
 
-__result = SomeClass()
-)", globals, locals);
-  return create_class_func(locals, "SomeClass");
+)", globals);
+    py_func = globals["SomeClass"];
+    add_class_def("SomeClass", py_func);
+  }
+  auto py_result = call_function(py_func);
+  return create_class_func(py_result);
 }
 
 __attribute__((visibility("default"))) void SomeClass_add_sub(void* self,
@@ -106,85 +398,76 @@ __attribute__((visibility("default"))) void SomeClass_add_sub(void* self,
                                                               uint32_t *res_add,
                                                               uint32_t *res_sub) {
   check_interpreter();
-  auto globals = py::dict();
-  load_class_defs(globals);
-  auto locals = py::dict();
-  locals["__self"] = self;
-  locals["__a"] = a;
-  locals["__b"] = b;
-
-  locals["__result"] = call_class_func(self,
-                                       "add_sub",
-                                       locals["__a"],
-                                       locals["__b"]);
-  auto ref_result = locals["__result"].cast<py::list>();
+  auto py_result = call_class_func(1,
+                                   self,
+                                   "add_sub",
+                                   to_py_uint32(a),
+                                   to_py_uint32(b));
+  auto ref_result = py::tuple(py_result);
   if (py::len(ref_result) != 2) {
     throw std::runtime_error("Invalid return tuple size");
   }
-  *res_add = ref_result[0].cast<uint32_t>();
-  *res_sub = ref_result[1].cast<uint32_t>();
+  *res_add = from_py_uint32(ref_result[0]);
+  *res_sub = from_py_uint32(ref_result[1]);
 }
 
 __attribute__((visibility("default"))) void SomeClass_destroy(void* self) {
   check_interpreter();
-  auto globals = py::dict();
-  load_class_defs(globals);
-  auto locals = py::dict();
-  locals["__self"] = self;
-
-  locals["__result"] = call_class_func(self,
-                                       "destroy");
+  destroy_object(self);
 }
 
 __attribute__((visibility("default"))) int32_t SomeClass_plus(void* self,
                                                               int32_t num) {
   check_interpreter();
-  auto globals = py::dict();
-  load_class_defs(globals);
-  auto locals = py::dict();
-  locals["__self"] = self;
-  locals["__num"] = num;
-
-  locals["__result"] = call_class_func(self,
-                                       "plus",
-                                       locals["__num"]);
-  return locals["__result"].cast<int32_t>();
+  auto py_result = call_class_func(3,
+                                   self,
+                                   "plus",
+                                   to_py_int32(num));
+  return from_py_int32(py_result);
 }
 
 __attribute__((visibility("default"))) void SomeClass_print_a(void* self) {
   check_interpreter();
-  auto globals = py::dict();
-  load_class_defs(globals);
-  auto locals = py::dict();
-  locals["__self"] = self;
-
-  locals["__result"] = call_class_func(self,
-                                       "print_a");
+  call_class_func(4,
+                  self,
+                  "print_a");
 }
 
 __attribute__((visibility("default"))) void SomeClass_print_b(void* self,
                                                               int32_t num) {
   check_interpreter();
-  auto globals = py::dict();
-  load_class_defs(globals);
-  auto locals = py::dict();
-  locals["__self"] = self;
-  locals["__num"] = num;
-
-  locals["__result"] = call_class_func(self,
-                                       "print_b",
-                                       locals["__num"]);
+  call_class_func(5,
+                  self,
+                  "print_b",
+                  to_py_int32(num));
 }
 __attribute__((visibility("default"))) void pysv_finalize() {
+    // take the GIL back before releasing any python object
+    restore_main_thread();
+    // profiles are written before any of the python functions are released
+    stop_profiler();
+    // clear the cached function definitions
+    function_defs.reset();
+    numpy_asarray.reset();
+    numpy_frombuffer.reset();
+    struct_dtypes.reset();
+    runtime_epoch++;
     // clear the cached global imports
     global_imports.reset();
-    // clear the object map
-    py_obj_map.reset();
+    // clear the object handle table
+    py_obj_table.reset();
     // clear the class map
     class_defs.reset();
+    class_namespaces.reset();
+    // the next call has to set up the runtime again
+    runtime_ready.store(false, std::memory_order_release);
     // the last part is tear down the runtime
     guard.reset();
 }
+__attribute__((visibility("default"))) int32_t pysv_live_objects(const char* class_name) {
+    if (!py_obj_table) return 0;
+    return py_obj_table->live_objects(class_name);
+}
 }
 #ifndef PYSV_CXX_BINDING
 #define PYSV_CXX_BINDING
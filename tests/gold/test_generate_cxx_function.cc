@@ -2,17 +2,19 @@ __attribute__((visibility("default"))) int32_t simple_func(int32_t a,
                                                            int32_t b,
                                                            int32_t c) {
   check_interpreter();
-  auto globals = py::dict();
-  auto locals = py::dict();
-  locals["__a"] = a;
-  locals["__b"] = b;
-  locals["__c"] = c;
-
-  py::exec(R"(
+  auto &py_func = get_function_def(0);
+  if (!py_func) {
+    auto globals = py::dict();
+    py::exec(R"(
 def simple_func(a, b, c):
     return a + b - c
 
-__result = simple_func(__a, __b, __c)
-)", globals, locals);
-  return locals["__result"].cast<int32_t>();
+)", globals);
+    py_func = globals["simple_func"];
+  }
+  auto py_result = call_function(py_func,
+                                 to_py_int32(a),
+                                 to_py_int32(b),
+                                 to_py_int32(c));
+  return from_py_int32(py_result);
 }
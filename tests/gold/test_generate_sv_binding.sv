@@ -14,6 +14,7 @@ import "DPI-C" function void SomeClass_print_a(input chandle self);
 import "DPI-C" function void SomeClass_print_b(input chandle self,
                                                input int num);
 import "DPI-C" function void pysv_finalize();
+import "DPI-C" function int pysv_live_objects(input string class_name);
 class PySVObject;
 chandle pysv_ptr;
 endclass
@@ -1,6 +1,7 @@
-from pysv import sv, DataType, Reference, import_
+from pysv import sv, DataType, Reference, import_, Bits, Logic, Struct
 from pysv.codegen import (get_python_src, generate_cxx_function, generate_c_header, generate_pybind_code,
-                          generate_sv_binding, generate_cxx_binding, generate_dpi_signature, generate_pybind_function)
+                          generate_sv_binding, generate_cxx_binding, generate_dpi_signature, generate_pybind_function,
+                          generate_remote_execute_code, generate_model_src)
 # all the module imports in this file should be local to avoid breaking assertions
 
 
@@ -28,7 +29,6 @@ def test_get_python_src():
     expected = """def func(a, b):
     return a + b
 
-__result = func(__a, __b)
 """
     assert result == expected
 
@@ -48,6 +48,312 @@ def test_generate_c_header():
     assert result == "int32_t simple_func(int32_t a, int32_t b, int32_t c);"
 
 
+def test_generate_batch_function():
+    @sv(return_type=Reference(b=DataType.Bit), a=DataType.ShortInt, batch=True)
+    def func(a):
+        return a > 0
+
+    batch_def = func.func_def.variants[0]
+    result = generate_dpi_signature(batch_def, pretty_print=False)
+    assert result == 'import "DPI-C" function void func_batch(input shortint a[], output bit b[]);'
+    result = generate_c_header(batch_def, pretty_print=False)
+    assert result == "void func_batch(svOpenArrayHandle a, svOpenArrayHandle b);"
+    # the batched variant shares the same python function
+    result = generate_pybind_code([func])
+    assert "constexpr size_t NUM_FUNCTION_DEFS = 1;" in result
+    assert result.count("get_function_def(0)") == 2
+    assert "b_batch[i] = from_py_bit(py_result);" in result
+
+
+def test_generate_array_output():
+    @sv(a=DataType.IntArray, c=DataType.IntArray, return_type=Reference(b=DataType.IntArray, c=DataType.IntArray))
+    def func(a, b, c):
+        pass
+
+    result = generate_dpi_signature(func, pretty_print=False)
+    assert result == 'import "DPI-C" function void func(input int a[], output int b[], inout int c[]);'
+    result = generate_c_header(func, pretty_print=False)
+    assert result == "void func(svOpenArrayHandle a, svOpenArrayHandle b, svOpenArrayHandle c);"
+    # output arrays are passed to the python function in the original order and filled in place
+    result = generate_cxx_function(func, pretty_print=False)
+    assert "call_function(py_func, to_buffer<int32_t>(a), to_buffer<int32_t>(b), to_buffer<int32_t>(c));" in result
+    assert "py_result" not in result
+
+
+def test_generate_array_types():
+    @sv(a=DataType.UByteArray, b=DataType.LongIntArray, c=DataType.DoubleArray,
+        return_type=Reference(d=DataType.FloatArray))
+    def func(a, b, c, d):
+        pass
+
+    result = generate_dpi_signature(func, pretty_print=False)
+    assert result == 'import "DPI-C" function void func(input byte unsigned a[], input longint b[], ' \
+                     'input real c[], output shortreal d[]);'
+    result = generate_cxx_function(func, pretty_print=False)
+    assert "to_buffer<uint8_t>(a), to_buffer<int64_t>(b), to_buffer<double>(c), to_buffer<float>(d)" in result
+
+
+def test_generate_fixed_shape_array():
+    import pytest
+
+    @sv(a=DataType.IntArray[4, 16], b=DataType.DoubleArray[2])
+    def func(a, b):
+        pass
+
+    result = generate_dpi_signature(func, pretty_print=False)
+    assert result == 'import "DPI-C" function void func(input int a[][], input real b[][]);'
+    result = generate_cxx_function(func, pretty_print=False)
+    assert "  static FixedBuffer<int32_t, 4, 16> a_buffer;\n  call_function(py_func, a_buffer.view(a), " \
+           "to_buffer<double>(b));" in result
+    # a single large number is rejected instead of being read as the number of dimensions
+    with pytest.raises(AssertionError, match=r"IntArray\[16,\]"):
+        DataType.IntArray[16]
+
+    @sv(a=DataType.IntArray[16, ])
+    def func_1d(a):
+        pass
+
+    result = generate_cxx_function(func_1d, pretty_print=False)
+    assert "static FixedBuffer<int32_t, 16> a_buffer;" in result
+
+
+def test_generate_vector_types():
+    @sv(return_type=Bits[128], a=Bits[128], b=Logic[65])
+    def func(a, b):
+        return a + b
+
+    result = generate_dpi_signature(func, pretty_print=False)
+    assert result == 'import "DPI-C" function void func(input bit [127:0] a, input logic [64:0] b, ' \
+                     'output bit [127:0] result);'
+    result = generate_cxx_function(func, pretty_print=False)
+    assert result.startswith('__attribute__((visibility("default"))) void func(const svBitVecVal* a, '
+                             'const svLogicVecVal* b, svBitVecVal *result) {')
+    assert "to_py_bits(a, 128), to_py_logic(b, 65)" in result
+    assert "from_py_bits(py_result, result, 128);" in result
+
+
+def test_generate_struct():
+    packet = Struct("packet_t", addr=DataType.UInt, size=DataType.UShortInt, data=DataType.Byte)
+    assert packet.width == 56
+    assert packet.dtype_spec() == {"names": ["addr", "size", "data"], "formats": ["<u4", "<u2", "i1"],
+                                   "offsets": [3, 1, 0], "itemsize": 8}
+
+    @sv(return_type=packet, a=packet, b=packet[1])
+    def func(a, b):
+        return a
+
+    result = generate_sv_binding([func], pretty_print=False)
+    assert "typedef struct packed { int unsigned addr; shortint unsigned size; byte data; } packet_t;\n" \
+           'import "DPI-C" function void func(input packet_t a, input packet_t b[], output packet_t result);' \
+           in result
+    result = generate_cxx_function(func, pretty_print=False)
+    assert "to_py_struct(a, pysv_dtype_packet_t(), 8), to_py_struct_array(b, pysv_dtype_packet_t(), 8)" in result
+    assert "from_py_struct(py_result, result, pysv_dtype_packet_t(), 8);" in result
+
+
+def test_generate_stats():
+    @sv(a=DataType.Int, b=DataType.String)
+    def func(a, b):
+        return a
+
+    result = generate_cxx_function(func, pretty_print=False, func_id=2, stats=True)
+    assert "  StatsTimer stats_timer(2);\n" \
+           "  auto py_arg_a = to_py_int32(a);\n" \
+           "  auto py_arg_b = to_py_string(b);\n" \
+           "  stats_timer.lap(STATS_ARGS);\n" \
+           "  auto py_result = call_function(py_func, py_arg_a, py_arg_b);\n" \
+           "  stats_timer.lap(STATS_PYTHON);\n" in result
+    code = generate_pybind_code([func], stats=True)
+    assert 'const char *FUNCTION_NAMES[] = {"func"};' in code
+    assert "write_stats_report();" in code
+    # nothing is generated when the statistics are disabled
+    assert "StatsTimer" not in generate_pybind_code([func])
+
+
+def test_generate_trace():
+    @sv(a=DataType.Object, b=DataType.UByte, s=DataType.String, c=DataType.Double)
+    def func(a, b, s, c):
+        return b
+
+    result = generate_cxx_function(func, pretty_print=False, func_id=1, trace=True)
+    # strings are not part of the summary
+    assert "  TraceScope trace_scope(1);\n" \
+           "  trace_scope.handle(a);\n" \
+           '  trace_scope.arg("b", b);\n' \
+           '  trace_scope.arg("c", c);\n' in result
+    code = generate_pybind_code([func], trace=True)
+    assert "write_trace_report();" in code
+    assert "sim_time = value;" in code
+    assert "TraceScope" not in generate_pybind_code([func])
+
+
+def test_generate_profile():
+    @sv()
+    def func(a):
+        return a
+
+    assert "void start_profiler() {\n" in generate_pybind_code([func], profile=True)
+    # only the empty hooks are generated when profiling is disabled
+    code = generate_pybind_code([func])
+    assert "void start_profiler() {}\nvoid stop_profiler() {}\n" in code
+    assert "frameobject.h" not in code
+
+
+def test_generate_record():
+    @sv(return_type=Reference(lo=DataType.UByte, hi=Bits[12], out=DataType.IntArray, extra=DataType.DoubleArray),
+        out=DataType.IntArray)
+    def func(b, out, extra):
+        return 1, 2
+
+    result = generate_cxx_function(func, pretty_print=False, func_id=3, record=True)
+    # arrays are recorded before they are changed in place, while output only arrays are not initialized yet
+    assert "  CallRecord call_record(3);\n" \
+           "  call_record.write(b);\n" \
+           "  call_record.write_array<int32_t>(out);\n" \
+           "  call_record.write_array_shape<double>(extra);\n" \
+           "  auto py_result = " in result
+    assert result.endswith("  call_record.begin_results();\n"
+                           "  call_record.write(*lo);\n"
+                           "  call_record.write_bits(hi, 12);\n"
+                           "  call_record.write_array<int32_t>(out);\n"
+                           "  call_record.write_array<double>(extra);\n"
+                           "}\n")
+
+
+def test_generate_cache():
+    @sv(cache=64, a=DataType.UInt, b=DataType.Double, return_type=DataType.Bit)
+    def func(a, b):
+        return a > b
+
+    result = generate_cxx_function(func, pretty_print=False, func_id=1)
+    # a hit returns before the interpreter is checked
+    assert result.startswith('__attribute__((visibility("default"))) bool func(uint32_t a, double b) {\n'
+                             "  CacheKey<2> cache_key{{pack_cache_key(a), pack_cache_key(b)}};\n"
+                             "  bool cache_value;\n"
+                             "  if (func_lru.get(cache_key, cache_value)) return cache_value;\n"
+                             "  check_sys_path(PYTHON_LIBRARY);\n")
+    assert result.endswith("  auto c_result = from_py_bit(py_result);\n"
+                           "  func_lru.put(cache_key, c_result);\n"
+                           "  return c_result;\n"
+                           "}\n")
+    code = generate_pybind_code([func])
+    assert "LRUCache<2, bool> func_lru(64);\n" in code
+    sv_code = generate_sv_binding([func], pretty_print=False)
+    assert 'import "DPI-C" function void func_cache_clear();' in sv_code
+    assert 'import "DPI-C" function longint func_cache_hits();' in sv_code
+    assert 'import "DPI-C" function longint func_cache_misses();' in sv_code
+    # hits are counted and recorded as well
+    result = generate_cxx_function(func, pretty_print=False, func_id=1, stats=True, record=True)
+    assert "  StatsTimer stats_timer(1);\n" \
+           "  CallRecord call_record(1);\n" \
+           "  call_record.write(a);\n" \
+           "  call_record.write(b);\n" \
+           "  CacheKey<2> cache_key{{pack_cache_key(a), pack_cache_key(b)}};\n" \
+           "  bool cache_value;\n" \
+           "  if (func_lru.get(cache_key, cache_value)) {\n" \
+           "    stats_timer.cached();\n" \
+           "    call_record.begin_results();\n" \
+           "    call_record.write(cache_value);\n" \
+           "    return cache_value;\n" \
+           "  }\n" \
+           "  check_sys_path(PYTHON_LIBRARY);\n" in result
+
+    @sv(a=DataType.UInt, b=DataType.Double, return_type=DataType.Bit)
+    def no_cache(a, b):
+        return a > b
+
+    # nothing is generated without the cache
+    assert "LRUCache" not in generate_pybind_code([no_cache])
+
+
+def test_generate_table():
+    @sv(table=True, a=DataType.Bit, b=DataType.Byte, return_type=DataType.ShortInt)
+    def func(a, b):
+        return b if a else -b
+
+    result = generate_cxx_function(func, pretty_print=False)
+    # the first argument is the most significant part of the index
+    assert result == '__attribute__((visibility("default"))) int16_t func(bool a, int8_t b) {\n' \
+                     "  return func_table[(static_cast<size_t>(a) << 8) | " \
+                     "static_cast<size_t>(static_cast<uint8_t>(b))];\n" \
+                     "}\n"
+    code = generate_pybind_code([func])
+    # negative values are indexed by their unsigned value
+    assert "const int16_t func_table[512] = {\n" \
+           "  0, -1, -2, -3, -4, -5, -6, -7, -8, -9, -10, -11, -12, -13, -14, -15,\n" in code
+    assert "  -112, -113, -114, -115, -116, -117, -118, -119, -120, -121, -122, -123, -124, -125, -126, -127,\n" \
+           "  128, 127, 126, " in code
+
+
+def test_generate_const():
+    @sv(const=True)
+    def width():
+        return 32
+
+    @sv(const=True, return_type=DataType.LongInt)
+    def seed():
+        return -(1 << 40)
+
+    @sv(const=True, return_type=DataType.String)
+    def name():
+        return 'a"b\n'
+
+    @sv()
+    def add(a, b):
+        return a + b
+
+    func_defs = [width, seed, name, add]
+    sv_code = generate_sv_binding(func_defs, pretty_print=False)
+    # values that don't fit into 32 bits use sized literals
+    assert "package pysv;\n" \
+           "function int width();\n" \
+           "  return 32;\n" \
+           "endfunction\n" \
+           "function longint seed();\n" \
+           "  return -64'sd1099511627776;\n" \
+           "endfunction\n" \
+           "function string name();\n" \
+           '  return "a\\"b\\n";\n' \
+           "endfunction\n" \
+           'import "DPI-C" function int add(input int a, input int b);\n' in sv_code
+    # the C++ side doesn't know about the constants
+    code = generate_pybind_code(func_defs)
+    assert "width" not in code and "seed" not in code
+    assert "width" not in generate_c_header(add)
+
+
+def test_generate_remote_function():
+    @sv(return_type=DataType.Void, a=DataType.UInt)
+    def post_func(a):
+        pass
+
+    @sv(return_type=Reference(b=DataType.Bit, c=DataType.Float), a=DataType.LongInt)
+    def call_func(a):
+        return a > 0, a / 2
+
+    # calls without results don't wait for the model server
+    result = generate_remote_execute_code(post_func, func_id=1)
+    assert result == "  auto &client = get_remote_client();\n" \
+                     "  client.begin(REMOTE_POST, 1);\n" \
+                     "  client.write_uint(a);\n" \
+                     "  client.post();\n"
+    result = generate_remote_execute_code(call_func)
+    assert "client.write_int(a);\n  auto response = client.call();\n  response.read_tuple(2);\n" in result
+    assert "*c = static_cast<float>(response.read_double());" in result
+    model = generate_model_src([post_func, call_func])
+    assert model.endswith("FUNCTIONS = [\n    (FUNCTION, post_func, False),\n    (FUNCTION, call_func, False),\n]\n")
+
+
+def test_shm_machine():
+    import pytest
+    from pysv.util import check_shm_machine
+    # the ring relies on the store ordering of x86
+    check_shm_machine("x86_64")
+    check_shm_machine("AMD64")
+    with pytest.raises(AssertionError):
+        check_shm_machine("aarch64")
+
+
 def test_generate_cxx_code(check_file):
     result = generate_pybind_code([simple_func])
     check_file(result, "test_generate_cxx_code.cc")
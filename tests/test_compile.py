@@ -1,5 +1,12 @@
-from pysv import compile_lib, sv, DataType, Reference
+from pysv import compile_lib, sv, DataType, Reference, Batch, Async, Table, Runtime, Bits, Logic, Struct
+import json
 import os
+import shutil
+import struct
+import subprocess
+import sys
+import time
+import zlib
 from pysv.compile import compile_and_run
 
 
@@ -50,6 +57,77 @@ def test_float(temp):
     assert outputs[0] == "42.2"
 
 
+def test_sys_path_runtime_ready(temp):
+    @sv()
+    def path_ready():
+        import sys
+        return sys.path[-1] != ""
+
+    lib_file = compile_lib([path_ready], cwd=temp, add_sys_path=True)
+    code = """
+    std::cout << path_ready() << std::endl;
+    std::cout << path_ready() << std::endl;
+    // the runtime is set up again after finalize
+    pysv_finalize();
+    std::cout << path_ready();
+    """
+
+    outputs = compile_and_run(lib_file, code, temp, [path_ready])
+    outputs = outputs.splitlines()
+    assert outputs == ["1", "1", "1"]
+
+
+def test_function_defined_once(temp):
+    @sv()
+    def count_calls():
+        # the attribute is kept only if the function object is not re-created
+        count_calls.count = getattr(count_calls, "count", 0) + 1
+        return count_calls.count
+
+    lib_file = compile_lib([count_calls], cwd=temp)
+    code = """
+    for (auto i = 0; i < 3; i++) {
+        std::cout << count_calls() << std::endl;
+    }
+    """
+
+    outputs = compile_and_run(lib_file, code, temp, [count_calls])
+    outputs = [int(v) for v in outputs.splitlines()]
+    assert outputs == [1, 2, 3]
+
+
+def test_integer_conversion(temp):
+    @sv(a=DataType.Byte, b=DataType.UShortInt, return_type=DataType.UByte)
+    def add_ubyte(a, b):
+        return a + b
+
+    @sv(a=DataType.LongInt, return_type=DataType.Int)
+    def truncate_int(a):
+        return a << 32 | 5
+
+    @sv(a=DataType.ULongInt, return_type=DataType.LongInt)
+    def to_signed(a):
+        return a
+
+    @sv(return_type=DataType.Bit)
+    def is_odd(a):
+        return a % 2 == 1
+
+    funcs = [add_ubyte, truncate_int, to_signed, is_odd]
+    lib_file = compile_lib(funcs, cwd=temp)
+    code = """
+    std::cout << static_cast<int>(add_ubyte(-2, 1)) << std::endl;
+    std::cout << truncate_int(-1) << std::endl;
+    std::cout << to_signed(0xFFFFFFFFFFFFFFFFull) << std::endl;
+    std::cout << is_odd(3) << is_odd(4) << std::endl;
+    """
+
+    outputs = compile_and_run(lib_file, code, temp, funcs)
+    outputs = outputs.splitlines()
+    # values wrap around just like SystemVerilog
+    assert outputs == ["255", "5", "-1", "10"]
+
+
 def test_numpy(temp):
     import numpy as np
 
@@ -182,6 +260,157 @@ pysv_finalize();
     assert value == 42
 
 
+def test_class_defined_once(temp):
+    class Transaction:
+        @sv()
+        def __init__(self):
+            pass
+
+        @sv(other=DataType.Object, return_type=DataType.Bit)
+        def same_type(self, other):
+            return isinstance(other, type(self))
+
+    lib_file = compile_lib([Transaction], cwd=temp)
+    cxx_code = """
+void *t1 = Transaction_pysv_init();
+void *t2 = Transaction_pysv_init();
+std::cout << Transaction_same_type(t1, t2) << std::endl;
+"""
+    value = compile_and_run(lib_file, cxx_code, temp, [Transaction])
+    assert int(value) == 1
+
+
+def test_class_visible_to_function(temp):
+    class Item:
+        @sv()
+        def __init__(self):
+            self.value = 42
+
+    @sv()
+    def get_item_value(create):
+        if create:
+            return Item().value
+        return 0
+
+    lib_file = compile_lib([Item, get_item_value], cwd=temp)
+    # the function namespace is created before the class is defined
+    cxx_code = """
+std::cout << get_item_value(0) << std::endl;
+Item_pysv_init();
+std::cout << get_item_value(1) << std::endl;
+"""
+    values = compile_and_run(lib_file, cxx_code, temp, [Item, get_item_value]).split()
+    assert [int(v) for v in values] == [0, 42]
+
+
+def test_object_handle_table(temp):
+    class Node:
+        @sv()
+        def __init__(self):
+            self.value = 1
+
+        @sv()
+        def set_value(self, value):
+            self.value = value
+
+        @sv()
+        def get_value(self):
+            return self.value
+
+    lib_file = compile_lib([Node], cwd=temp)
+    cxx_code = """
+void *n1 = Node_pysv_init();
+void *n2 = Node_pysv_init();
+std::cout << pysv_live_objects("Node") << std::endl;
+Node_destroy(n1);
+std::cout << pysv_live_objects("Node") << std::endl;
+// reuses the slot from n1 with a new generation
+void *n3 = Node_pysv_init();
+std::cout << (n1 != n3) << std::endl;
+// stale handle should not touch n3
+Node_set_value(n1, 42);
+std::cout << Node_get_value(n3) << std::endl;
+"""
+    values = compile_and_run(lib_file, cxx_code, temp, [Node], use_implementation=True).split()
+    assert [int(v) for v in values] == [2, 1, 1, 1]
+
+
+def test_method_shadowed_by_attribute(temp):
+    class Model:
+        @sv()
+        def __init__(self):
+            pass
+
+        @sv()
+        def override(self, value):
+            self.read = lambda: value
+
+        @sv()
+        def read(self):
+            return 1
+
+    lib_file = compile_lib([Model], cwd=temp)
+    cxx_code = """
+void *m1 = Model_pysv_init();
+void *m2 = Model_pysv_init();
+std::cout << Model_read(m1) << std::endl;
+Model_override(m1, 42);
+// instance attributes take precedence over the cached method
+std::cout << Model_read(m1) << std::endl;
+std::cout << Model_read(m2) << std::endl;
+"""
+    values = compile_and_run(lib_file, cxx_code, temp, [Model]).split()
+    assert [int(v) for v in values] == [1, 42, 1]
+
+
+def test_static_and_class_method(temp):
+    class Scaler:
+        factor = 3
+
+        @sv()
+        def __init__(self):
+            pass
+
+        @staticmethod
+        @sv()
+        def twice(value):
+            return value * 2
+
+        @classmethod
+        @sv()
+        def triple(cls, value):
+            return value * cls.factor
+
+    class Slotted:
+        __slots__ = ("value",)
+
+        @sv()
+        def __init__(self):
+            self.value = 5
+
+        @sv()
+        def get(self):
+            return self.value
+
+        @staticmethod
+        @sv()
+        def offset(value):
+            return value + 1
+
+    # static methods don't take the object in python
+    assert Scaler.twice(4) == 8
+    lib_file = compile_lib([Scaler, Slotted], cwd=temp)
+    # the object is only used to find the method
+    cxx_code = """
+void *s = Scaler_pysv_init();
+std::cout << Scaler_twice(s, 21) << " " << Scaler_triple(s, 2) << std::endl;
+void *o = Slotted_pysv_init();
+std::cout << Slotted_get(o) << " " << Slotted_offset(o, 1) << " " << Slotted_offset(o, 2) << std::endl;
+"""
+    values = compile_and_run(lib_file, cxx_code, temp, [Scaler, Slotted]).split()
+    assert [int(v) for v in values] == [42, 6, 5, 2, 3]
+
+
 def test_function_output_ref1(temp):
     @sv(return_type=Reference(a=DataType.Int))
     def func_output():
@@ -218,6 +447,26 @@ pysv_finalize();
     assert values[0] == 42 and values[1] == 43;
 
 
+# minimal open array implementation in place of the simulator. arrays are one dimensional unless the number of
+# rows is set, which splits them into two dimensions
+FAKE_OPEN_ARRAY = """
+struct FakeArray { void *data; int size; int rows; };
+extern "C" {
+void *svGetArrayPtr(const svOpenArrayHandle h) { return static_cast<FakeArray *>(h)->data; }
+int svDimensions(const svOpenArrayHandle h) { return static_cast<FakeArray *>(h)->rows ? 2 : 1; }
+int svSize(const svOpenArrayHandle h, int d) {
+    auto *array = static_cast<FakeArray *>(h);
+    if (!array->rows) return array->size;
+    return d == 1 ? array->rows : array->size / array->rows;
+}
+int svLeft(const svOpenArrayHandle h, int d) { return 0; }
+int svRight(const svOpenArrayHandle h, int d) { return static_cast<FakeArray *>(h)->size - 1; }
+// elements are always reached through svGetArrayPtr
+void *svGetArrElemPtr1(const svOpenArrayHandle h, int index) { return nullptr; }
+}
+"""
+
+
 def test_buffer_int(temp):
     @sv(return_type=DataType.Void, a=DataType.IntArray)
     def foo(a):
@@ -229,5 +478,819 @@ def test_buffer_int(temp):
     assert os.path.exists(lib_file)
 
 
+def test_buffer_int_output(temp):
+    @sv(a=DataType.IntArray, return_type=Reference(b=DataType.IntArray, c=DataType.IntArray, total=DataType.Int))
+    def bar(a, b, c):
+        b[0] = a[0]
+        c[0] = a[0] * 2
+        return a[0] + 1
+
+    @sv(return_type=Reference(acc=DataType.IntArray), acc=DataType.IntArray, value=DataType.Int)
+    def accumulate(acc, value):
+        for i in range(len(acc)):
+            acc[i] += value
+
+    lib_file = compile_lib([bar, accumulate], cwd=temp)
+    cxx_code = """
+int32_t a[] = {20}, b[] = {0}, c[] = {0, 0}, acc[] = {1, 2, 3};
+int32_t total;
+FakeArray a_array{a, 1}, b_array{b, 1}, c_array{c, 2}, acc_array{acc, 3};
+bar(&a_array, &b_array, &c_array, &total);
+std::cout << b[0] << " " << c[0] << " " << c[1] << " " << total << std::endl;
+accumulate(10, &acc_array);
+std::cout << acc[0] << " " << acc[1] << " " << acc[2] << std::endl;
+"""
+    values = compile_and_run(lib_file, cxx_code, temp, [bar, accumulate], extra_headers=FAKE_OPEN_ARRAY).splitlines()
+    # outputs are written in place, while inout arrays are read first
+    assert values == ["20 40 0 21", "11 12 13"]
+
+
+def test_buffer_types(temp):
+    @sv(a=DataType.UByteArray, b=DataType.LongIntArray, c=DataType.DoubleArray,
+        return_type=Reference(d=DataType.FloatArray))
+    def array_types(a, b, c, d):
+        print(a.format, b.format, c.format, d.format, flush=True)
+        d[0] = a[0] + b[0] + c[0]
+
+    lib_file = compile_lib([array_types], cwd=temp)
+    cxx_code = """
+uint8_t a[] = {255};
+int64_t b[] = {1ll << 40};
+double c[] = {0.5 - (1ll << 40)};
+float d[] = {0};
+FakeArray a_array{a, 1}, b_array{b, 1}, c_array{c, 1}, d_array{d, 1};
+array_types(&a_array, &b_array, &c_array, &d_array);
+std::cout << d[0] << std::endl;
+"""
+    values = compile_and_run(lib_file, cxx_code, temp, [array_types], extra_headers=FAKE_OPEN_ARRAY).splitlines()
+    assert values == ["B q d f", "255.5"]
+
+
+def test_bit_vector(temp):
+    @sv(return_type=Bits[100], a=Bits[100], b=Logic[40])
+    def add_vector(a, b):
+        print(hex(a), hex(b), flush=True)
+        return a + b
+
+    @sv(return_type=Reference(b=Logic[70]), a=Bits[8])
+    def negate_vector(a):
+        return -a
+
+    lib_file = compile_lib([add_vector, negate_vector], cwd=temp)
+    cxx_code = """
+// bits above the width are ignored. x in b is read as 0
+svBitVecVal a[] = {0xFFFFFFFF, 1, 0, 0xFFFFFFF0};
+svLogicVecVal b[] = {{3, 2}, {0xFF, 0}};
+svBitVecVal result[4];
+add_vector(a, b, result);
+std::cout << std::hex << result[0] << " " << result[1] << " " << result[2] << " " << result[3] << std::endl;
+svBitVecVal c[] = {5};
+svLogicVecVal d[3];
+negate_vector(c, d);
+std::cout << d[0].aval << " " << d[1].aval << " " << d[2].aval << " " << d[2].bval << std::endl;
+"""
+    values = compile_and_run(lib_file, cxx_code, temp, [add_vector, negate_vector]).splitlines()
+    assert values == ["0x1ffffffff 0xff00000001", "0 101 0 0", "fffffffb ffffffff 3f 0"]
+
+
+def test_fixed_shape_buffer(temp):
+    @sv(a=DataType.IntArray[2, 3])
+    def fixed_shape(a):
+        # the view is reused for the same array
+        same = globals().get("last_view") is a
+        globals()["last_view"] = a
+        print(a.shape, a.strides, a[1, 2], same, flush=True)
+
+    lib_file = compile_lib([fixed_shape], cwd=temp)
+    cxx_code = """
+int32_t a[] = {0, 1, 2, 3, 4, 5};
+int32_t b[] = {0, 10, 20, 30, 40, 50};
+FakeArray a_array{a, 6, 2}, b_array{b, 6, 2};
+fixed_shape(&a_array);
+fixed_shape(&a_array);
+fixed_shape(&b_array);
+// arrays that don't match the fixed shape are rejected, including a smaller array at the address of the
+// cached view
+FakeArray small_array{b, 4, 2}, flat_array{a, 6};
+for (auto *array: {&small_array, &flat_array}) {
+    try {
+        fixed_shape(array);
+    } catch (const std::runtime_error &ex) {
+        std::cout << ex.what() << std::endl;
+    }
+}
+"""
+    values = compile_and_run(lib_file, cxx_code, temp, [fixed_shape], extra_headers=FAKE_OPEN_ARRAY).splitlines()
+    assert values == ["(2, 3) (12, 4) 5 False", "(2, 3) (12, 4) 5 True", "(2, 3) (12, 4) 50 False",
+                      "Array dimension 2 has 2 elements instead of 3", "Array has 1 dimensions instead of 2"]
+
+
+def test_stats(temp, monkeypatch):
+    @sv()
+    def add(a, b):
+        return a + b
+
+    @sv(return_type=DataType.Void)
+    def report():
+        import pysv_stats
+        print(pysv_stats.read()["add"]["calls"], flush=True)
+
+    @sv(batch=True, run_async=True)
+    def mul(a, b):
+        return a * b
+
+    func_defs = [add, report, mul]
+    lib_file = compile_lib(func_defs, cwd=temp, stats=True)
+    stats_file = os.path.join(temp, "stats.json")
+    monkeypatch.setenv("PYSV_STATS_FILE", stats_file)
+    cxx_code = """
+for (auto i = 0; i < 10; i++) add(i, 1);
+report();
+int32_t a[] = {1, 2, 3, 4}, b[] = {5, 6, 7, 8}, result[4];
+FakeArray a_array{a, 4}, b_array{b, 4}, result_array{result, 4};
+mul_batch(&a_array, &b_array, &result_array);
+auto t0 = mul_submit(2, 3);
+auto t1 = mul_submit(4, 5);
+for (auto i = 0; i < 3; i++) mul_poll(t1);
+std::cout << mul_wait(t0) + mul_wait(t1) << std::endl;
+std::cout << mul(6, 7) << std::endl;
+"""
+    values = compile_and_run(lib_file, cxx_code, temp, func_defs, extra_headers=FAKE_OPEN_ARRAY).splitlines()
+    assert values == ["10", "26", "42"]
+    with open(stats_file) as f:
+        stats = json.load(f)
+    assert stats["add"]["calls"] == 10
+    assert stats["add"]["errors"] == 0
+    assert stats["report"]["calls"] == 1
+    for stage in ("args", "python", "result"):
+        assert sum(stats["add"][stage]["histogram"]) == 10
+    # each DPI entry point is counted on its own, and a batch is a single call
+    calls = {name: stats[name]["calls"] for name in stats if name.startswith("mul")}
+    assert calls == {"mul": 1, "mul_batch": 1, "mul_submit": 2, "mul_poll": 3, "mul_wait": 2}
+
+
+def test_stats_module_import(temp, monkeypatch):
+    import types
+
+    # the module is imported with the model code, before the first call is counted
+    @sv(return_type=DataType.Void, imports={"pysv_stats": types.ModuleType("pysv_stats")})
+    def report():
+        print(pysv_stats.read()["report"]["calls"], flush=True)
+
+    lib_file = compile_lib([report], cwd=temp, stats=True)
+    monkeypatch.setenv("PYSV_STATS_FILE", os.path.join(temp, "stats.json"))
+    cxx_code = """
+report();
+report();
+"""
+    values = compile_and_run(lib_file, cxx_code, temp, [report]).splitlines()
+    assert values == ["1", "2"]
+
+
+def test_trace(temp, monkeypatch):
+    @sv(b=DataType.Double)
+    def scale(a, b):
+        if a < 0:
+            raise ValueError(a)
+        return int(a * b)
+
+    @sv(batch=True)
+    def increment(a):
+        return a + 1
+
+    func_defs = [scale, increment]
+    lib_file = compile_lib(func_defs, cwd=temp, trace=True)
+    trace_file = os.path.join(temp, "trace.json")
+    monkeypatch.setenv("PYSV_TRACE_FILE", trace_file)
+    # only the latest events are kept
+    monkeypatch.setenv("PYSV_TRACE_EVENTS", "4")
+    cxx_code = """
+for (auto i = 0; i < 4; i++) {
+    pysv_set_sim_time(i * 10);
+    scale(i, 1.5);
+}
+try {
+    scale(-1, 0);
+} catch (...) {
+}
+int32_t a[] = {1, 2}, result[2];
+FakeArray a_array{a, 2}, result_array{result, 2};
+increment_batch(&a_array, &result_array);
+"""
+    compile_and_run(lib_file, cxx_code, temp, func_defs, extra_headers=FAKE_OPEN_ARRAY, trace=True)
+    with open(trace_file) as f:
+        trace = json.load(f)
+    events = [e for e in trace["traceEvents"] if e["ph"] == "X"]
+    assert [e["args"] for e in events] == [{"a": 2, "b": 1.5, "sim_time": 20},
+                                           {"a": 3, "b": 1.5, "sim_time": 30},
+                                           {"a": -1, "b": 0, "sim_time": 30, "error": True},
+                                           {"sim_time": 30}]
+    # batched calls are named after their own entry point
+    assert [e["name"] for e in events] == ["scale", "scale", "scale", "increment_batch"]
+    assert all(e["dur"] >= 0 for e in events)
+    assert events[0]["ts"] <= events[1]["ts"] <= events[2]["ts"] <= events[3]["ts"]
+    counters = [e["args"]["sim_time"] for e in trace["traceEvents"] if e["ph"] == "C"]
+    assert counters == [20, 30]
+
+
+def test_profile(temp, monkeypatch):
+    @sv()
+    def busy(n):
+        def step(i):
+            return i * i
+
+        total = 0
+        for i in range(n):
+            total += step(i)
+        return total % 1000
+
+    @sv(run_async=True)
+    def spin(n):
+        total = 0
+        for i in range(n):
+            total += i * i
+        return total % 1000
+
+    lib_file = compile_lib([busy], cwd=temp, profile=True)
+    cxx_code = """
+for (auto i = 0; i < 10; i++) busy(20000);
+"""
+    pstats_file = os.path.join(temp, "profile.pstats")
+    monkeypatch.setenv("PYSV_PROFILE", "cprofile")
+    monkeypatch.setenv("PYSV_PROFILE_FILE", pstats_file)
+    compile_and_run(lib_file, cxx_code, temp, [busy])
+    import pstats
+    stats = pstats.Stats(pstats_file).stats
+    calls = {func[2]: stat[1] for func, stat in stats.items()}
+    assert calls["busy"] == 10
+    assert calls["step"] == 200000
+
+    # the sampler runs on its own thread, which covers the workers of asynchronous functions as well
+    lib_file = compile_lib([busy, spin], cwd=temp, profile=True)
+    cxx_code = """
+for (auto i = 0; i < 10; i++) busy(200000);
+auto t = spin_submit(2000000);
+std::cout << spin_wait(t) << std::endl;
+"""
+    collapsed_file = os.path.join(temp, "profile.collapsed")
+    monkeypatch.setenv("PYSV_PROFILE", "sample")
+    monkeypatch.setenv("PYSV_PROFILE_FILE", collapsed_file)
+    monkeypatch.setenv("PYSV_PROFILE_INTERVAL", "100")
+    compile_and_run(lib_file, cxx_code, temp, [busy, spin])
+    with open(collapsed_file) as f:
+        samples = [line.rsplit(" ", 1) for line in f.read().splitlines()]
+    counts = {}
+    for stack, count in samples:
+        # module imports by the runtime are sampled as well
+        root = stack.split(";")[0].split(" ")[0]
+        counts[root] = counts.get(root, 0) + int(count)
+    assert counts["busy"] > sum(counts.values()) // 4
+    assert any(stack.startswith("busy (<string>:") and ";step (<string>:" in stack for stack, _ in samples)
+    assert any("spin (<string>:" in stack for stack, _ in samples)
+
+
+def test_record(temp, monkeypatch):
+    @sv()
+    def add(a, b):
+        if a < 0:
+            raise ValueError(a)
+        return a + b
+
+    @sv(s=DataType.String, return_type=DataType.String)
+    def echo(s):
+        return s * 2
+
+    lib_file = compile_lib([add, echo], cwd=temp, record=True)
+    record_file = os.path.join(temp, "calls.bin")
+    monkeypatch.setenv("PYSV_RECORD_FILE", record_file)
+    cxx_code = """
+std::cout << add(1, 2) << std::endl;
+std::cout << echo("ab") << std::endl;
+try {
+    add(-1, 0);
+} catch (...) {
+}
+"""
+    assert compile_and_run(lib_file, cxx_code, temp, [add, echo]).splitlines() == ["3", "abab"]
+    with open(record_file, "rb") as f:
+        data = f.read()
+    # function table
+    header = b"PYSVREC1" + struct.pack("<II", 2, 3) + b"add" + struct.pack("<I", 4) + b"echo"
+    assert data.startswith(header)
+    # the calls fit into one chunk
+    codec, raw_size, size = struct.unpack_from("<BII", data, len(header))
+    chunk = data[len(header) + 9:]
+    assert len(chunk) == size
+    if codec == 1:
+        chunk = zlib.decompress(chunk)
+    assert len(chunk) == raw_size
+
+    def value(tag, fmt, v):
+        return struct.pack("<B" + fmt, tag, v)
+
+    # function id, status, arguments and results
+    calls = [struct.pack("<BIBB", 1, 0, 0, 2) + value(1, "q", 1) + value(1, "q", 2) + b"\x01" + value(1, "q", 3),
+             struct.pack("<BIBB", 1, 1, 0, 1) + value(4, "I", 2) + b"ab" + b"\x01" + value(4, "I", 4) + b"abab",
+             struct.pack("<BIBB", 1, 0, 1, 2) + value(1, "q", -1) + value(1, "q", 0) + b"\x00",
+             b"\x02"]
+    assert chunk == b"".join(calls)
+
+
+def test_replay(temp, monkeypatch):
+    class Counter:
+        @sv()
+        def __init__(self, start):
+            self.value = start
+
+        @sv(return_type=DataType.Void)
+        def add(self, value):
+            self.value += value
+
+        @sv()
+        def get(self):
+            return self.value
+
+    @sv(return_type=Reference(q=DataType.Int, r=DataType.Int))
+    def div_mod(a, b):
+        return divmod(a, b)
+
+    @sv(a=DataType.IntArray, return_type=Reference(b=DataType.IntArray))
+    def scale_array(a, b):
+        for i in range(len(a)):
+            b[i] = a[i] * 2
+
+    @sv(return_type=Bits[128], a=Bits[128], b=Bits[128])
+    def add_wide(a, b):
+        return a + b
+
+    func_defs = [Counter, div_mod, scale_array, add_wide]
+    lib_file = compile_lib(func_defs, cwd=temp, record=True)
+    record_file = os.path.join(temp, "calls.bin")
+    monkeypatch.setenv("PYSV_RECORD_FILE", record_file)
+    cxx_code = """
+void *c1 = Counter_pysv_init(1);
+void *c2 = Counter_pysv_init(10);
+for (int i = 0; i < 100; i++) {
+    Counter_add(c1, i);
+    Counter_add(c2, 1);
+}
+std::cout << Counter_get(c1) << " " << Counter_get(c2) << std::endl;
+Counter_destroy(c1);
+int q, r;
+div_mod(7, 2, &q, &r);
+try {
+    div_mod(1, 0, &q, &r);
+} catch (...) {
+}
+int a[3] = {1, 2, 3}, b[3] = {-1, -1, -1};
+FakeArray a_array{a, 3}, b_array{b, 3};
+scale_array(&a_array, &b_array);
+svBitVecVal x[4] = {0xFFFFFFFF, 0xFFFFFFFF, 0, 0}, y[4] = {1, 0, 0, 0}, z[4];
+add_wide(x, y, z);
+std::cout << z[2] << std::endl;
+"""
+    values = compile_and_run(lib_file, cxx_code, temp, func_defs, extra_headers=FAKE_OPEN_ARRAY).splitlines()
+    assert values == ["4951 110", "1"]
+
+    from pysv.replay import replay, RecordReader
+    calls = [call for call in RecordReader(record_file)]
+    # 2 constructors, 200 adds, 2 gets, 1 destroy, 4 functions and the finalize
+    assert len(calls) == 210
+    assert calls[-1] is None
+    assert calls[-2].results == [1 << 64]
+    # only the shape of the output array is recorded, which is allocated with zeros
+    assert calls[-3].args[1].tolist() == [0, 0, 0]
+    assert calls[-3].results[0].tolist() == [2, 4, 6]
+
+    result = replay(record_file, func_defs)
+    assert result.calls == 209
+    assert not result.mismatches
+    # each counter is replayed in its own process
+    result = replay(record_file, func_defs, processes=2)
+    assert result.calls == 209
+    assert not result.mismatches
+
+    # same functions with bugs
+    @sv(return_type=Reference(q=DataType.Int, r=DataType.Int))
+    def div_mod(a, b):
+        return a // b, 0
+
+    @sv(a=DataType.IntArray, return_type=Reference(b=DataType.IntArray))
+    def scale_array(a, b):
+        pass
+
+    result = replay(record_file, [Counter, div_mod, scale_array, add_wide])
+    assert [(m.index, m.function) for m in result.mismatches] == [(205, "div_mod"), (207, "scale_array")]
+
+
+def test_replay_objects(temp, monkeypatch):
+    class Account:
+        @sv()
+        def __init__(self, balance):
+            self.balance = balance
+
+        @sv(other=DataType.Object, return_type=DataType.Void)
+        def transfer(self, other, amount):
+            self.balance -= amount
+            other.balance += amount
+
+        @sv()
+        def get(self):
+            return self.balance
+
+    @sv(return_type=Account)
+    def open_account(balance):
+        return Account(balance * 10)
+
+    @sv(account=Account)
+    def deposit(account, amount):
+        account.balance += amount
+        return account.balance
+
+    func_defs = [Account, open_account, deposit]
+    lib_file = compile_lib(func_defs, cwd=temp, record=True)
+    record_file = os.path.join(temp, "calls.bin")
+    monkeypatch.setenv("PYSV_RECORD_FILE", record_file)
+    # the class is defined by its first constructor call
+    cxx_code = """
+void *c = Account_pysv_init(5);
+void *a = open_account_(1);
+void *b = open_account_(2);
+for (int i = 0; i < 10; i++) {
+    deposit_(a, 1);
+    deposit_(b, 2);
+}
+Account_transfer(c, b, 5);
+std::cout << Account_get(a) << " " << Account_get(b) << " " << Account_get(c) << std::endl;
+"""
+    values = compile_and_run(lib_file, cxx_code, temp, func_defs).splitlines()
+    assert values == ["20 45 0"]
+
+    from pysv.replay import replay, group_objects, RecordReader
+    # the account passed to transfer is replayed together with the one it is called on
+    groups = group_objects(RecordReader(record_file))
+    assert len(groups) == 3 and len(set(groups.values())) == 2
+    for processes in (1, 3):
+        result = replay(record_file, func_defs, processes=processes)
+        assert result.calls == 27
+        assert not result.mismatches
+
+
+def test_cache(temp):
+    @sv(cache=2, a=DataType.UInt)
+    def decode(a):
+        print("miss", a, flush=True)
+        return a >> 4
+
+    lib_file = compile_lib([decode], cwd=temp)
+    cxx_code = """
+for (auto a: {0x10, 0x10, 0x20, 0x30, 0x20, 0x10}) {
+    std::cout << decode(a) << std::endl;
+}
+std::cout << decode_cache_hits() << " " << decode_cache_misses() << std::endl;
+decode_cache_clear();
+std::cout << decode(0x20) << std::endl;
+std::cout << decode_cache_hits() << " " << decode_cache_misses() << std::endl;
+"""
+    values = compile_and_run(lib_file, cxx_code, temp, [decode]).splitlines()
+    # 0x10 is the least recently used one when 0x30 is added
+    assert values == ["miss 16", "1", "1", "miss 32", "2", "miss 48", "3", "2", "miss 16", "1", "2 4",
+                      "miss 32", "2", "2 5"]
+
+    # hits don't go to the model server either
+    @sv(cache=16, a=DataType.UInt)
+    def remote_decode(a):
+        return a >> 4
+
+    lib_file = compile_lib([remote_decode], cwd=temp, runtime=Runtime.SharedMemory)
+    cxx_code = """
+for (auto a: {0x10, 0x20, 0x10, 0x10}) {
+    std::cout << remote_decode(a) << std::endl;
+}
+std::cout << remote_decode_cache_hits() << " " << remote_decode_cache_misses() << std::endl;
+pysv_finalize();
+"""
+    values = compile_and_run(lib_file, cxx_code, temp, [remote_decode]).splitlines()
+    assert values == ["1", "2", "1", "1", "2 2"]
+
+
+def test_table(temp):
+    @sv(table=Table(max_entries=1 << 9), a=DataType.Bit, b=DataType.Byte, return_type=DataType.LongInt)
+    def pick(a, b):
+        return b * 3 if a else -(1 << 63)
+
+    @sv(table=True, a=DataType.UShortInt, return_type=DataType.Float)
+    def scale(a):
+        return a / 4
+
+    lib_file = compile_lib([pick, scale], cwd=temp)
+    # the interpreter is never started, since all the functions are tables
+    cxx_code = """
+std::cout << pick(true, -2) << " " << pick(false, 5) << std::endl;
+std::cout << scale(65535) << " " << scale(2) << std::endl;
+auto is_initialized = reinterpret_cast<int (*)()>(dlsym(RTLD_DEFAULT, "Py_IsInitialized"));
+std::cout << is_initialized() << std::endl;
+"""
+    values = compile_and_run(lib_file, cxx_code, temp, [pick, scale],
+                             extra_headers="#include <dlfcn.h>").splitlines()
+    assert values == ["-6 -9223372036854775808", "16383.8 0.5", "0"]
+
+
+def test_lookup_observed(temp, monkeypatch):
+    @sv(cache=4, a=DataType.UInt)
+    def decode(a):
+        return a >> 4
+
+    @sv(table=True, a=DataType.UByte)
+    def square(a):
+        return a * a
+
+    func_defs = [decode, square]
+    lib_file = compile_lib(func_defs, cwd=temp, stats=True, record=True)
+    stats_file = os.path.join(temp, "stats.json")
+    record_file = os.path.join(temp, "calls.bin")
+    monkeypatch.setenv("PYSV_STATS_FILE", stats_file)
+    monkeypatch.setenv("PYSV_RECORD_FILE", record_file)
+    # the table lookup happens before the interpreter is started
+    cxx_code = """
+std::cout << square(12) << std::endl;
+for (auto a: {0x10, 0x10, 0x20, 0x10}) std::cout << decode(a) << std::endl;
+pysv_finalize();
+"""
+    values = compile_and_run(lib_file, cxx_code, temp, func_defs).splitlines()
+    assert values == ["144", "1", "1", "2", "1"]
+    with open(stats_file) as f:
+        stats = json.load(f)
+    # lookups are counted as calls, but don't run any stage
+    assert (stats["decode"]["calls"], stats["decode"]["cached"]) == (4, 2)
+    assert sum(stats["decode"]["python"]["histogram"]) == 2
+    assert (stats["square"]["calls"], stats["square"]["cached"]) == (1, 1)
+
+    from pysv.replay import replay
+    # every call is in the record, including the ones answered by the cache and the table
+    result = replay(record_file, func_defs)
+    assert result.calls == 5
+    assert not result.mismatches
+
+
+def test_const(temp):
+    from pysv.codegen import generate_sv_binding
+
+    @sv(const=True, return_type=DataType.UInt)
+    def depth():
+        return 1 << 10
+
+    @sv()
+    def add(a, b):
+        return a + b
+
+    lib_file = compile_lib([depth, add], cwd=temp)
+    # only the SystemVerilog package has the constant
+    cxx_code = """
+std::cout << add(1, 2) << std::endl;
+std::cout << (dlsym(RTLD_DEFAULT, "depth") == nullptr) << std::endl;
+"""
+    values = compile_and_run(lib_file, cxx_code, temp, [add], extra_headers="#include <dlfcn.h>").splitlines()
+    assert values == ["3", "1"]
+    assert "function int unsigned depth();\n  return 1024;\nendfunction\n" in generate_sv_binding([depth, add])
+
+
+def test_struct(temp):
+    packet = Struct("packet_t", addr=DataType.UInt, size=DataType.UShortInt, data=DataType.Byte)
+
+    @sv(return_type=packet, a=packet, b=packet[1])
+    def update_packet(a, b):
+        print(a["addr"], a["size"], a["data"], len(b), flush=True)
+        b["size"] += a["size"]
+        return a["addr"] + 1, a["size"], -a["data"]
+
+    lib_file = compile_lib([update_packet], cwd=temp)
+    cxx_code = """
+auto pack = [](uint32_t addr, uint16_t size, int8_t data, svBitVecVal *value) {
+    // same layout as the SystemVerilog packed struct
+    auto v = (static_cast<uint64_t>(addr) << 24) | (static_cast<uint64_t>(size) << 8) | static_cast<uint8_t>(data);
+    value[0] = static_cast<uint32_t>(v);
+    value[1] = static_cast<uint32_t>(v >> 32);
+};
+auto print = [](const svBitVecVal *value) {
+    auto v = value[0] | (static_cast<uint64_t>(value[1]) << 32);
+    std::cout << ((v >> 24) & 0xFFFFFFFF) << " " << ((v >> 8) & 0xFFFF) << " "
+              << static_cast<int>(static_cast<int8_t>(v)) << std::endl;
+};
+svBitVecVal a[2], b[4], result[2];
+pack(0x12345678, 3, -2, a);
+pack(1, 5, 0, b);
+pack(2, 7, 0, b + 2);
+FakeArray b_array{b, 2};
+update_packet(a, &b_array, result);
+print(result);
+print(b);
+print(b + 2);
+"""
+    values = compile_and_run(lib_file, cxx_code, temp, [update_packet], extra_headers=FAKE_OPEN_ARRAY).splitlines()
+    assert values == ["305419896 3 -2 2", "305419897 3 2", "1 8 0", "2 10 0"]
+
+
+def test_batch(temp):
+    @sv(batch=True)
+    def add_loop(a, b):
+        return a + b
+
+    @sv(return_type=Reference(lo=DataType.UByte, hi=DataType.UByte), value=DataType.UShortInt,
+        batch=Batch.Vector)
+    def split_vector(value):
+        return value & 0xFF, value >> 8
+
+    lib_file = compile_lib([add_loop, split_vector], cwd=temp)
+    cxx_code = """
+int32_t a[] = {1, 2, 3}, b[] = {10, 20, 30}, sum[3];
+FakeArray a_array{a, 3}, b_array{b, 3}, sum_array{sum, 3};
+add_loop_batch(&a_array, &b_array, &sum_array);
+std::cout << sum[0] << " " << sum[1] << " " << sum[2] << std::endl;
+uint16_t value[] = {0x1234, 0xABCD};
+uint8_t lo[2], hi[2];
+FakeArray value_array{value, 2}, lo_array{lo, 2}, hi_array{hi, 2};
+split_vector_batch(&value_array, &lo_array, &hi_array);
+std::cout << std::hex << +lo[0] << " " << +hi[0] << " " << +lo[1] << " " << +hi[1] << std::endl;
+// every array has to have the same number of elements
+FakeArray short_array{sum, 2};
+try {
+    add_loop_batch(&a_array, &b_array, &short_array);
+} catch (const std::runtime_error &ex) {
+    std::cout << ex.what() << std::endl;
+}
+"""
+    values = compile_and_run(lib_file, cxx_code, temp, [add_loop, split_vector],
+                             extra_headers=FAKE_OPEN_ARRAY).splitlines()
+    assert values == ["11 22 33", "34 12 cd ab", "Batch arrays have different sizes"]
+
+
+def test_async(temp):
+    @sv(run_async=Async(max_in_flight=2, workers=2))
+    def slow_add(a, b):
+        import time
+        # sleeping releases the GIL so the other worker can run at the same time
+        time.sleep(a / 100)
+        return a + b
+
+    lib_file = compile_lib([slow_add], cwd=temp)
+    code = """
+    auto t0 = slow_add_submit(5, 1);
+    auto t1 = slow_add_submit(0, 2);
+    // blocks until one of the calls finishes
+    auto t2 = slow_add_submit(0, 3);
+    // results are ready in submission order
+    std::cout << slow_add_wait(t1) << std::endl;
+    std::cout << slow_add_poll(t0) << std::endl;
+    std::cout << slow_add_wait(t2) << std::endl;
+    std::cout << slow_add_wait(t0) << std::endl;
+    // normal calls still work
+    std::cout << slow_add(0, 4) << std::endl;
+    try {
+        slow_add_poll(t0);
+    } catch (const std::runtime_error &ex) {
+        std::cout << ex.what();
+    }
+    """
+    outputs = compile_and_run(lib_file, code, temp, [slow_add])
+    outputs = outputs.splitlines()
+    assert outputs == ["2", "1", "3", "6", "4", "Invalid async ticket 1"]
+
+
+def test_shared_memory_runtime(temp):
+    class Counter:
+        @sv()
+        def __init__(self, start):
+            self.value = start
+
+        @sv(return_type=DataType.Void)
+        def add(self, value):
+            self.value += value
+
+        @sv()
+        def get(self):
+            return self.value
+
+    @sv(a=DataType.Double, b=DataType.UByte, return_type=DataType.Double)
+    def scale(a, b):
+        return a * b
+
+    @sv(name=DataType.String, return_type=DataType.String)
+    def greet(name):
+        return "hello " + name
+
+    @sv(return_type=Reference(q=DataType.Int, r=DataType.Int))
+    def div_mod(a, b):
+        return divmod(a, b)
+
+    @sv()
+    def model_pid():
+        import os
+        return os.getpid()
+
+    @sv(return_type=DataType.Void)
+    def fail(value):
+        raise ValueError(value)
+
+    func_defs = [Counter, scale, greet, div_mod, model_pid, fail]
+    lib_file = compile_lib(func_defs, cwd=temp, runtime=Runtime.SharedMemory)
+    cxx_code = """
+void *c = Counter_pysv_init(1);
+// calls without results are sent together with the next call
+for (int i = 0; i < 1000; i++) Counter_add(c, 1);
+std::cout << Counter_get(c) << std::endl;
+std::cout << pysv_live_objects("Counter") << std::endl;
+Counter_destroy(c);
+std::cout << pysv_live_objects("Counter") << std::endl;
+std::cout << scale(1.5, 255) << std::endl;
+std::cout << greet("sv") << std::endl;
+int q, r;
+div_mod(7, 2, &q, &r);
+std::cout << q << " " << r << std::endl;
+std::cout << (model_pid() != getpid()) << std::endl;
+try {
+    div_mod(1, 0, &q, &r);
+} catch (const std::runtime_error &ex) {
+    std::cout << (std::string(ex.what()).find("ZeroDivisionError") != std::string::npos) << std::endl;
+}
+// errors of posted calls are raised by the next call that waits for the model server
+fail(1);
+try {
+    greet("skipped");
+} catch (const std::runtime_error &ex) {
+    std::cout << (std::string(ex.what()).find("ValueError: 1") != std::string::npos) << std::endl;
+}
+std::cout << greet("after") << std::endl;
+pysv_finalize();
+// a new model server is started after finalize
+std::cout << greet("again") << std::endl;
+// or printed when the model server is stopped
+fail(2);
+std::cerr.rdbuf(std::cout.rdbuf());
+"""
+    values = compile_and_run(lib_file, cxx_code, temp, func_defs, extra_headers="#include <unistd.h>")
+    values = values.splitlines()
+    assert values[:11] == ["1001", "1", "0", "382.5", "hello sv", "3 1", "1", "1", "1", "hello after",
+                           "hello again"]
+    assert values[11] == "ERROR: Error in an earlier call without result:"
+    assert "ValueError: 2" in values[12:]
+    if shutil.which("ldd"):
+        # the library doesn't depend on python
+        assert "python" not in subprocess.check_output(["ldd", lib_file]).decode("utf-8")
+
+
+def test_socket_runtime(temp, monkeypatch):
+    class Accumulator:
+        @sv()
+        def __init__(self):
+            self.values = []
+
+        @sv(return_type=DataType.Void)
+        def push(self, value):
+            self.values.append(value)
+
+        @sv()
+        def total(self):
+            return sum(self.values)
+
+    @sv()
+    def model_pid():
+        import os
+        return os.getpid()
+
+    func_defs = [Accumulator, model_pid]
+    lib_file = compile_lib(func_defs, cwd=temp, runtime=Runtime.Socket)
+    cxx_code = """
+void *a = Accumulator_pysv_init();
+for (int i = 0; i < 100; i++) Accumulator_push(a, i);
+std::cout << Accumulator_total(a) << std::endl;
+std::cout << pysv_live_objects("Accumulator") << std::endl;
+std::cout << model_pid() << std::endl;
+"""
+    # without any address, the library starts a local model server
+    values = compile_and_run(lib_file, cxx_code, temp, func_defs).splitlines()
+    assert values[:2] == ["4950", "1"]
+
+    # model server started separately, which is how it runs on a different host
+    socket_path = os.path.join(temp, "server.sock")
+    model_file = os.path.join(temp, "libpysv_model.py")
+    server = subprocess.Popen([sys.executable, "-m", "pysv.server", "--model", model_file,
+                               "--listen", "unix:" + socket_path])
+    try:
+        for _ in range(1000):
+            if os.path.exists(socket_path):
+                break
+            time.sleep(0.01)
+        monkeypatch.setenv("PYSV_SERVER", "unix:" + socket_path)
+        values = compile_and_run(lib_file, cxx_code, temp, func_defs).splitlines()
+        assert values == ["4950", "1", str(server.pid)]
+        # objects from the previous simulation are gone
+        values = compile_and_run(lib_file, cxx_code, temp, func_defs).splitlines()
+        assert values == ["4950", "1", str(server.pid)]
+    finally:
+        server.kill()
+        server.wait()
+
+
 if __name__ == "__main__":
     test_buffer_int("temp")
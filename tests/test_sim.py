@@ -1,5 +1,5 @@
 import pysv.util
-from pysv import sv, compile_lib, DataType, generate_cxx_binding, generate_sv_binding, Reference, import_
+from pysv import sv, compile_lib, DataType, generate_cxx_binding, generate_sv_binding, Reference, import_, Batch
 from importlib.util import find_spec
 import pytest
 import os
@@ -212,6 +212,51 @@ def test_verilator_array(get_vector_filename, temp):
     assert out == "2\n42\n"
 
 
+@pytest.mark.skipif(not pysv.util.is_verilator_available(), reason="Verilator not available")
+def test_verilator_array_output(get_vector_filename, temp):
+    @sv(a=DataType.IntArray, return_type=Reference(b=DataType.IntArray))
+    def scale(a, b):
+        for i in range(len(a)):
+            b[i] = a[i] * 2
+
+    @sv(b=DataType.IntArray, return_type=Reference(b=DataType.IntArray))
+    def increment(b):
+        for i in range(len(b)):
+            b[i] += 1
+
+    lib_path = compile_lib([scale, increment], cwd=temp)
+    header_file = os.path.join(os.path.abspath(temp), "test_verilator_array_output.hh")
+    generate_cxx_binding([scale, increment], filename=header_file)
+    sv_pkg = os.path.join(os.path.abspath(temp), "pysv_pkg.sv")
+    generate_sv_binding([scale, increment], filename=sv_pkg)
+
+    sv_file = get_vector_filename("test_verilator_array_output.sv")
+    driver = get_vector_filename("test_verilator_array_output.cc")
+    tester = pysv.util.VerilatorTester(lib_path, sv_file, header_file, driver, cwd=temp)
+    out = tester.run().decode("ascii")
+    assert out == "1\n3\n5\n7\n"
+
+
+@pytest.mark.skipif(not pysv.util.is_verilator_available(), reason="Verilator not available")
+@pytest.mark.parametrize("mode", (Batch.Loop, Batch.Vector))
+def test_verilator_batch(get_vector_filename, temp, mode):
+    @sv(batch=mode)
+    def add(a, b):
+        return a + b
+
+    lib_path = compile_lib([add], cwd=temp)
+    header_file = os.path.join(os.path.abspath(temp), "test_verilator_batch.hh")
+    generate_cxx_binding([add], filename=header_file)
+    sv_pkg = os.path.join(os.path.abspath(temp), "pysv_pkg.sv")
+    generate_sv_binding([add], filename=sv_pkg)
+
+    sv_file = get_vector_filename("test_verilator_batch.sv")
+    driver = get_vector_filename("test_verilator_batch.cc")
+    tester = pysv.util.VerilatorTester(lib_path, sv_file, header_file, driver, cwd=temp)
+    out = tester.run().decode("ascii")
+    assert out == "0\n11\n22\n33\n"
+
+
 @pytest.mark.skipif(not pysv.util.is_verilator_available(), reason="Verilator not available")
 @pytest.mark.xfail(reason="cross python import not working yet")
 def test_exrpot_dpi(get_vector_filename, temp):
@@ -0,0 +1,13 @@
+#include "Vtest_verilator_array_output.h"
+#include "test_verilator_array_output.hh"
+#include <exception>
+#include <random>
+#include <iostream>
+
+int main () {
+    Vtest_verilator_array_output vtop;
+    vtop.eval();
+
+    // tear down the runtime
+    pysv_finalize();
+}
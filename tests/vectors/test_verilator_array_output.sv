@@ -0,0 +1,21 @@
+`include "pysv_pkg.sv"
+
+module test_verilator_array_output();
+
+import pysv::*;
+
+int a[3:0];
+int b[3:0];
+
+initial begin
+  for (int i = 0; i < 4; i++) begin
+    a[i] = i;
+  end
+  scale(a, b);
+  increment(b);
+  for (int i = 0; i < 4; i++) begin
+    $display("%0d", b[i]);
+  end
+end
+
+endmodule
@@ -0,0 +1,13 @@
+#include "Vtest_verilator_batch.h"
+#include "test_verilator_batch.hh"
+#include <exception>
+#include <random>
+#include <iostream>
+
+int main () {
+    Vtest_verilator_batch vtop;
+    vtop.eval();
+
+    // tear down the runtime
+    pysv_finalize();
+}
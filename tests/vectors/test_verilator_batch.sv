@@ -0,0 +1,22 @@
+`include "pysv_pkg.sv"
+
+module test_verilator_batch();
+
+import pysv::*;
+
+int a[4];
+int b[4];
+int result[4];
+
+initial begin
+  for (int i = 0; i < 4; i++) begin
+    a[i] = i;
+    b[i] = i * 10;
+  end
+  add_batch(a, b, result);
+  for (int i = 0; i < 4; i++) begin
+    $display("%0d", result[i]);
+  end
+end
+
+endmodule